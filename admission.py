@@ -0,0 +1,311 @@
+"""Contrôle d'admission des endpoints live : limites de concurrence, token buckets et voies prioritaires.
+
+Chaque vue décorée par ``admit(lane)`` passe par une voie :
+
+- ``critical`` : écritures des arbitres (score, événements, début et fin de
+  match). Jamais rejetées ni mises en file ; comptées seulement, et chaque
+  écriture invalide les snapshots du match concerné.
+- ``standard`` : autres endpoints coûteux. Token bucket par client et
+  nombre de requêtes simultanées borné ; au-delà, 429 ou 503 avec Retry-After.
+- ``spectator`` : lectures du public. Token buckets par client et par match,
+  concurrence bornée sans attente. Une requête refusée reçoit le dernier
+  snapshot de la réponse (en-tête ``X-Degraded: snapshot``) tant qu'il a
+  moins de ADMISSION_SNAPSHOT_MAX_AGE secondes ; un snapshot de moins de
+  ADMISSION_SNAPSHOT_FRESH_SECONDS est servi sans même exécuter la vue.
+
+Les snapshots plus vieux que ADMISSION_SNAPSHOT_MAX_AGE sont oubliés au fil
+des écritures. Le service ASGI (live_service.py) applique les mêmes voies à
+ses routes /live avec ses propres limites de concurrence.
+
+La concurrence spectateur est bornée par défaut à la moitié de DB_POOL_SIZE :
+un match très suivi ne peut plus prendre toutes les connexions du worker
+aux pages d'administration et aux arbitres. Les limites de concurrence et
+les snapshots sont propres à chaque processus ; les token buckets aussi, sauf
+si ADMISSION_REDIS_URL est défini (paquet ``redis`` requis) : ils sont alors
+partagés par tous les workers. Une panne Redis fait repasser sur les buckets
+locaux.
+
+    ADMISSION_CLIENT_RATE / ADMISSION_CLIENT_BURST    requêtes/s et rafale par client
+    ADMISSION_MATCH_RATE / ADMISSION_MATCH_BURST      lectures/s et rafale par match
+    ADMISSION_SPECTATOR_CONCURRENCY                   lectures simultanées par worker
+    ADMISSION_STANDARD_CONCURRENCY                    requêtes standard simultanées par worker
+"""
+import os
+import time
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from functools import wraps
+
+from flask import request, jsonify, make_response, Response
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+LANES = ('critical', 'standard', 'spectator')
+MAX_LOCAL_BUCKETS = 100_000
+STANDARD_QUEUE_TIMEOUT = 0.5
+
+Snapshot = namedtuple('Snapshot', ['body', 'status', 'content_type', 'etag', 'stored_at'])
+
+REDIS_TOKEN_BUCKET = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return allowed
+"""
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+class LocalBuckets:
+    """Token buckets of this process, keyed by client or match"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # clé -> [jetons, instant de la dernière recharge]
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key) or (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = [tokens - 1 if allowed else tokens, now]
+            if len(self._buckets) > MAX_LOCAL_BUCKETS:
+                self._prune()
+        return allowed
+
+    def _prune(self):
+        # Les buckets les moins récemment utilisés sont (presque) pleins : les oublier ne change rien
+        stale = sorted(self._buckets, key=lambda key: self._buckets[key][1])
+        for key in stale[:len(stale) // 2]:
+            del self._buckets[key]
+
+
+class ConcurrencyLimit:
+    """Bounded number of requests of a lane running at once in this process"""
+
+    def __init__(self, size):
+        self.size = size
+        self.in_flight = 0
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        acquired = self._semaphore.acquire(timeout=timeout) if timeout else self._semaphore.acquire(blocking=False)
+        if acquired:
+            with self._lock:
+                self.in_flight += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker, refilled atomically by a Lua script"""
+
+    def __init__(self, url, fallback):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+        self.fallback = fallback
+
+    def take(self, key, rate, burst):
+        try:
+            return bool(self.script(keys=[f'admission:{key}'], args=[rate, burst]))
+        except Exception as e:
+            logger.warning(f'Admission store unavailable, using local buckets: {e}')
+            return self.fallback.take(key, rate, burst)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.buckets = LocalBuckets()
+        self.client_rate = self.client_burst = self.match_rate = self.match_burst = None
+        self.limits = {}
+        self.snapshot_fresh = self.snapshot_max_age = 0.0
+        self._snapshots = defaultdict(dict)  # id du match -> {endpoint: Snapshot}
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.counters = {lane: defaultdict(int) for lane in LANES}
+        self.configure()
+
+    def configure(self, redis_url=None):
+        pool_size = int(os.environ.get('DB_POOL_SIZE') or 5)
+        self.client_rate = _env_float('ADMISSION_CLIENT_RATE', 5.0)
+        self.client_burst = _env_float('ADMISSION_CLIENT_BURST', 20.0)
+        self.match_rate = _env_float('ADMISSION_MATCH_RATE', 200.0)
+        self.match_burst = _env_float('ADMISSION_MATCH_BURST', 400.0)
+        self.snapshot_fresh = _env_float('ADMISSION_SNAPSHOT_FRESH_SECONDS', 1.0)
+        self.snapshot_max_age = _env_float('ADMISSION_SNAPSHOT_MAX_AGE', 30.0)
+        self.limits = {
+            'spectator': ConcurrencyLimit(
+                int(os.environ.get('ADMISSION_SPECTATOR_CONCURRENCY') or max(1, pool_size // 2))),
+            'standard': ConcurrencyLimit(int(os.environ.get('ADMISSION_STANDARD_CONCURRENCY') or pool_size)),
+        }
+        local = self.buckets if isinstance(self.buckets, LocalBuckets) else self.buckets.fallback
+        self.buckets = RedisBuckets(redis_url, local) if redis_url else local
+
+    def count(self, lane, outcome):
+        with self._lock:
+            self.counters[lane][outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = {lane: dict(values) for lane, values in self.counters.items()}
+        return {
+            'store': 'redis' if isinstance(self.buckets, RedisBuckets) else 'local',
+            'lanes': counters,
+            'in_flight': {lane: f'{limit.in_flight}/{limit.size}' for lane, limit in self.limits.items()},
+            'snapshots': sum(len(entries) for entries in self._snapshots.values()),
+        }
+
+    # Snapshots des réponses spectateur
+    def snapshot(self, match_id, endpoint, max_age):
+        entry = self._snapshots.get(match_id, {}).get(endpoint)
+        if entry and time.monotonic() - entry.stored_at <= max_age:
+            return entry
+        return None
+
+    def remember(self, match_id, endpoint, response):
+        if response.status_code != 200 or response.direct_passthrough:
+            return
+        self.store(match_id, endpoint, response.get_data(), response.status_code, response.content_type,
+                   response.headers.get('ETag'))
+
+    def store(self, match_id, endpoint, body, status, content_type, etag=None):
+        now = time.monotonic()
+        with self._lock:
+            self._snapshots[match_id][endpoint] = Snapshot(body, status, content_type, etag, now)
+            if now - self._pruned_at > self.snapshot_max_age:
+                self._prune_snapshots(now)
+
+    def _prune_snapshots(self, now):
+        # Au-delà de snapshot_max_age un snapshot n'est plus jamais servi : les matchs terminés disparaissent
+        self._pruned_at = now
+        for match_id, entries in list(self._snapshots.items()):
+            for endpoint, entry in list(entries.items()):
+                if now - entry.stored_at > self.snapshot_max_age:
+                    del entries[endpoint]
+            if not entries:
+                del self._snapshots[match_id]
+
+    def invalidate(self, match_id):
+        with self._lock:
+            self._snapshots.pop(match_id, None)
+
+
+controller = AdmissionController()
+
+
+def client_key():
+    """Logged-in user, else the client address (X-Forwarded-For resolved by ProxyFix)"""
+    if current_user.is_authenticated:
+        return f'user:{current_user.get_id()}'
+    return f'ip:{request.remote_addr}'
+
+
+def _snapshot_response(entry, degraded):
+    response = Response(entry.body, status=entry.status, content_type=entry.content_type)
+    if entry.etag:
+        response.headers['ETag'] = entry.etag
+    response.headers['Age'] = str(int(time.monotonic() - entry.stored_at))
+    if degraded:
+        response.headers['X-Degraded'] = 'snapshot'
+    return response
+
+
+def _rejected(lane, status, error, retry_after=1):
+    controller.count(lane, 'rejected')
+    response = jsonify({'error': error, 'lane': lane})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _spectator(view, match_id, args, kwargs):
+    endpoint = request.endpoint
+    fresh = controller.snapshot(match_id, endpoint, controller.snapshot_fresh)
+    if fresh:
+        controller.count('spectator', 'cached')
+        return _snapshot_response(fresh, degraded=False)
+
+    admitted = controller.buckets.take(client_key(), controller.client_rate, controller.client_burst) and (
+        match_id is None or controller.buckets.take(f'match:{match_id}', controller.match_rate, controller.match_burst))
+    limit = controller.limits['spectator']
+    if admitted and limit.acquire():
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            limit.release()
+        controller.remember(match_id, endpoint, response)
+        controller.count('spectator', 'admitted')
+        return response
+
+    # Délestage : dernier snapshot, même un peu ancien, plutôt qu'une erreur
+    stale = controller.snapshot(match_id, endpoint, controller.snapshot_max_age)
+    if stale:
+        controller.count('spectator', 'degraded')
+        return _snapshot_response(stale, degraded=True)
+    if not admitted:
+        return _rejected('spectator', 429, 'Too many requests')
+    return _rejected('spectator', 503, 'Live data temporarily unavailable')
+
+
+def _standard(view, args, kwargs):
+    if not controller.buckets.take(client_key(), controller.client_rate, controller.client_burst):
+        return _rejected('standard', 429, 'Too many requests')
+    limit = controller.limits['standard']
+    if not limit.acquire(timeout=STANDARD_QUEUE_TIMEOUT):
+        return _rejected('standard', 503, 'Server busy')
+    try:
+        response = view(*args, **kwargs)
+    finally:
+        limit.release()
+    controller.count('standard', 'admitted')
+    return response
+
+
+def admit(lane, match_arg='id'):
+    """Route a view through an admission lane; `match_arg` names the view argument holding the match id"""
+    if lane not in LANES:
+        raise ValueError(f'Unknown admission lane {lane!r}')
+
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            match_id = kwargs.get(match_arg)
+            if lane == 'spectator':
+                return _spectator(view, match_id, args, kwargs)
+            if lane == 'standard':
+                return _standard(view, args, kwargs)
+            # Voie critique : jamais délestée ; l'écriture rend les snapshots du match périmés
+            response = make_response(view(*args, **kwargs))
+            if match_id is not None and response.status_code < 400:
+                controller.invalidate(match_id)
+            controller.count('critical', 'admitted')
+            return response
+        return decorated_function
+    return decorator
+
+
+def init_app(app):
+    controller.configure(os.environ.get('ADMISSION_REDIS_URL') or None)
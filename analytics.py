@@ -0,0 +1,191 @@
+"""Statistiques de saison calculées en colonnes (NumPy).
+
+Les performances d'un tournoi sont chargées en une seule requête dans des
+tableaux, puis toutes les métriques (stats par 90 minutes, forme récente,
+percentiles par poste, agrégats par équipe) sont calculées de façon
+vectorisée, sans boucle Python par joueur.
+"""
+import numpy as np
+from sqlalchemy import select
+
+from extensions import db
+from models import Player, Match, PlayerMatchPerformance
+from tenancy import lookup, use_tenant
+
+POSITIONS = ('goalkeeper', 'defender', 'midfielder', 'forward')
+COUNTING_STATS = ('goals', 'assists', 'shots', 'shots_on_target', 'passes', 'passes_completed',
+                  'tackles', 'interceptions', 'saves', 'yellow_cards', 'red_cards')
+PER90_STATS = ('goals', 'assists', 'shots', 'shots_on_target', 'tackles', 'interceptions', 'saves')
+# En dessous, un joueur n'a ni classement ni percentile : 2 buts en 20 minutes ne font pas un attaquant d'élite
+MIN_MINUTES = 270
+
+
+def _performance_query(tournament_id):
+    # Tables du tenant seulement : équipe et poste des joueurs sont lus à part (voir performance_rows)
+    return select(
+        PlayerMatchPerformance.player_id, PlayerMatchPerformance.match_id,
+        PlayerMatchPerformance.minutes_played, PlayerMatchPerformance.rating,
+        *[getattr(PlayerMatchPerformance, name) for name in COUNTING_STATS]
+    ).join(Match, Match.id == PlayerMatchPerformance.match_id)\
+     .where(Match.tournament_id == tournament_id,
+            Match.status == 'completed',
+            PlayerMatchPerformance.minutes_played > 0)\
+     .order_by(PlayerMatchPerformance.player_id, Match.match_date, Match.id)
+
+
+def performance_rows(tournament_id):
+    """(player_id, team_id, position, match_id, minutes, rating, *COUNTING_STATS) of a tournament's performances"""
+    with use_tenant(tournament_id):
+        rows = db.session.execute(_performance_query(tournament_id)).all()
+    players = lookup(Player.id, (row.player_id for row in rows), Player.team_id, Player.position)
+    return [
+        (row.player_id, players[row.player_id].team_id, players[row.player_id].position, *row[1:])
+        for row in rows if row.player_id in players
+    ]
+
+
+class SeasonAnalytics:
+    """Columnar view of one tournament's player-match performances"""
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) if rows else [()] * (6 + len(COUNTING_STATS))
+        player_ids, team_ids, positions, match_ids, minutes, ratings = columns[:6]
+
+        # Lignes triées par joueur puis par date : chaque joueur forme un bloc contigu
+        self.player_ids, self.player_index = np.unique(np.asarray(player_ids, dtype=np.int64), return_inverse=True)
+        self.team_ids, self.team_index = np.unique(np.asarray(team_ids, dtype=np.int64), return_inverse=True)
+        self.match_ids = np.asarray(match_ids, dtype=np.int64)
+        self.minutes = np.asarray(minutes, dtype=np.float64)
+        self.ratings = np.asarray([r or 0.0 for r in ratings], dtype=np.float64)
+        self.stats = {
+            name: np.asarray([v or 0 for v in values], dtype=np.float64)
+            for name, values in zip(COUNTING_STATS, columns[6:])
+        }
+
+        n_players = len(self.player_ids)
+        self.n_rows = len(self.match_ids)
+        self.player_team = np.zeros(n_players, dtype=np.int64)
+        self.player_team[self.player_index] = self.team_ids[self.team_index]
+        position_codes = np.array([
+            POSITIONS.index(p.lower()) if p and p.lower() in POSITIONS else -1 for p in positions
+        ], dtype=np.int64)
+        self.player_position = np.full(n_players, -1, dtype=np.int64)
+        self.player_position[self.player_index] = position_codes
+
+        # Début de bloc et rang de chaque ligne dans le bloc de son joueur
+        self.appearances = np.bincount(self.player_index, minlength=n_players)
+        self.block_start = np.concatenate(([0], np.cumsum(self.appearances)[:-1])) if n_players else np.zeros(0, np.int64)
+        self.row_rank = np.arange(self.n_rows) - self.block_start[self.player_index]
+
+    @classmethod
+    def for_tournament(cls, tournament_id):
+        return cls(performance_rows(tournament_id))
+
+    def _per_player(self, values):
+        # bincount rend des entiers quand il n'y a aucune ligne, même avec des poids
+        return np.bincount(self.player_index, weights=values, minlength=len(self.player_ids)).astype(np.float64)
+
+    def totals(self):
+        totals = {name: self._per_player(values) for name, values in self.stats.items()}
+        totals['minutes_played'] = self._per_player(self.minutes)
+        totals['matches_played'] = self.appearances.astype(np.float64)
+        totals['average_rating'] = np.divide(self._per_player(self.ratings), self.appearances,
+                                             out=np.zeros(len(self.player_ids)), where=self.appearances > 0)
+        totals['pass_accuracy'] = np.divide(100.0 * totals['passes_completed'], totals['passes'],
+                                            out=np.zeros(len(self.player_ids)), where=totals['passes'] > 0)
+        return totals
+
+    def per90(self, totals=None):
+        totals = totals or self.totals()
+        minutes = totals['minutes_played']
+        return {
+            f'{name}_per90': np.divide(90.0 * totals[name], minutes, out=np.zeros_like(minutes), where=minutes > 0)
+            for name in PER90_STATS
+        }
+
+    def rolling_form(self, window=5):
+        """Average rating over each player's last `window` matches, per row (trend) and per player (current)"""
+        cumulative = np.concatenate(([0.0], np.cumsum(self.ratings)))
+        row = np.arange(self.n_rows)
+        lower = row + 1 - np.minimum(self.row_rank + 1, window)
+        series = (cumulative[row + 1] - cumulative[lower]) / (row + 1 - lower) if self.n_rows else np.zeros(0)
+
+        last_row = self.block_start + self.appearances - 1
+        current = series[last_row] if self.n_rows else np.zeros(0)
+        return series, current
+
+    def percentile_ranks(self, values, min_minutes=MIN_MINUTES):
+        """Percentile (0-100) of each player's value among players of the same position (ties share their
+        average rank), NaN below min_minutes"""
+        minutes = self._per_player(self.minutes)
+        ranks = np.full(len(values), np.nan)
+        for code in range(len(POSITIONS)):
+            members = np.flatnonzero((self.player_position == code) & (minutes >= min_minutes))
+            if len(members) == 0:
+                continue
+            # Rang moyen des ex aequo : quatre défenseurs à 0 but ont le même percentile
+            group = values[members]
+            ordered = np.sort(group)
+            order = (np.searchsorted(ordered, group, side='left')
+                     + np.searchsorted(ordered, group, side='right') - 1) / 2.0
+            ranks[members] = 100.0 * order / max(len(members) - 1, 1)
+        return ranks
+
+    def team_aggregates(self):
+        n_teams = len(self.team_ids)
+        aggregates = {
+            name: np.bincount(self.team_index, weights=values, minlength=n_teams).astype(np.float64)
+            for name, values in self.stats.items()
+        }
+        aggregates['minutes_played'] = np.bincount(self.team_index, weights=self.minutes,
+                                                   minlength=n_teams).astype(np.float64)
+        aggregates['pass_accuracy'] = np.divide(100.0 * aggregates['passes_completed'], aggregates['passes'],
+                                                out=np.zeros(n_teams), where=aggregates['passes'] > 0)
+        return {
+            int(team_id): {name: round(float(values[i]), 2) for name, values in aggregates.items()}
+            for i, team_id in enumerate(self.team_ids)
+        }
+
+    def player_summary(self, player_id, window=5):
+        """Everything the player detail page needs, or None if the player has not played"""
+        index = np.searchsorted(self.player_ids, player_id)
+        if index >= len(self.player_ids) or self.player_ids[index] != player_id:
+            return None
+        return self._summaries(window, [index])[player_id]
+
+    def player_summaries(self, window=5):
+        """player_summary for every player, computing each metric only once"""
+        return self._summaries(window, range(len(self.player_ids)))
+
+    def _summaries(self, window, indices):
+        totals = self.totals()
+        per90 = self.per90(totals)
+        series, current = self.rolling_form(window)
+        percentiles = {name: self.percentile_ranks(values) for name, values in per90.items()}
+        summaries = {}
+        for index in indices:
+            start, count = self.block_start[index], self.appearances[index]
+            summaries[int(self.player_ids[index])] = {
+                'totals': {name: round(float(values[index]), 2) for name, values in totals.items()},
+                'per90': {name: round(float(values[index]), 2) for name, values in per90.items()},
+                'form': round(float(current[index]), 2),
+                'form_trend': [
+                    {'match_id': int(m), 'rating': round(float(r), 2), 'form': round(float(f), 2)}
+                    for m, r, f in zip(self.match_ids[start:start + count], self.ratings[start:start + count],
+                                       series[start:start + count])
+                ],
+                # NaN (poste inconnu ou trop peu de minutes) -> None pour rester sérialisable en JSON
+                'percentiles': {name: None if np.isnan(values[index]) else round(float(values[index]), 1)
+                                for name, values in percentiles.items()},
+            }
+        return summaries
+
+    def leaders(self, metric, limit=10, min_minutes=MIN_MINUTES):
+        """(player_id, value) pairs sorted by a totals or per-90 metric"""
+        totals = self.totals()
+        values = totals.get(metric)
+        if values is None:
+            values = self.per90(totals)[metric]
+        eligible = np.flatnonzero(totals['minutes_played'] >= min_minutes)
+        top = eligible[np.argsort(-values[eligible], kind='stable')[:limit]]
+        return [(int(self.player_ids[i]), round(float(values[i]), 2)) for i in top]
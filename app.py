@@ -5,6 +5,22 @@ from flask import Flask, flash, redirect, url_for, request, render_template
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.middleware.proxy_fix import ProxyFix
 from extensions import db
+from db_pool import engine_options_from_env, install_pool_metrics
+import jobs
+import export
+import event_store
+import tenancy
+import archive
+import concurrency
+import search
+import live_state
+import admission
+import readmodel
+import feeds
+import tracing
+import ratings
+import outbox
+import tiebreakers
 from models import User, Admin, Coach
 from decorators import admin_required, coach_required
 from routes.auth import auth_bp
@@ -19,18 +35,45 @@ logging.basicConfig(level=logging.DEBUG)
 # create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# x_for : adresse réelle du client, utilisée par les token buckets de admission.py
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
 # configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///football_tournament.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Pool sizing is driven by DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+# DB_POOL_RECYCLE, DB_POOL_PRE_PING (always/idle/never) and DB_STATEMENT_TIMEOUT_MS
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options_from_env(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Hot queries return Row tuples with only the displayed columns instead of ORM entities (see queries.py)
+app.config["HOT_QUERY_ROWS"] = os.environ.get("HOT_QUERY_ROWS", "").lower() in ("1", "true", "yes")
+# Live match state is checkpointed every LIVE_CHECKPOINT_SECONDS (default 5), see live_state.py
+# Extra databases holding the match tables of some tournaments, see tenancy.py
+app.config["SQLALCHEMY_BINDS"] = tenancy.binds_from_env()
+
+# configure player photo storage
+app.config["MEDIA_ROOT"] = os.environ.get("MEDIA_ROOT", os.path.join(app.instance_path, "media"))
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_BYTES", 8 * 1024 * 1024))
+# e.g. "/protected-media" when nginx serves MEDIA_ROOT through an internal location
+app.config["MEDIA_ACCEL_REDIRECT_PREFIX"] = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX")
+# Shared read models of tournaments (see readmodel.py), ideally on tmpfs
+app.config["READMODEL_DIR"] = os.environ.get("READMODEL_DIR", os.path.join(app.instance_path, "readmodel"))
+# Precomputed iCal/JSON fixture feeds, rebuilt with the read models (see feeds.py)
+app.config["FEEDS_DIR"] = os.environ.get("FEEDS_DIR", os.path.join(app.instance_path, "feeds"))
+app.config["USE_X_SENDFILE"] = os.environ.get("MEDIA_X_SENDFILE", "").lower() in ("1", "true", "yes")
 
 # initialize extensions
 db.init_app(app)
+# Request spans, off unless TRACE_EXPORTER is file or otlp (see tracing.py)
+tracing.init_app(app)
+tenancy.init_app(app)
+concurrency.init_app(app)
+live_state.init_app(app)
+# Live endpoint rate limits and load shedding (ADMISSION_* variables, optional ADMISSION_REDIS_URL)
+admission.init_app(app)
+readmodel.init_app(app)
+feeds.init_app(app)
+# Match notifications for club webhooks, see outbox.py (OUTBOX_DISPATCHER=thread to deliver in-process)
+outbox.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
@@ -38,6 +81,7 @@ login_manager.login_message = 'Veuillez vous connecter pour accéder à cette pa
 login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
+@tracing.traced('auth.load_user')
 def load_user(user_id):
     return User.query.get(int(user_id))
 
@@ -68,6 +112,15 @@ def logout():
     logout_user()
     return redirect(url_for('main.index'))
 
+jobs.register_cli(app)
+export.register_cli(app)
+event_store.register_cli(app)
+archive.register_cli(app)
+search.register_cli(app)
+ratings.register_cli(app)
+outbox.register_cli(app)
+tiebreakers.register_cli(app)
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(admin_bp, url_prefix='/admin')
@@ -79,6 +132,8 @@ with app.app_context():
     # Import models here to ensure they are registered with SQLAlchemy
     from models import *  # noqa: F401
     db.create_all()
+    install_pool_metrics(db.engine)
+    search.ensure_search_index()
     
     # Créer un admin par défaut si aucun n'existe
     if not Admin.query.first():
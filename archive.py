@@ -0,0 +1,127 @@
+"""Archivage des tournois terminés.
+
+Les matchs, événements, statistiques et performances d'un tournoi terminé
+sont déplacés des tables "chaudes" (interrogées par le live et les
+classements) vers les tables archived_* de même structure, dans une seule
+transaction. Juste avant, un TournamentSnapshot fige le classement final,
+les agrégats par équipe, le résumé de chaque joueur et les meilleurs
+joueurs : les pages d'historique d'un tournoi archivé lisent ce snapshot au
+lieu de recalculer quoi que ce soit. Un tournoi archivé est en lecture seule.
+
+    flask archive-tournaments [--tournament-id ID]
+"""
+from collections import namedtuple
+
+import click
+from sqlalchemy import select, insert, delete
+
+from extensions import db
+from models import (Tournament, Match, MatchEvent, MatchStats, PlayerMatchPerformance, ArchivedMatch,
+                    ArchivedMatchEvent, ArchivedMatchStats, ArchivedPlayerMatchPerformance, TournamentSnapshot,
+                    LiveCheckpoint)
+from tenancy import use_tenant
+
+ARCHIVED = 'archived'
+LEADER_METRICS = ('goals_per90', 'assists_per90', 'average_rating')
+
+MatchTables = namedtuple('MatchTables', ['match', 'event', 'stats', 'performance'])
+HOT = MatchTables(Match, MatchEvent, MatchStats, PlayerMatchPerformance)
+COLD = MatchTables(ArchivedMatch, ArchivedMatchEvent, ArchivedMatchStats, ArchivedPlayerMatchPerformance)
+
+
+def is_archived(tournament_id):
+    return db.session.scalar(select(Tournament.status).where(Tournament.id == tournament_id)) == ARCHIVED
+
+
+def sources(tournament_id):
+    """Hot or archived models holding the matches of a tournament"""
+    return COLD if is_archived(tournament_id) else HOT
+
+
+def archivable(tournament):
+    """Completed tournaments, or tournaments whose matches have all been played"""
+    if tournament.status == 'completed':
+        return True
+    if tournament.status == ARCHIVED:
+        return False
+    with use_tenant(tournament.id):
+        statuses = set(db.session.scalars(
+            select(Match.status).where(Match.tournament_id == tournament.id).distinct()
+        ))
+    return statuses == {'completed'}
+
+
+def build_snapshot(tournament):
+    """Final figures of a tournament, read from the hot tables"""
+    from analytics import SeasonAnalytics
+    from tiebreakers import for_tournament
+
+    season = SeasonAnalytics.for_tournament(tournament.id)
+    return TournamentSnapshot(
+        tournament_id=tournament.id,
+        standings=for_tournament(tournament).standings(),
+        team_aggregates={str(team_id): values for team_id, values in season.team_aggregates().items()},
+        players={str(player_id): summary for player_id, summary in season.player_summaries().items()},
+        leaders={metric: season.leaders(metric) for metric in LEADER_METRICS},
+    )
+
+
+def _move(hot, cold, where):
+    """INSERT ... SELECT into the archive table, then DELETE from the hot one"""
+    columns = [column.name for column in hot.__table__.columns]
+    moved = db.session.execute(
+        insert(cold.__table__).from_select(columns, select(*hot.__table__.columns).where(where))
+    ).rowcount
+    db.session.execute(delete(hot.__table__).where(where))
+    return moved
+
+
+def archive_tournament(tournament_id):
+    """Snapshot a completed tournament and move its match rows to the archive tables"""
+    tournament = db.session.get(Tournament, tournament_id)
+    if tournament is None:
+        raise ValueError(f'Tournament {tournament_id} not found')
+    if tournament.status == ARCHIVED:
+        return tournament.snapshot
+    if not archivable(tournament):
+        raise ValueError(f'Tournament {tournament_id} is not completed')
+
+    with use_tenant(tournament_id):
+        snapshot = build_snapshot(tournament)
+        match_ids = select(Match.id).where(Match.tournament_id == tournament_id)
+        db.session.execute(delete(LiveCheckpoint.__table__).where(LiveCheckpoint.match_id.in_(match_ids)))
+        snapshot.event_count = _move(MatchEvent, ArchivedMatchEvent, MatchEvent.match_id.in_(match_ids))
+        _move(MatchStats, ArchivedMatchStats, MatchStats.match_id.in_(match_ids))
+        snapshot.performance_count = _move(PlayerMatchPerformance, ArchivedPlayerMatchPerformance,
+                                           PlayerMatchPerformance.match_id.in_(match_ids))
+        snapshot.match_count = _move(Match, ArchivedMatch, Match.tournament_id == tournament_id)
+
+        tournament.status = ARCHIVED
+        db.session.add(snapshot)
+        db.session.commit()
+    # Les Match déjà chargés dans la session n'existent plus
+    db.session.expire_all()
+    return snapshot
+
+
+def archive_pending():
+    """Archive every completed tournament; returns the archived ids"""
+    archived = []
+    for tournament in Tournament.query.filter(Tournament.status != ARCHIVED).order_by(Tournament.id).all():
+        if archivable(tournament):
+            archive_tournament(tournament.id)
+            archived.append(tournament.id)
+    return archived
+
+
+def register_cli(app):
+    @app.cli.command('archive-tournaments')
+    @click.option('--tournament-id', type=int, default=None, help='Archive only this tournament.')
+    def archive_tournaments_command(tournament_id):
+        """Move completed tournaments to the archive tables."""
+        if tournament_id is not None:
+            snapshot = archive_tournament(tournament_id)
+            print(f'Tournament {tournament_id} archived ({snapshot.match_count} matches)')
+            return
+        archived = archive_pending()
+        print(f'{len(archived)} tournament(s) archived: {", ".join(map(str, archived)) or "-"}')
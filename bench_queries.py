@@ -0,0 +1,164 @@
+"""Mesure du coût des requêtes chaudes : ORM classique vs queries.py.
+
+Crée une base SQLite temporaire avec un tournoi fictif puis mesure, pour
+chaque requête de queries.REGISTRY :
+
+- build   : construction de l'instruction et de sa clé de cache, select()
+            classique contre queries.py (lambda statement pour live_events)
+- compile : compilation SQL de l'instruction sans cache (ce que le cache de
+            compilation évite)
+- les appels complets : ancienne requête Query (avec les accès aux relations
+  qu'un template ferait), queries.py renvoyant des entités, puis des Row
+
+    python bench_queries.py [--iterations 2000] [--database sqlite:///bench.db]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import select
+
+from extensions import db
+from models import Tournament, Team, Player, Match, MatchEvent, PlayerStats
+import queries
+
+
+def _seed(teams=20, players_per_team=20, events_per_match=15):
+    tournament = Tournament(name='Bench', start_date=date.today())
+    db.session.add(tournament)
+    db.session.flush()
+    team_rows = [Team(name=f'Team {i}', tournament_id=tournament.id) for i in range(teams)]
+    db.session.add_all(team_rows)
+    db.session.flush()
+    for team in team_rows:
+        for number in range(players_per_team):
+            player = Player(name=f'{team.name} #{number}', team_id=team.id, jersey_number=number)
+            db.session.add(player)
+            db.session.flush()
+            db.session.add(PlayerStats(player_id=player.id, goals=(player.id * 7) % 13,
+                                       assists=(player.id * 5) % 11, yellow_cards=player.id % 4))
+    for day, (home, away) in enumerate(zip(team_rows, team_rows[1:] + team_rows[:1])):
+        match = Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id,
+                      match_date=datetime(2024, 1, 1) + timedelta(days=day), status='completed',
+                      home_score=day % 4, away_score=day % 3)
+        db.session.add(match)
+        db.session.flush()
+        for minute in range(events_per_match):
+            db.session.add(MatchEvent(match_id=match.id, minute=minute * 6, event_type='goal', team_id=home.id))
+    db.session.commit()
+
+
+def _legacy_recent():
+    # Le template affiche les noms des équipes : deux chargements paresseux par match
+    return [(m.home_team.name, m.away_team.name)
+            for m in Match.query.filter_by(status='completed').order_by(Match.match_date.desc()).limit(5).all()]
+
+
+def _legacy_leaderboard():
+    return db.session.query(Player, PlayerStats)\
+                     .join(PlayerStats, Player.id == PlayerStats.player_id)\
+                     .order_by(PlayerStats.goals.desc())\
+                     .limit(10).all()
+
+
+def _legacy_live_events():
+    return [event.to_dict() for event in MatchEvent.query.filter_by(match_id=1)
+            .order_by(MatchEvent.timestamp.desc(), MatchEvent.id.desc()).limit(10).all()]
+
+
+# Instructions select() équivalentes aux anciennes requêtes, pour les mesures build/compile
+LEGACY_STATEMENTS = {
+    'recent_matches': lambda: select(Match).where(Match.status == 'completed')
+                                           .order_by(Match.match_date.desc()).limit(5),
+    'leaderboard': lambda: select(Player, PlayerStats).join(PlayerStats, Player.id == PlayerStats.player_id)
+                                                      .order_by(PlayerStats.goals.desc()).limit(10),
+    'live_events': lambda: select(MatchEvent).where(MatchEvent.match_id == 1)
+                                             .order_by(MatchEvent.timestamp.desc(), MatchEvent.id.desc())
+                                             .limit(10),
+}
+
+REGISTRY_ARGS = {
+    'recent_matches': (5,),
+    'leaderboard': ('goals',),
+    'live_events': (1,),
+}
+
+CALLS = {
+    'recent_matches': {
+        'legacy': _legacy_recent,
+        'queries': lambda: [(m.home_team.name, m.away_team.name) for m in queries.recent_matches(5)],
+        'queries_rows': lambda: queries.recent_matches(5, rows=True),
+    },
+    'leaderboard': {
+        'legacy': _legacy_leaderboard,
+        'queries': lambda: queries.leaderboard('goals'),
+        'queries_rows': lambda: queries.leaderboard('goals', rows=True),
+    },
+    'live_events': {
+        'legacy': _legacy_live_events,
+        'queries_rows': lambda: queries.live_events(1),
+    },
+}
+
+
+def _time(fn, iterations, reset=False):
+    fn()  # échauffement : remplit le cache de compilation
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+        if reset:
+            db.session.expunge_all()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations):
+    dialect = db.engine.dialect
+    results = []
+    for name, builder in queries.REGISTRY.items():
+        args = REGISTRY_ARGS[name]
+        timings = {
+            'build_legacy': _time(lambda: LEGACY_STATEMENTS[name]()._generate_cache_key(), iterations),
+            'build_queries': _time(lambda: builder(*args)._generate_cache_key(), iterations),
+            'compile': _time(lambda: LEGACY_STATEMENTS[name]().compile(dialect=dialect), iterations),
+        }
+        for variant, fn in CALLS[name].items():
+            timings[variant] = _time(fn, iterations, reset=True)
+        results.append((name, timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--database', default=None, help='SQLAlchemy URL (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    path = None
+    if args.database is None:
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        args.database = f'sqlite:///{path}'
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    db.init_app(app)
+    try:
+        with app.app_context():
+            db.create_all()
+            if not Match.query.first():
+                _seed()
+            columns = ('build_legacy', 'build_queries', 'compile', 'legacy', 'queries', 'queries_rows')
+            print(f'{"query":<16}' + ''.join(f'{column:>14}' for column in columns) + '   (µs per call)')
+            for name, timings in run(args.iterations):
+                cells = ''.join(f'{timings[c]:>14.1f}' if c in timings else f'{"-":>14}' for c in columns)
+                print(f'{name:<16}{cells}')
+    finally:
+        if path:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
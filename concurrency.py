@@ -0,0 +1,135 @@
+"""Contrôle de concurrence optimiste et clés d'idempotence.
+
+Match, Player, TeamStats et PlayerStats portent une colonne version_id
+(``version_id_col`` de SQLAlchemy) : chaque UPDATE vérifie la version lue et
+l'incrémente, si bien que deux arbitres ou administrateurs qui modifient la
+même ligne ne s'écrasent plus silencieusement. Le client peut aussi envoyer
+la version qu'il a affichée (en-tête If-Match ou champ ``version``) ; en cas
+d'écart, la réponse est un 409 contenant l'état actuel.
+
+Les endpoints POST du live acceptent un en-tête Idempotency-Key (voir
+decorators.idempotent) : une requête rejouée avec la même clé renvoie la
+réponse enregistrée au lieu de compter le but une seconde fois.
+
+    flask add-version-columns        # bases créées avant l'ajout des colonnes
+    flask purge-idempotency-keys
+"""
+import os
+import hashlib
+from datetime import datetime, date, timedelta
+
+from flask import request, jsonify
+from sqlalchemy import inspect, text
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+
+VERSIONED_TABLES = ('match', 'player', 'team_stats', 'player_stats')
+IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24')))
+
+
+class VersionConflict(Exception):
+    """The row was changed by someone else since the client (or this request) read it"""
+
+    def __init__(self, obj):
+        super().__init__(f'{type(obj).__name__} {getattr(obj, "id", "")} was modified concurrently')
+        self.obj = obj
+
+
+def expected_version(data=None):
+    """Version sent by the client: If-Match header, then a `version` field"""
+    header = request.headers.get('If-Match')
+    if header:
+        value = header.strip().removeprefix('W/').strip('"')
+    else:
+        data = data if data is not None else (request.get_json(silent=True) or request.form)
+        value = data.get('version') if data else None
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def check_version(obj, expected):
+    if expected is not None and expected != obj.version_id:
+        raise VersionConflict(obj)
+
+
+def commit(obj):
+    """Commit, turning a concurrent update of `obj` into a VersionConflict"""
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        raise VersionConflict(obj)
+
+
+def current_state(obj):
+    """Column values of `obj` as JSON-friendly data, re-read from the database"""
+    db.session.refresh(obj)
+    state = {}
+    for attr in inspect(obj).mapper.column_attrs:
+        value = getattr(obj, attr.key)
+        state[attr.key] = value.isoformat() if isinstance(value, (datetime, date)) else value
+    return state
+
+
+def conflict_response(obj):
+    state = current_state(obj)
+    response = jsonify({
+        'error': 'conflict',
+        'message': 'This record was modified by someone else. Reload it and try again.',
+        'version': obj.version_id,
+        'current': state,
+    })
+    response.status_code = 409
+    response.headers['ETag'] = f'"{obj.version_id}"'
+    return response
+
+
+def request_fingerprint(body):
+    return hashlib.sha256(body or b'').hexdigest()
+
+
+def ensure_version_columns():
+    """ALTER TABLE ... ADD COLUMN version_id on databases created before it existed"""
+    added = []
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        quote = connection.dialect.identifier_preparer.quote
+        for table in VERSIONED_TABLES:
+            if 'version_id' not in {column['name'] for column in inspector.get_columns(table)}:
+                connection.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN version_id INTEGER NOT NULL DEFAULT 1'))
+                added.append(table)
+    return added
+
+
+def purge_idempotency_keys(older_than=IDEMPOTENCY_KEY_TTL):
+    from models import IdempotencyKey
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < datetime.utcnow() - older_than).delete()
+    db.session.commit()
+    return deleted
+
+
+def init_app(app):
+    @app.errorhandler(VersionConflict)
+    def _version_conflict(error):
+        db.session.rollback()
+        return conflict_response(error.obj)
+
+    @app.errorhandler(StaleDataError)
+    def _stale_data(error):
+        # Flush hors de concurrency.commit : l'objet en cause n'est pas connu
+        db.session.rollback()
+        return jsonify({'error': 'conflict', 'message': str(error)}), 409
+
+    @app.cli.command('add-version-columns')
+    def add_version_columns_command():
+        """Add the version_id columns used for optimistic locking."""
+        added = ensure_version_columns()
+        print(f'version_id added to: {", ".join(added) or "nothing (already present)"}')
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys_command():
+        """Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS."""
+        print(f'{purge_idempotency_keys()} idempotency key(s) deleted')
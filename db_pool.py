@@ -0,0 +1,185 @@
+import os
+import bisect
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Bornes (en millisecondes) de l'histogramme des temps d'attente au checkout
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+PRE_PING_STRATEGIES = ('always', 'idle', 'never')
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def engine_options_from_env(database_uri):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from DB_POOL_* environment variables"""
+    strategy = os.environ.get('DB_POOL_PRE_PING', 'idle').lower()
+    if strategy not in PRE_PING_STRATEGIES:
+        raise ValueError(f'DB_POOL_PRE_PING must be one of {", ".join(PRE_PING_STRATEGIES)}')
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_POOL_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 300),
+        # 'always' laisse SQLAlchemy pinguer à chaque checkout ; 'idle' est géré par install_pool_metrics
+        'pool_pre_ping': strategy == 'always',
+        # Cache des instructions compilées (partagé par les lambda statements de queries.py)
+        'query_cache_size': _env_int('DB_QUERY_CACHE_SIZE', 500),
+    }
+
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and database_uri.startswith(('postgres://', 'postgresql')):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+
+    return options
+
+
+class PoolMetrics:
+    """Per-process pool statistics (each gunicorn worker owns its own pool)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wait_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.idle_pings = 0
+
+    def record_wait(self, elapsed_ms):
+        with self._lock:
+            self.wait_counts[bisect.bisect_left(WAIT_BUCKETS_MS, elapsed_ms)] += 1
+            self.wait_total_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+            self.checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_idle_ping(self):
+        with self._lock:
+            self.idle_pings += 1
+
+    def histogram(self):
+        labels = [f'<={bound}ms' for bound in WAIT_BUCKETS_MS] + [f'>{WAIT_BUCKETS_MS[-1]}ms']
+        return dict(zip(labels, self.wait_counts))
+
+    def to_dict(self, pool):
+        with self._lock:
+            data = {
+                'pid': os.getpid(),
+                'pool_class': type(pool).__name__,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'idle_pings': self.idle_pings,
+                'wait_avg_ms': round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max_ms, 3),
+                'wait_histogram': self.histogram(),
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool.timeout(),
+            })
+        data['status'] = pool.status()
+        return data
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a connection"""
+
+    metrics = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait((time.perf_counter() - start) * 1000.0)
+        return connection
+
+
+def install_pool_metrics(engine):
+    """Attach connect/checkout listeners and the idle pre-ping strategy to an engine"""
+    pool = engine.pool
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is None:
+        metrics = pool.metrics = PoolMetrics()
+
+    idle_threshold = _env_int('DB_POOL_PING_IDLE_SECONDS', 30)
+    ping_idle = os.environ.get('DB_POOL_PRE_PING', 'idle').lower() == 'idle'
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        metrics.record_connect()
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.record_invalidation()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info['last_checkin'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        if not ping_idle:
+            return
+        last_checkin = connection_record.info.get('last_checkin')
+        if last_checkin is None or time.monotonic() - last_checkin < idle_threshold:
+            return
+        # Ne pinguer que les connexions restées inactives assez longtemps
+        metrics.record_idle_ping()
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        except Exception as e:
+            # Le pool invalide la connexion et en ouvre une nouvelle
+            raise exc.DisconnectionError() from e
+        finally:
+            cursor.close()
+
+    return metrics
+
+
+def pool_stats(engine):
+    """Return the current pool statistics for this worker"""
+    pool = engine.pool
+    metrics = getattr(pool, 'metrics', None) or PoolMetrics()
+    return metrics.to_dict(pool)
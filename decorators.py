@@ -1,12 +1,18 @@
 from functools import wraps
-from flask import flash, redirect, url_for
+from flask import flash, redirect, url_for, request, jsonify, make_response, Response
 from flask_login import current_user
-from models import Admin, Coach, Referee
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from concurrency import request_fingerprint
+from tracing import span
+from models import Admin, Coach, Referee, IdempotencyKey
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not isinstance(current_user, Admin):
+        with span('auth.admin_required'):
+            allowed = current_user.is_authenticated and isinstance(current_user, Admin)
+        if not allowed:
             flash('Accès refusé. Droits administrateur requis.', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -15,7 +21,9 @@ def admin_required(f):
 def coach_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not isinstance(current_user, Coach):
+        with span('auth.coach_required'):
+            allowed = current_user.is_authenticated and isinstance(current_user, Coach)
+        if not allowed:
             flash('Accès refusé. Droits entraîneur requis.', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -24,8 +32,70 @@ def coach_required(f):
 def referee_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not isinstance(current_user, Referee):
+        with span('auth.referee_required'):
+            allowed = current_user.is_authenticated and isinstance(current_user, Referee)
+        if not allowed:
             flash('Accès refusé. Droits arbitre requis.', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
-    return decorated_function 
\ No newline at end of file
+    return decorated_function 
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return jsonify({'error': 'Idempotency-Key already used with a different request body'}), 422
+    if record.status_code is None:
+        return jsonify({'error': 'A request with this Idempotency-Key is still being processed'}), 409
+    response = Response(record.body, status=record.status_code, content_type=record.content_type)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(f):
+    """Rejoue la réponse enregistrée quand un POST est renvoyé avec le même en-tête Idempotency-Key.
+
+    La clé est ajoutée à la session avant d'appeler la vue : elle est validée
+    par le même commit que les changements de la vue, donc un but n'est
+    jamais compté sans que sa clé soit enregistrée.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        scope = f'{request.endpoint}:{request.path}'[:255]
+        fingerprint = request_fingerprint(request.get_data())
+
+        record = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+        if record:
+            return _replay(record, fingerprint)
+
+        claim = IdempotencyKey(scope=scope, key=key[:255], fingerprint=fingerprint)
+        db.session.add(claim)
+        try:
+            response = make_response(f(*args, **kwargs))
+        except IntegrityError:
+            # Même clé envoyée en parallèle : l'autre requête a gagné
+            db.session.rollback()
+            record = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+            if record is None:
+                raise
+            return _replay(record, fingerprint)
+        except Exception:
+            _release(scope, key)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 409:
+            # Rien n'a été appliqué (ou conflit) : le client peut réessayer avec la même clé
+            _release(scope, key)
+            return response
+        claim.status_code = response.status_code
+        claim.content_type = response.content_type
+        claim.body = response.get_data(as_text=True)
+        db.session.add(claim)
+        db.session.commit()
+        return response
+    return decorated_function
+
+def _release(scope, key):
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(scope=scope, key=key, status_code=None).delete()
+    db.session.commit()
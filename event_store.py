@@ -0,0 +1,79 @@
+"""Fusion de l'ancienne table match_update dans match_event.
+
+Le code live écrivait dans match_update (MatchUpdate, models_live.py)
+pendant que le reste de l'application lisait match_event (MatchEvent). La
+migration copie les anciennes lignes dans match_event (une seule fois grâce à
+legacy_update_id), renomme l'ancienne table en match_update_legacy et la
+remplace par une vue en lecture seule ayant l'ancien format de colonnes.
+
+Les lignes copiées reçoivent des ids plus grands que ceux des événements
+déjà présents dans match_event : les lectures live (queries.live_events,
+live_service.load_snapshot) trient donc par (timestamp, id) et non par id.
+
+    flask merge-match-updates
+"""
+from sqlalchemy import inspect, text
+
+from extensions import db
+from models import MatchEvent
+
+LEGACY_TABLE = 'match_update'
+ARCHIVED_LEGACY_TABLE = 'match_update_legacy'
+
+COMPAT_VIEW_SQL = f'''
+CREATE VIEW {LEGACY_TABLE} AS
+SELECT id, match_id, minute, event_type AS update_type, team_id, player_id, description, timestamp
+FROM match_event
+'''
+
+
+def _ensure_schema(connection):
+    inspector = inspect(connection)
+    columns = {column['name'] for column in inspector.get_columns('match_event')}
+    if 'legacy_update_id' not in columns:
+        connection.execute(text('ALTER TABLE match_event ADD COLUMN legacy_update_id INTEGER'))
+        connection.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS uq_match_event_legacy_update_id ON match_event (legacy_update_id)'
+        ))
+    for index in MatchEvent.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def merge_legacy_updates():
+    """Copy match_update rows into match_event and install the compatibility view.
+
+    Safe to run several times. Returns the number of rows merged.
+    """
+    merged = 0
+    with db.engine.begin() as connection:
+        _ensure_schema(connection)
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        views = set(inspector.get_view_names())
+
+        if LEGACY_TABLE in tables:
+            merged = connection.execute(text(f'''
+                INSERT INTO match_event (match_id, minute, event_type, team_id, player_id, description, timestamp, legacy_update_id)
+                SELECT u.match_id, u.minute, u.update_type, u.team_id, u.player_id, u.description, u.timestamp, u.id
+                FROM {LEGACY_TABLE} u
+                WHERE NOT EXISTS (SELECT 1 FROM match_event e WHERE e.legacy_update_id = u.id)
+                ORDER BY u.timestamp, u.id
+            ''')).rowcount
+            if ARCHIVED_LEGACY_TABLE in tables:
+                # Déjà archivée lors d'une migration précédente : les lignes viennent d'être copiées
+                connection.execute(text(f'DROP TABLE {LEGACY_TABLE}'))
+            else:
+                connection.execute(text(f'ALTER TABLE {LEGACY_TABLE} RENAME TO {ARCHIVED_LEGACY_TABLE}'))
+
+        if LEGACY_TABLE not in views:
+            connection.execute(text(COMPAT_VIEW_SQL))
+
+    return merged
+
+
+def register_cli(app):
+    @app.cli.command('merge-match-updates')
+    def merge_match_updates_command():
+        """Merge the legacy match_update table into match_event."""
+        count = merge_legacy_updates()
+        print(f'{count} match update(s) merged into match_event')
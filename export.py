@@ -0,0 +1,239 @@
+"""Export des données d'une saison (matchs, événements, performances, classement).
+
+Les lignes sont lues par un curseur côté serveur (`yield_per`) et écrites
+lot par lot en CSV ou en Parquet : la mémoire utilisée reste constante quelle
+que soit la taille du tournoi. Le Parquet nécessite pyarrow (optionnel).
+"""
+import io
+import csv
+from collections import defaultdict, namedtuple
+
+import click
+from sqlalchemy import select, Integer, Float, Boolean, DateTime, Date
+
+from extensions import db
+from models import Team, Player, TeamStats
+from archive import HOT, sources
+from tenancy import lookup, use_tenant
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+BATCH_SIZE = 5000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+# Colonne d'une table partagée, ajoutée à chaque lot juste après la colonne `key` qui porte l'identifiant :
+# les tables de tenant ne sont jamais jointes aux tables partagées (voir tenancy.py)
+Shared = namedtuple('Shared', ['name', 'key', 'column'])
+
+
+def _matches(tournament_id, tables=HOT):
+    match = tables.match
+    return select(
+        match.id.label('match_id'), match.round_number, match.match_date, match.venue, match.status,
+        match.home_team_id, match.away_team_id, match.home_score, match.away_score, match.referee_id
+    ).where(match.tournament_id == tournament_id)\
+     .order_by(match.id), [Shared('home_team', 'home_team_id', Team.name),
+                           Shared('away_team', 'away_team_id', Team.name)]
+
+
+def _events(tournament_id, tables=HOT):
+    match = tables.match
+    event = tables.event
+    return select(
+        event.id.label('event_id'), event.match_id, event.minute, event.event_type,
+        event.team_id, event.player_id, event.description, event.timestamp
+    ).join(match, match.id == event.match_id)\
+     .where(match.tournament_id == tournament_id)\
+     .order_by(event.match_id, event.timestamp, event.id), []
+
+
+def _performances(tournament_id, tables=HOT):
+    match = tables.match
+    performance = tables.performance
+    return select(
+        performance.match_id, performance.player_id,
+        performance.is_selected, performance.minutes_played,
+        performance.goals, performance.assists,
+        performance.yellow_cards, performance.red_cards,
+        performance.shots, performance.shots_on_target,
+        performance.passes, performance.passes_completed,
+        performance.tackles, performance.interceptions,
+        performance.saves, performance.rating
+    ).join(match, match.id == performance.match_id)\
+     .where(match.tournament_id == tournament_id)\
+     .order_by(performance.match_id, performance.id), [Shared('player', 'player_id', Player.name),
+                                                        Shared('team_id', 'player_id', Player.team_id),
+                                                        Shared('position', 'player_id', Player.position)]
+
+
+def _team_stats(tournament_id, tables=HOT):
+    return select(
+        TeamStats.team_id, Team.name.label('team'), TeamStats.matches_played, TeamStats.victoires,
+        TeamStats.nuls, TeamStats.defaites, TeamStats.goals_marques, TeamStats.buts_encaisses,
+        TeamStats.difference_des_buts, TeamStats.points, TeamStats.carton_jaunes, TeamStats.cartons_rouges
+    ).join(Team, Team.id == TeamStats.team_id)\
+     .where(Team.tournament_id == tournament_id)\
+     .order_by(TeamStats.points.desc(), TeamStats.difference_des_buts.desc()), []
+
+
+EXPORTS = {
+    'matches': _matches,
+    'events': _events,
+    'performances': _performances,
+    'team_stats': _team_stats,
+}
+
+
+def _layout(statement, shared):
+    """(name, column) of the exported columns: the statement's, each shared column after its key"""
+    layout = []
+    for column in statement.selected_columns:
+        layout.append((column.name, column))
+        layout += [(extra.name, extra.column) for extra in shared if extra.key == column.name]
+    return layout
+
+
+def _with_shared(rows, keys, shared):
+    """Rows of a batch with the shared columns looked up on the main database (one query per table)"""
+    by_model = defaultdict(list)
+    for extra in shared:
+        by_model[extra.column.class_].append(extra)
+    values = {}
+    for model, extras in by_model.items():
+        columns = list(dict.fromkeys(extra.column for extra in extras))
+        found = lookup(model.id, (row[keys.index(extra.key)] for row in rows for extra in extras), *columns)
+        for extra in extras:
+            position = columns.index(extra.column) + 1
+            values[extra.name] = {key: row[position] for key, row in found.items()}
+    out = []
+    for row in rows:
+        line = []
+        for name, value in zip(keys, row):
+            line.append(value)
+            line += [values[extra.name].get(value) for extra in shared if extra.key == name]
+        out.append(line)
+    return out
+
+
+def _stream(statement, shared):
+    """(column names, batches of rows) of an export, shared columns filled in"""
+    result = db.session.execute(statement.execution_options(yield_per=BATCH_SIZE))
+    keys = list(result.keys())
+    names = [name for name, _ in _layout(statement, shared)]
+    partitions = result.partitions()
+    if shared:
+        partitions = (_with_shared(rows, keys, shared) for rows in partitions)
+    return names, partitions
+
+
+def csv_chunks(statement, shared=()):
+    """Yield the statement's rows as UTF-8 encoded CSV, one chunk per batch"""
+    names, partitions = _stream(statement, shared)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink:
+    """Minimal writable file that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(column):
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column_type, Integer):
+        return pyarrow.int64()
+    if isinstance(column_type, Float):
+        return pyarrow.float64()
+    if isinstance(column_type, DateTime):
+        return pyarrow.timestamp('us')
+    if isinstance(column_type, Date):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+def parquet_chunks(statement, shared=()):
+    """Yield the statement's rows as a Parquet file, one row group per batch"""
+    if pyarrow is None:
+        raise RuntimeError('Parquet export requires pyarrow')
+
+    schema = pyarrow.schema([(name, _arrow_type(column)) for name, column in _layout(statement, shared)])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    _, partitions = _stream(statement, shared)
+    for rows in partitions:
+        columns = list(zip(*rows))
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def available(fmt):
+    """False for Parquet without pyarrow: to check before streaming, an error mid-response cannot be reported"""
+    return fmt != 'parquet' or pyarrow is not None
+
+
+def export_chunks(tournament_id, table, fmt):
+    # Tournoi archivé : mêmes colonnes, lues dans les tables archived_*
+    statement, shared = EXPORTS[table](tournament_id, sources(tournament_id))
+    with use_tenant(tournament_id):
+        yield from (csv_chunks if fmt == 'csv' else parquet_chunks)(statement, shared)
+
+
+def register_cli(app):
+    @app.cli.command('export-season')
+    @click.argument('tournament_id', type=int)
+    @click.argument('table', type=click.Choice(sorted(EXPORTS)))
+    @click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv')
+    @click.option('--output', type=click.File('wb'), default='-')
+    def export_season_command(tournament_id, table, fmt, output):
+        """Stream a tournament's matches, events, performances or team stats to a file."""
+        if not available(fmt):
+            raise click.ClickException('Parquet export requires pyarrow (pip install pyarrow)')
+        for chunk in export_chunks(tournament_id, table, fmt):
+            output.write(chunk)
@@ -0,0 +1,262 @@
+"""Calendriers des matchs (iCalendar et JSON) par tournoi et par équipe.
+
+Les flux sont écrits d'avance dans FEEDS_DIR, au même moment que le modèle
+de lecture (voir readmodel.py) : après chaque commit qui touche les matchs
+d'un tournoi (génération du calendrier, scores, arbitre...), ses équipes ou
+le tournoi lui-même. Un fichier dont le contenu n'a pas changé n'est pas
+réécrit, sa date de modification reste donc celle du dernier vrai changement.
+
+Les requêtes ne lisent que ces fichiers : ETag (empreinte du contenu) et
+Last-Modified permettent aux clients de calendrier, qui interrogent souvent,
+d'obtenir un 304 sans que la base soit consultée. Un flux absent est
+construit à la première demande, un flux dont le tournoi porte un marqueur
+de modification plus récent que son modèle de lecture (voir readmodel.load)
+est reconstruit avant d'être servi.
+
+    /feeds/tournaments/<id>.ics   /feeds/tournaments/<id>.json
+    /feeds/teams/<id>.ics         /feeds/teams/<id>.json
+
+    flask build-feeds [--tournament-id ID]
+
+Les dates des matchs sont sans fuseau : elles sont publiées en heure locale
+« flottante », ou dans le fuseau FEEDS_TIMEZONE (nom IANA) s'il est défini.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import timedelta
+
+import click
+from flask import current_app, send_file, abort
+from sqlalchemy import select
+
+from extensions import db
+from models import Tournament, Team, User
+from tenancy import use_tenant
+
+KINDS = ('tournaments', 'teams')
+FORMATS = {'ics': 'text/calendar', 'json': 'application/json'}  # charset UTF-8 ajouté par send_file
+MATCH_DURATION = timedelta(hours=2)
+MAX_AGE = int(os.environ.get('FEEDS_MAX_AGE', '300'))
+TIMEZONE = os.environ.get('FEEDS_TIMEZONE') or None
+UID_DOMAIN = os.environ.get('FEEDS_UID_DOMAIN', 'football-tournament.local')
+ICS_STATUS = {'cancelled': 'CANCELLED', 'postponed': 'TENTATIVE'}
+
+
+def directory():
+    return current_app.config['FEEDS_DIR']
+
+
+def path_for(kind, key, fmt):
+    return os.path.join(directory(), f'{kind}-{key}.{fmt}')
+
+
+def fixtures(tournament_id):
+    """(tournament, teams by id, fixture dicts by date) or None if the tournament does not exist"""
+    import archive
+
+    tournament = db.session.get(Tournament, tournament_id)
+    if tournament is None:
+        return None
+    teams = {team.id: team for team in Team.query.filter_by(tournament_id=tournament_id)}
+    source = archive.sources(tournament_id).match
+    with use_tenant(tournament_id):
+        matches = db.session.execute(
+            select(source.id, source.home_team_id, source.away_team_id, source.match_date, source.venue,
+                   source.home_score, source.away_score, source.status, source.round_number, source.referee_id,
+                   source.created_at)
+            .where(source.tournament_id == tournament_id).order_by(source.match_date, source.id)
+        ).all()
+    referee_ids = {match.referee_id for match in matches if match.referee_id}
+    referees = {row.id: ' '.join(filter(None, (row.first_name, row.last_name))) or row.username
+                for row in db.session.execute(select(User.id, User.first_name, User.last_name, User.username)
+                                              .where(User.id.in_(referee_ids)))} if referee_ids else {}
+
+    def side(team_id):
+        team = teams.get(team_id)
+        return {'id': team_id, 'name': team.name if team else None}
+
+    rows = [{
+        'id': match.id,
+        'round': match.round_number,
+        'kickoff': match.match_date,
+        'venue': match.venue,
+        'status': match.status,
+        'home_team': side(match.home_team_id),
+        'away_team': side(match.away_team_id),
+        'home_score': match.home_score if match.status == 'completed' else None,
+        'away_score': match.away_score if match.status == 'completed' else None,
+        'referee': {'id': match.referee_id, 'name': referees.get(match.referee_id)} if match.referee_id else None,
+        'created_at': match.created_at,  # DTSTAMP de l'iCalendar
+    } for match in matches]
+    return tournament, teams, rows
+
+
+def render_json(title, rows):
+    return json.dumps({
+        'calendar': title,
+        'timezone': TIMEZONE,
+        'matches': [dict({key: value for key, value in row.items() if key != 'created_at'},
+                         kickoff=row['kickoff'].isoformat())
+                    for row in rows],
+    }, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _ics_text(value):
+    return str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_fold(line):
+    """Lines of at most 75 octets, continuation lines starting with a space (RFC 5545 3.1)"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # pas de coupure au milieu d'un caractère UTF-8
+            end -= 1
+        parts.append(data[start:end].decode())
+        start, limit = end, 74
+    return '\r\n '.join(parts)
+
+
+def render_ics(title, rows):
+    stamp = '%Y%m%dT%H%M%S'
+    start_param = f';TZID={TIMEZONE}' if TIMEZONE else ''
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Football Tournament Manager//Fixtures//FR',
+             'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{_ics_text(title)}',
+             'REFRESH-INTERVAL;VALUE=DURATION:PT1H', 'X-PUBLISHED-TTL:PT1H']
+    if TIMEZONE:
+        lines.append(f'X-WR-TIMEZONE:{TIMEZONE}')
+    for row in rows:
+        home, away = row['home_team']['name'] or '?', row['away_team']['name'] or '?'
+        summary = f"{home} {row['home_score']} - {row['away_score']} {away}" \
+            if row['status'] == 'completed' else f'{home} vs {away}'
+        kickoff = row['kickoff']
+        description = [f"Round {row['round']}"] if row['round'] else []
+        if row['referee']:
+            description.append(f"Referee: {row['referee']['name']}")
+        lines += ['BEGIN:VEVENT',
+                  f"UID:match-{row['id']}@{UID_DOMAIN}",
+                  # Fixe tant que le match existe : un flux inchangé garde le même contenu
+                  f"DTSTAMP:{(row['created_at'] or kickoff).strftime(stamp)}Z",
+                  f'DTSTART{start_param}:{kickoff.strftime(stamp)}',
+                  f'DTEND{start_param}:{(kickoff + MATCH_DURATION).strftime(stamp)}',
+                  f'SUMMARY:{_ics_text(summary)}',
+                  f"STATUS:{ICS_STATUS.get(row['status'], 'CONFIRMED')}"]
+        if row['venue']:
+            lines.append(f"LOCATION:{_ics_text(row['venue'])}")
+        if description:
+            lines.append(f"DESCRIPTION:{_ics_text(chr(10).join(description))}")
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(_ics_fold(line) for line in lines) + '\r\n').encode()
+
+
+def _write(path, data):
+    """Replace the file atomically, only if its content changed (keeps Last-Modified and ETag)"""
+    try:
+        with open(path, 'rb') as handle:
+            if handle.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    fd, tmp = tempfile.mkstemp(dir=directory(), prefix=f'.{os.path.basename(path)}-')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def build(tournament_id):
+    """Write the feeds of a tournament and of its teams; returns the number of files changed, None if absent"""
+    data = fixtures(tournament_id)
+    if data is None:
+        for fmt in FORMATS:
+            if os.path.exists(path_for('tournaments', tournament_id, fmt)):
+                os.unlink(path_for('tournaments', tournament_id, fmt))
+        return None
+    tournament, teams, rows = data
+    os.makedirs(directory(), exist_ok=True)
+    feeds = [('tournaments', tournament_id, tournament.name, rows)]
+    for team in teams.values():
+        feeds.append(('teams', team.id, f'{team.name} ({tournament.name})',
+                      [row for row in rows if team.id in (row['home_team']['id'], row['away_team']['id'])]))
+    _team_tournaments.update((team.id, tournament_id) for team in teams.values())
+    changed = 0
+    for kind, key, title, feed_rows in feeds:
+        changed += _write(path_for(kind, key, 'ics'), render_ics(title, feed_rows))
+        changed += _write(path_for(kind, key, 'json'), render_json(title, feed_rows))
+    return changed
+
+
+_team_tournaments = {}  # équipe -> tournoi, rempli par build
+_etags = {}  # chemin -> (inode, mtime en ns, ETag)
+_etags_lock = threading.Lock()
+
+
+def _etag(path, stat):
+    cached = _etags.get(path)
+    if cached and cached[:2] == (stat.st_ino, stat.st_mtime_ns):
+        return cached[2]
+    with open(path, 'rb') as handle:
+        etag = hashlib.blake2b(handle.read(), digest_size=12).hexdigest()
+    with _etags_lock:
+        _etags[path] = (stat.st_ino, stat.st_mtime_ns, etag)
+    return etag
+
+
+def _tournament_of(kind, key):
+    if kind == 'tournaments':
+        return key
+    if key not in _team_tournaments:
+        tournament_id = db.session.scalar(select(Team.tournament_id).where(Team.id == key))
+        if tournament_id is None:
+            return None
+        _team_tournaments[key] = tournament_id
+    return _team_tournaments[key]
+
+
+def serve(kind, key, fmt):
+    """Conditional response for a feed file; the database is only read to build a missing or stale feed"""
+    import readmodel
+
+    if kind not in KINDS or fmt not in FORMATS:
+        abort(404)
+    path = path_for(kind, key, fmt)
+    tournament_id = _tournament_of(kind, key)
+    if tournament_id is None:
+        abort(404)
+    # Reconstruit le modèle de lecture et les calendriers si un commit a daté le marqueur depuis
+    # (un flux inchangé garde sa date : c'est le fichier du modèle de lecture qui porte celle du dernier passage)
+    readmodel.load(tournament_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        if build(tournament_id) is None or not os.path.exists(path):
+            abort(404)
+        stat = os.stat(path)
+    response = send_file(path, mimetype=FORMATS[fmt], conditional=True, etag=_etag(path, stat),
+                         last_modified=stat.st_mtime, max_age=MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('FEEDS_DIR', os.path.join(tempfile.gettempdir(), 'football-feeds'))
+
+    @app.cli.command('build-feeds')
+    @click.option('--tournament-id', type=int, default=None, help='Only this tournament.')
+    def build_feeds_command(tournament_id):
+        """Write the fixture feeds of tournaments and their teams."""
+        ids = [tournament_id] if tournament_id else db.session.scalars(select(Tournament.id)).all()
+        for tid in ids:
+            changed = build(tid)
+            print(f'Tournament {tid}: ' + ('not found' if changed is None else f'{changed} file(s) changed'))
@@ -1,10 +1,68 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, DateField, IntegerField, SelectField, SubmitField, PasswordField
+from wtforms import Field, StringField, TextAreaField, DateField, IntegerField, SelectField, SubmitField, PasswordField, HiddenField
 from wtforms.validators import DataRequired, Length, NumberRange, Optional, Email, EqualTo, ValidationError
 from wtforms.widgets import TextArea
-from models import Tournament, Team, Coach, User
-from wtforms_sqlalchemy.fields import QuerySelectField
+from markupsafe import Markup, escape
+from flask import url_for
+from extensions import db
+from models import Tournament, Team, Coach, Referee, User
 from flask_wtf.file import FileField, FileAllowed, FileRequired
+import search
+
+
+class UserSearchWidget:
+    """Hidden id input plus a search box fed by /api/users/search"""
+
+    def __call__(self, field, **kwargs):
+        kwargs.setdefault('id', field.id)
+        url = url_for('api_user_search', role=field.role)
+        return Markup(
+            f'<input type="hidden" id="{escape(kwargs["id"])}" name="{escape(field.name)}" value="{escape(field._value())}">'
+            f'<input type="search" id="{escape(kwargs["id"])}-search" autocomplete="off" '
+            f'class="{escape(kwargs.get("class", "form-control"))}" placeholder="{escape(field.blank_text)}" '
+            f'value="{escape(field.display_label())}" data-search-url="{escape(url)}" '
+            f'data-search-target="{escape(kwargs["id"])}">'
+        )
+
+
+class UserSearchField(Field):
+    """Replaces QuerySelectField for users: only the submitted id is loaded and checked.
+
+    ``data`` is the selected `model` instance (or None), like QuerySelectField.
+    """
+    widget = UserSearchWidget()
+
+    def __init__(self, label=None, validators=None, model=User, role=None, blank_text='', **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self.model = model
+        self.role = role
+        self.blank_text = blank_text
+        self._id = None
+
+    def process_formdata(self, valuelist):
+        self.data = None
+        self._id = None
+        if valuelist and valuelist[0].strip():
+            try:
+                self._id = int(valuelist[0])
+            except ValueError:
+                raise ValueError(self.gettext('Not a valid choice.'))
+
+    def pre_validate(self, form):
+        if self._id is None:
+            return
+        user = db.session.get(self.model, self._id)
+        if user is None or not isinstance(user, self.model) or (self.role and user.role != self.role):
+            raise ValidationError(self.gettext('Not a valid choice.'))
+        self.data = user
+
+    def _value(self):
+        if self.data is not None:
+            return str(self.data.id)
+        return str(self._id) if self._id is not None else ''
+
+    def display_label(self):
+        return search.label(self.data) if self.data is not None else ''
 
 class TournamentForm(FlaskForm):
     name = StringField('Tournament Name', validators=[DataRequired(), Length(min=3, max=100)])
@@ -12,13 +70,18 @@ class TournamentForm(FlaskForm):
     start_date = DateField('Start Date', validators=[DataRequired()])
     end_date = DateField('End Date', validators=[Optional()])
     max_teams = IntegerField('Maximum Teams', validators=[DataRequired(), NumberRange(min=4, max=32)], default=16)
+    tiebreak_rules = SelectField('Tiebreakers', choices=[
+        ('default', 'Goal difference, goals scored, then head-to-head'),
+        ('uefa', 'Head-to-head first (UEFA)'),
+        ('fifa', 'FIFA')
+    ], default='default')
     submit = SubmitField('Create Tournament')
 
 class TeamForm(FlaskForm):
     name = StringField('Team Name', validators=[DataRequired(), Length(min=2, max=80)])
     city = StringField('City', validators=[Optional(), Length(max=80)])
     founded_year = IntegerField('Founded Year', validators=[Optional(), NumberRange(min=1800, max=2025)])
-    coach = QuerySelectField('Coach', query_factory=lambda: Coach.query.all(), get_label='username', allow_blank=True, blank_text='-- Select a Coach --', validators=[Optional()])
+    coach = UserSearchField('Coach', model=Coach, role='coach', blank_text='-- Select a Coach --', validators=[Optional()])
     submit = SubmitField('Register Team')
 
 class PlayerForm(FlaskForm):
@@ -44,6 +107,7 @@ class MatchForm(FlaskForm):
 class ScoreForm(FlaskForm):
     home_score = IntegerField('Home Team Score', validators=[DataRequired(), NumberRange(min=0, max=20)])
     away_score = IntegerField('Away Team Score', validators=[DataRequired(), NumberRange(min=0, max=20)])
+    version = HiddenField()  # version du match affichée, voir concurrency.py
     submit = SubmitField('Update Score')
 
 # Renamed and modified form for Admin to manage users
@@ -58,5 +122,5 @@ class UserForm(FlaskForm):
     submit = SubmitField('Enregistrer l\'utilisateur')
 
 class AssignRefereeForm(FlaskForm):
-    referee = QuerySelectField('Referee', query_factory=lambda: User.query.filter_by(role='referee').all(), get_label='username', allow_blank=True, blank_text='-- Select a Referee --', validators=[Optional()])
+    referee = UserSearchField('Referee', model=Referee, role='referee', blank_text='-- Select a Referee --', validators=[Optional()])
     submit = SubmitField('Assign Referee')
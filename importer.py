@@ -0,0 +1,259 @@
+"""Import en masse d'équipes et de joueurs depuis un fichier CSV ou JSON.
+
+Le fichier est lu en flux et traité par lots : chaque lot est validé avec les
+mêmes règles que TeamForm / PlayerForm, les contraintes d'unicité sont
+vérifiées sur des ensembles en mémoire (une requête par lot et non par
+ligne) puis le lot est inséré et commité d'un bloc.
+"""
+import io
+import csv
+import json
+from itertools import islice
+
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+from wtforms import Form
+from wtforms.fields.core import UnboundField
+
+from extensions import db
+from forms import TeamForm, PlayerForm
+from models import Tournament, Team, Player, Coach
+import search
+import readmodel
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+JSON_READ_SIZE = 64 * 1024
+MAX_JSON_RECORD_SIZE = 1024 * 1024  # au-delà, l'enregistrement est considéré comme mal formé
+NOT_AN_OBJECT = {'record': ['Expected an object with named fields']}
+
+
+def _row_form(form_cls, exclude):
+    """Plain wtforms.Form (no CSRF, no request) carrying the same fields as form_cls"""
+    fields = {
+        name: value for name, value in vars(form_cls).items()
+        if isinstance(value, UnboundField) and name not in exclude
+    }
+    return type(f'{form_cls.__name__}Row', (Form,), fields)
+
+
+TeamRowForm = _row_form(TeamForm, exclude={'coach', 'submit'})
+PlayerRowForm = _row_form(PlayerForm, exclude={'photo', 'submit'})
+
+
+def iter_records(stream, fmt):
+    """Yield dicts from a binary stream containing CSV, a JSON array or JSON lines"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+    elif fmt == 'json':
+        yield from _iter_json(text)
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def _iter_json(text):
+    decoder = json.JSONDecoder()
+    buffer = text.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        # JSON lines : un objet par ligne
+        for line in io.StringIO(buffer + text.readline()):
+            if line.strip():
+                yield json.loads(line)
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+        return
+
+    pos, eof = 1, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as error:
+            if eof:
+                raise
+            if len(buffer) - pos > MAX_JSON_RECORD_SIZE:
+                # Une erreur de syntaxe ne se résout pas en lisant la suite : ne pas bufferiser tout le fichier
+                raise ValueError(f'Malformed JSON record (or larger than {MAX_JSON_RECORD_SIZE} characters): '
+                                 f'{error.msg}') from error
+            chunk = text.read(JSON_READ_SIZE)
+            eof = not chunk
+            # Ne garder en mémoire que la partie non encore décodée
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield record
+        pos = end
+
+
+def _batches(records, size):
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _as_formdata(record, fields):
+    return MultiDict({
+        name: '' if record.get(name) is None else str(record.get(name)).strip()
+        for name in fields
+    })
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.rows = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+
+def import_teams(stream, fmt, tournament_id, batch_size=BATCH_SIZE, on_batch=None):
+    """Import teams into a tournament, enforcing Tournament.max_teams"""
+    tournament = db.session.get(Tournament, tournament_id)
+    team_count = Team.query.filter_by(tournament_id=tournament_id).count()
+    report = ImportReport()
+
+    for batch in _batches(iter_records(stream, fmt), batch_size):
+        # Entraîneurs référencés par nom d'utilisateur : une requête par lot
+        usernames = {str(r.get('coach')).strip() for r in batch if isinstance(r, dict) and r.get('coach')}
+        coaches = dict(db.session.execute(
+            select(Coach.username, Coach.id).where(Coach.username.in_(usernames))
+        ).all()) if usernames else {}
+
+        rows = []
+        for record in batch:
+            report.rows += 1
+            if not isinstance(record, dict):
+                report.error(report.rows, NOT_AN_OBJECT)
+                continue
+            form = TeamRowForm(_as_formdata(record, ('name', 'city', 'founded_year')))
+            if not form.validate():
+                report.error(report.rows, form.errors)
+                continue
+            coach_name = str(record.get('coach') or '').strip()
+            if coach_name and coach_name not in coaches:
+                report.error(report.rows, {'coach': [f'Unknown coach "{coach_name}"']})
+                continue
+            if team_count >= tournament.max_teams:
+                report.error(report.rows, {'tournament': ['Tournament is full!']})
+                continue
+            team_count += 1
+            rows.append({
+                'name': form.name.data,
+                'city': form.city.data or None,
+                'founded_year': form.founded_year.data,
+                'coach_id': coaches.get(coach_name),
+                'tournament_id': tournament_id
+            })
+
+        if rows:
+            ids = db.session.scalars(insert(Team).returning(Team.id), rows).all()
+            search.index_entities('team', ids)  # l'INSERT en masse ne passe pas par le flush
+        db.session.commit()
+        readmodel.invalidate(tournament_id)
+        report.created += len(rows)
+        if on_batch:
+            on_batch(report)
+
+    return report
+
+
+def import_players(stream, fmt, tournament_id, batch_size=BATCH_SIZE, on_batch=None):
+    """Import players of a tournament's teams (by 'team_id' or 'team' name column)"""
+    report = ImportReport()
+    team_ids = {}  # nom d'équipe -> id
+    jerseys = {}   # id d'équipe -> numéros déjà pris (au plus 99 par équipe)
+
+    for batch in _batches(iter_records(stream, fmt), batch_size):
+        names = {str(r['team']).strip() for r in batch
+                 if isinstance(r, dict) and r.get('team') and not r.get('team_id')}
+        missing_names = names - team_ids.keys()
+        if missing_names:
+            team_ids.update(db.session.execute(
+                select(Team.name, Team.id).where(Team.tournament_id == tournament_id, Team.name.in_(missing_names))
+            ).all())
+
+        # Résoudre l'équipe de chaque ligne, puis charger les numéros des équipes inconnues en une requête
+        resolved = []
+        for record in batch:
+            if not isinstance(record, dict):
+                resolved.append(None)
+                continue
+            team_id = record.get('team_id')
+            if team_id not in (None, ''):
+                try:
+                    team_id = int(team_id)
+                except (TypeError, ValueError):
+                    team_id = None
+            else:
+                team_id = team_ids.get(str(record.get('team') or '').strip())
+            resolved.append(team_id)
+
+        new_teams = {t for t in resolved if t is not None} - jerseys.keys()
+        if new_teams:
+            known = set(db.session.scalars(
+                select(Team.id).where(Team.tournament_id == tournament_id, Team.id.in_(new_teams))
+            ))
+            for team_id in new_teams:
+                jerseys[team_id] = set() if team_id in known else None
+            for team_id, number in db.session.execute(
+                select(Player.team_id, Player.jersey_number).where(Player.team_id.in_(known))
+            ):
+                jerseys[team_id].add(number)
+
+        rows = []
+        for record, team_id in zip(batch, resolved):
+            report.rows += 1
+            if not isinstance(record, dict):
+                report.error(report.rows, NOT_AN_OBJECT)
+                continue
+            if team_id is None or jerseys.get(team_id) is None:
+                report.error(report.rows, {'team': ['Unknown team for this tournament']})
+                continue
+            record = dict(record, position=str(record.get('position') or '').strip().lower())
+            form = PlayerRowForm(_as_formdata(record, ('name', 'position', 'jersey_number', 'age', 'nationality')))
+            if not form.validate():
+                report.error(report.rows, form.errors)
+                continue
+            if form.jersey_number.data in jerseys[team_id]:
+                report.error(report.rows, {'jersey_number': ['Jersey number is already taken!']})
+                continue
+            jerseys[team_id].add(form.jersey_number.data)
+            rows.append({
+                'name': form.name.data,
+                'position': form.position.data,
+                'jersey_number': form.jersey_number.data,
+                'age': form.age.data,
+                'nationality': form.nationality.data or None,
+                'team_id': team_id
+            })
+
+        if rows:
+            ids = db.session.scalars(insert(Player).returning(Player.id), rows).all()
+            search.index_entities('player', ids)
+        db.session.commit()
+        readmodel.invalidate(tournament_id)
+        report.created += len(rows)
+        if on_batch:
+            on_batch(report)
+
+    return report
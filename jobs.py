@@ -0,0 +1,202 @@
+"""File de tâches d'arrière-plan pour les opérations d'administration lourdes.
+
+Les tâches sont enregistrées dans la table `job` puis exécutées par un pool
+de processus local : la requête HTTP rend la main immédiatement avec
+l'identifiant de la tâche, que le client peut suivre via /jobs/<id>.
+
+    @job('generate_fixtures')
+    def generate_fixtures(ctx, tournament_id):
+        ctx.progress(50, 'Halfway there')
+"""
+import os
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import update, or_
+
+from extensions import db
+from models import Job
+from tenancy import use_tenant
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+RETRY_BASE_DELAY = float(os.environ.get('JOB_RETRY_DELAY', '5'))
+STALE_AFTER = timedelta(seconds=int(os.environ.get('JOB_STALE_SECONDS', '3600')))
+
+_registry = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def job(name, max_attempts=3):
+    """Register a function as a background job handler"""
+    def decorator(f):
+        _registry[name] = (f, max_attempts)
+        return f
+    return decorator
+
+
+class JobContext:
+    """Passed to job handlers to report progress while they run"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, percent, message=None):
+        # Connexion séparée : le travail en cours de la tâche n'est pas commité.
+        # Avec SQLite, appeler entre deux commits (pas d'écriture concurrente possible).
+        values = {'progress': max(0, min(100, int(percent)))}
+        if message is not None:
+            values['message'] = message[:255]
+        with db.engine.begin() as connection:
+            connection.execute(update(Job).where(Job.id == self.job_id).values(**values))
+
+
+def _init_worker():
+    # Processus neuf (spawn) : l'application est importée une fois par worker, pas à la première tâche
+    from app import app  # noqa: F401
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn et non fork : un fork copierait les verrous tenus par les threads du serveur
+            # (dispatcher, rebuilder, pool de connexions) et les connexions ouvertes
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=get_context('spawn'),
+                                            initializer=_init_worker)
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def enqueue(name, created_by=None, **params):
+    """Create a Job row and hand it to the worker pool. Returns the Job."""
+    _load_handlers()
+    if name not in _registry:
+        raise KeyError(f'Unknown job: {name}')
+
+    new_job = Job(name=name, params=params, status='queued', max_attempts=_registry[name][1],
+                  created_by_id=getattr(created_by, 'id', None))
+    db.session.add(new_job)
+    db.session.commit()
+    _submit(new_job.id)
+    return new_job
+
+
+def _submit(job_id, delay=0):
+    if delay:
+        timer = threading.Timer(delay, _submit, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+        return
+
+    try:
+        future = _get_executor().submit(run_job, job_id)
+    except BrokenProcessPool:
+        _reset_executor()
+        future = _get_executor().submit(run_job, job_id)
+    except RuntimeError:
+        # Interpréteur en cours d'arrêt : recover_jobs reprendra la tâche
+        logger.warning('Could not submit job %s, pool is shut down', job_id)
+        return
+
+    def done(f):
+        try:
+            outcome = f.result()
+        except BrokenProcessPool:
+            # Le worker a planté (OOM, kill) : la tâche reste 'running', recover_jobs la reprendra
+            logger.error('Worker crashed while running job %s', job_id)
+            _reset_executor()
+            return
+        except Exception:
+            logger.exception('Job %s could not record its outcome', job_id)
+            return
+        if outcome and outcome[0] == 'retry':
+            _submit(job_id, delay=outcome[1])
+
+    future.add_done_callback(done)
+
+
+def _load_handlers():
+    import tasks  # noqa: F401  (enregistre les handlers via @job)
+
+
+def run_job(job_id):
+    """Execute one attempt of a job. Runs inside a pool worker."""
+    from app import app
+    _load_handlers()
+
+    with app.app_context():
+        current = db.session.get(Job, job_id)
+        if current is None or current.status not in ('queued', 'running'):
+            return ('skipped', 0)
+
+        handler, _ = _registry[current.name]
+        current.status = 'running'
+        current.attempts = (current.attempts or 0) + 1
+        current.started_at = datetime.utcnow()
+        current.error = None
+        db.session.commit()
+        attempts, max_attempts, params = current.attempts, current.max_attempts, dict(current.params or {})
+
+        try:
+            with use_tenant(params.get('tournament_id')):
+                result = handler(JobContext(job_id), **params)
+        except Exception:
+            db.session.rollback()
+            current = db.session.get(Job, job_id)
+            current.error = traceback.format_exc()[-4000:]
+            if attempts < max_attempts:
+                delay = RETRY_BASE_DELAY * 2 ** (attempts - 1)
+                current.status = 'queued'
+                current.message = f'Attempt {attempts} failed, retrying in {delay:.0f}s'
+                db.session.commit()
+                logger.warning('Job %s (%s) failed, retrying', job_id, current.name)
+                return ('retry', delay)
+            current.status = 'failed'
+            current.finished_at = datetime.utcnow()
+            db.session.commit()
+            logger.error('Job %s (%s) failed after %s attempts', job_id, current.name, attempts)
+            return ('failed', 0)
+
+        current = db.session.get(Job, job_id)
+        current.status = 'succeeded'
+        current.progress = 100
+        current.result = result
+        current.finished_at = datetime.utcnow()
+        db.session.commit()
+        return ('succeeded', 0)
+
+
+def recover_jobs():
+    """Resubmit queued jobs and jobs stuck in 'running' (e.g. after a restart)"""
+    stale = datetime.utcnow() - STALE_AFTER
+    pending = Job.query.filter(or_(
+        Job.status == 'queued',
+        (Job.status == 'running') & (Job.started_at < stale)
+    )).all()
+    for pending_job in pending:
+        pending_job.status = 'queued'
+    db.session.commit()
+    for pending_job in pending:
+        _submit(pending_job.id)
+    return len(pending)
+
+
+def register_cli(app):
+    @app.cli.command('recover-jobs')
+    def recover_jobs_command():
+        """Resubmit queued or stale background jobs."""
+        count = recover_jobs()
+        print(f'{count} job(s) resubmitted')
@@ -0,0 +1,586 @@
+"""Service ASGI pour le suivi des matchs en direct.
+
+Tourne à côté de l'application Flask (qui reste sur des workers gunicorn
+synchrones pour les pages d'administration) et partage les mêmes modèles.
+Chaque processus peut garder des dizaines de milliers de connexions
+spectateurs ouvertes : un seul poller par match interroge la base, quel que
+soit le nombre d'abonnés.
+
+    uvicorn live_service:app --host 0.0.0.0 --port 8001 --workers 2
+
+Les écritures (score, coup d'envoi, fin) sont réservées aux administrateurs et
+à l'arbitre du match, reconnus par le cookie de session de l'application Flask
+(même SESSION_SECRET). Elles passent par live_state, comme celles des workers
+Flask : événement dans match_event, état rattrapé puis checkpointé aussitôt
+(avec le bail de live_checkpoint), jamais d'écriture directe du score.
+
+Les routes passent par les voies d'admission.py : lectures spectateur
+limitées (token buckets, concurrence LIVE_SPECTATOR_CONCURRENCY, snapshots),
+écritures critiques jamais rejetées.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import contextlib
+from functools import wraps
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse, Response
+from starlette.routing import Route
+
+from extensions import db
+from models import User, Match, MatchEvent, MatchStats, IdempotencyKey
+from concurrency import request_fingerprint
+from db_pool import engine_options_from_env
+from tenancy import activate, tenant_for_match
+import tenancy
+import live_state
+import matchups
+import ratings
+import readmodel
+import admission
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', '1.0'))
+HEARTBEAT_INTERVAL = float(os.environ.get('LIVE_HEARTBEAT_INTERVAL', '15'))
+SUBSCRIBER_QUEUE_SIZE = 16
+# Même répertoire que l'application Flask (app.py) : ses workers reconstruisent les modèles marqués périmés
+READMODEL_DIR = os.environ.get('READMODEL_DIR', os.path.join('instance', 'readmodel'))
+DB_POOL_SIZE = int(os.environ.get('LIVE_DB_POOL_SIZE', '5'))
+# Lectures ponctuelles simultanées ; les flux SSE ne tiennent pas de connexion (un poller par match)
+SPECTATOR_CONCURRENCY = int(os.environ.get('LIVE_SPECTATOR_CONCURRENCY') or max(1, DB_POOL_SIZE // 2))
+
+# Application Flask minimale : vérifie les cookies signés par app.py et porte db.session pour live_state
+_flask_app = Flask(__name__)
+_flask_app.secret_key = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
+_flask_app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///football_tournament.db')
+_flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(_flask_app.config['SQLALCHEMY_DATABASE_URI'])
+_flask_app.config['SQLALCHEMY_BINDS'] = tenancy.binds_from_env()
+db.init_app(_flask_app)
+tenancy.init_app(_flask_app)
+_cookie_serializer = SecureCookieSessionInterface().get_signing_serializer(_flask_app)
+
+
+def async_database_url(url):
+    """Convert the sync DATABASE_URL into its async driver equivalent"""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if url.startswith('postgresql://') or url.startswith('postgresql+psycopg2://'):
+        return 'postgresql+asyncpg://' + url.split('://', 1)[1]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+
+# Flask-SQLAlchemy place les bases SQLite relatives dans instance/
+engine = create_async_engine(
+    async_database_url(os.environ.get('DATABASE_URL', 'sqlite:///instance/football_tournament.db')),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=int(os.environ.get('LIVE_DB_MAX_OVERFLOW', '5')),
+    pool_recycle=300,
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def load_snapshot(session, match_id):
+    """Same payload as the Flask api_live_match_data endpoint"""
+    match = await session.get(Match, match_id)
+    if match is None:
+        return None
+
+    recent_updates = (await session.scalars(
+        select(MatchEvent)
+        .options(selectinload(MatchEvent.team), selectinload(MatchEvent.player))
+        .filter_by(match_id=match_id)
+        .order_by(MatchEvent.timestamp.desc(), MatchEvent.id.desc())
+        .limit(10)
+    )).all()
+    stats = await session.scalar(select(MatchStats).filter_by(match_id=match_id))
+
+    return {
+        'home_score': match.home_score,
+        'away_score': match.away_score,
+        'status': match.status,
+        'version': match.version_id,
+        'updates': [update.to_dict() for update in recent_updates],
+        'stats': stats.to_dict() if stats else None
+    }
+
+
+class MatchChannel:
+    """Abonnés d'un match et la tâche qui surveille la base pour eux"""
+
+    def __init__(self, match_id):
+        self.match_id = match_id
+        self.subscribers = set()
+        self.snapshot = None
+        self.version = None
+        self.task = None
+        self.wakeup = asyncio.Event()
+
+    def broadcast(self, snapshot):
+        self.snapshot = snapshot
+        for queue in self.subscribers:
+            if queue.full():
+                # Un client lent ne reçoit que l'état le plus récent
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+
+class LiveHub:
+    def __init__(self):
+        self.channels = {}
+
+    def subscribe(self, match_id):
+        channel = self.channels.get(match_id)
+        if channel is None:
+            channel = self.channels[match_id] = MatchChannel(match_id)
+            channel.task = asyncio.create_task(self._poll(channel))
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        if channel.snapshot is not None:
+            queue.put_nowait(channel.snapshot)
+        channel.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, match_id, queue):
+        channel = self.channels.get(match_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            channel.task.cancel()
+            del self.channels[match_id]
+
+    def notify(self, match_id):
+        """Wake the poller right away after a local write"""
+        channel = self.channels.get(match_id)
+        if channel is not None:
+            channel.wakeup.set()
+
+    async def _poll(self, channel):
+        while True:
+            try:
+                async with Session() as session:
+                    snapshot = await load_snapshot(session, channel.match_id)
+                if snapshot is not None:
+                    version = (snapshot['home_score'], snapshot['away_score'], snapshot['status'],
+                               snapshot['updates'][0]['id'] if snapshot['updates'] else None)
+                    if version != channel.version:
+                        channel.version = version
+                        channel.broadcast(snapshot)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Live poll failed for match %s', channel.match_id)
+
+            channel.wakeup.clear()
+            try:
+                await asyncio.wait_for(channel.wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+hub = LiveHub()
+
+# Voies d'admission d'admission.py : mêmes token buckets (partagés si ADMISSION_REDIS_URL) et snapshots
+admission.controller.configure(os.environ.get('ADMISSION_REDIS_URL') or None)
+_spectator_limit = admission.ConcurrencyLimit(SPECTATOR_CONCURRENCY)
+
+
+def _client_key(request):
+    user_id = _session_user_id(request)
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{request.client.host if request.client else None}'
+
+
+async def _take(key, rate, burst):
+    buckets = admission.controller.buckets
+    if isinstance(buckets, admission.RedisBuckets):
+        # Client redis synchrone : hors de la boucle d'événements
+        return await run_in_threadpool(buckets.take, key, rate, burst)
+    return buckets.take(key, rate, burst)
+
+
+async def _admitted(request, match_id):
+    controller = admission.controller
+    return await _take(_client_key(request), controller.client_rate, controller.client_burst) and \
+        await _take(f'match:{match_id}', controller.match_rate, controller.match_burst)
+
+
+def _rejected(lane, status, error):
+    admission.controller.count(lane, 'rejected')
+    return JSONResponse({'error': error, 'lane': lane}, status_code=status, headers={'Retry-After': '1'})
+
+
+def _snapshot_response(entry, degraded):
+    headers = {'Age': str(int(time.monotonic() - entry.stored_at))}
+    if degraded:
+        headers['X-Degraded'] = 'snapshot'
+    return Response(entry.body, status_code=entry.status, media_type=entry.content_type, headers=headers)
+
+
+async def _spectator(endpoint, request, match_id):
+    controller = admission.controller
+    name = endpoint.__name__
+    fresh = controller.snapshot(match_id, name, controller.snapshot_fresh)
+    if fresh:
+        controller.count('spectator', 'cached')
+        return _snapshot_response(fresh, degraded=False)
+
+    admitted = await _admitted(request, match_id)
+    if admitted and _spectator_limit.acquire():
+        try:
+            response = await endpoint(request)
+        finally:
+            _spectator_limit.release()
+        if response.status_code == 200:
+            controller.store(match_id, name, response.body, response.status_code, response.media_type)
+        controller.count('spectator', 'admitted')
+        return response
+
+    stale = controller.snapshot(match_id, name, controller.snapshot_max_age)
+    if stale:
+        controller.count('spectator', 'degraded')
+        return _snapshot_response(stale, degraded=True)
+    if not admitted:
+        return _rejected('spectator', 429, 'Too many requests')
+    return _rejected('spectator', 503, 'Live data temporarily unavailable')
+
+
+def admit(lane, stream=False):
+    """Starlette counterpart of admission.admit; a stream only pays its token buckets when it opens"""
+    if lane not in ('critical', 'spectator'):
+        raise ValueError(f'Unknown admission lane {lane!r}')
+
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def admitted_endpoint(request):
+            match_id = request.path_params['id']
+            if lane == 'spectator' and stream:
+                if not await _admitted(request, match_id):
+                    return _rejected('spectator', 429, 'Too many requests')
+                admission.controller.count('spectator', 'admitted')
+                return await endpoint(request)
+            if lane == 'spectator':
+                return await _spectator(endpoint, request, match_id)
+            # Voie critique : jamais délestée ; l'écriture rend les snapshots du match périmés
+            response = await endpoint(request)
+            if response.status_code < 400:
+                admission.controller.invalidate(match_id)
+            admission.controller.count('critical', 'admitted')
+            return response
+        return admitted_endpoint
+    return decorator
+
+
+@admit('spectator')
+async def live_match_data(request):
+    match_id = request.path_params['id']
+    async with Session() as session:
+        snapshot = await load_snapshot(session, match_id)
+    if snapshot is None:
+        return JSONResponse({'error': 'Match not found'}, status_code=404)
+    return JSONResponse(snapshot)
+
+
+@admit('spectator', stream=True)
+async def live_match_stream(request):
+    """Server-Sent Events : un message à chaque changement d'état du match"""
+    match_id = request.path_params['id']
+    queue = hub.subscribe(match_id)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'data: {json.dumps(snapshot)}\n\n'
+        finally:
+            hub.unsubscribe(match_id, queue)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def _idempotency(request, body):
+    """(scope, key, fingerprint) of a request sent with an Idempotency-Key header, else None"""
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    return f'live:{request.url.path}'[:255], key[:255], request_fingerprint(body)
+
+
+async def _replay(idempotency):
+    """Stored response for an already processed Idempotency-Key, or None"""
+    if idempotency is None:
+        return None
+    scope, key, fingerprint = idempotency
+    async with Session() as session:
+        record = await session.scalar(select(IdempotencyKey).filter_by(scope=scope, key=key))
+    if record is None:
+        return None
+    if record.fingerprint != fingerprint:
+        return JSONResponse({'error': 'Idempotency-Key already used with a different request body'}, status_code=422)
+    if record.status_code is None:
+        return JSONResponse({'error': 'A request with this Idempotency-Key is still being processed'},
+                            status_code=409)
+    return Response(record.body, status_code=record.status_code, media_type=record.content_type,
+                    headers={'Idempotent-Replayed': 'true'})
+
+
+def _session_user_id(request):
+    """Id stored by flask_login in the Flask session cookie, None when absent or not validly signed"""
+    cookie = request.cookies.get(_flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return None
+    try:
+        data = _cookie_serializer.loads(cookie, max_age=int(_flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    user_id = str(data.get('_user_id') or '')
+    return int(user_id) if user_id.isdigit() else None
+
+
+async def _authorize(request, match_id):
+    """401/403 response unless the user is an admin or the referee of the match, else None"""
+    user_id = _session_user_id(request)
+    if user_id is None:
+        return JSONResponse({'error': 'Authentication required'}, status_code=401)
+    async with Session() as session:
+        role = await session.scalar(select(User.role).where(User.id == user_id))
+        referee_id = await session.scalar(select(Match.referee_id).where(Match.id == match_id))
+    if role == 'admin' or (role == 'referee' and referee_id == user_id):
+        return None
+    return JSONResponse({'error': 'Only an admin or the referee of this match can update it'}, status_code=403)
+
+
+def _expected_version(request, data):
+    header = request.headers.get('If-Match')
+    value = header.strip().removeprefix('W/').strip('"') if header else data.get('version')
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _json_body(body):
+    """Request body as a dict, None when it is not a JSON object"""
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _claim(idempotency):
+    """Idempotency-Key claimed in the transaction of the event (as decorators.idempotent does)"""
+    if idempotency is None:
+        return None
+    scope, key, fingerprint = idempotency
+    claim = IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint)
+    db.session.add(claim)
+    return claim
+
+
+def _store(claim, payload):
+    if claim is not None:
+        claim.status_code, claim.content_type, claim.body = 200, 'application/json', json.dumps(payload)
+        db.session.add(claim)
+        db.session.commit()
+
+
+def _release(idempotency):
+    """Nothing applied: the client may retry with the same key"""
+    db.session.rollback()
+    if idempotency is not None:
+        scope, key, _ = idempotency
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key,
+                                                        IdempotencyKey.status_code.is_(None)))
+        db.session.commit()
+
+
+def _state_conflict(state):
+    return JSONResponse({
+        'error': 'conflict',
+        'message': 'This match was modified by someone else. Reload it and try again.',
+        'version': state.version,
+        'current': state.to_dict(),
+    }, status_code=409, headers={'ETag': f'"{state.version}"'})
+
+
+def _live_write(match_id, write, idempotency):
+    """Run write(state, claim) with the same live state and checkpoints as the Flask workers.
+
+    Returns (response, tournament_id of a committed change or None). The state,
+    just rebuilt from the checkpoint and every event, is checkpointed right
+    away even if a Flask worker holds the lease (the async reads above use the
+    match row; that worker reloads at its next checkpoint) and is not kept.
+    """
+    with _flask_app.app_context(), activate(tenant_for_match(match_id)):
+        try:
+            state = live_state.registry.get(match_id)
+            if state is None:
+                return JSONResponse({'error': 'Match not found'}, status_code=404), None
+            claim = _claim(idempotency)
+            try:
+                response = write(state, claim)
+            except IntegrityError:
+                # Même clé envoyée en parallèle : l'autre requête a déjà appliqué l'événement
+                db.session.rollback()
+                return None, None
+            except live_state.InvalidEvent as error:
+                _release(idempotency)
+                return JSONResponse({'error': str(error)}, status_code=409), None
+            except Exception:
+                _release(idempotency)
+                raise
+            if response.status_code != 200:
+                _release(idempotency)
+                return response, None
+            return response, state.tournament_id
+        finally:
+            live_state.registry.discard(match_id)
+            db.session.remove()
+
+
+def _expected_mismatch(state, request, data):
+    expected = _expected_version(request, data)
+    return expected is not None and expected != state.version
+
+
+@admit('critical')
+async def update_score(request):
+    match_id = request.path_params['id']
+    body = await request.body()
+    data = _json_body(body)
+    if data is None:
+        return JSONResponse({'error': 'The body must be a JSON object'}, status_code=400)
+    team = data.get('team')  # 'home' or 'away'
+    if team not in ('home', 'away'):
+        return JSONResponse({'error': 'Invalid team'}, status_code=400)
+    minute = data.get('minute')
+    if minute is not None and (type(minute) is not int or not 0 <= minute <= live_state.MAX_MINUTE):
+        return JSONResponse({'error': f'minute must be an integer between 0 and {live_state.MAX_MINUTE}'},
+                            status_code=400)
+    denied = await _authorize(request, match_id)
+    if denied is not None:
+        return denied
+
+    def record_goal(state, claim):
+        if _expected_mismatch(state, request, data):
+            return _state_conflict(state)
+        if state.status != 'in_progress':
+            return JSONResponse({'error': 'The match is not in progress'}, status_code=409)
+        # Sans minute fournie : horloge du match depuis le coup d'envoi
+        live_state.record_event(match_id, 'goal', team=team, minute=minute)
+        state.checkpoint(release=True, force=True)
+        payload = state.to_dict()
+        payload['updates'] = payload['updates'][:1]
+        _store(claim, payload)
+        return JSONResponse(payload)
+
+    return await _write(request, match_id, body, record_goal)
+
+
+async def _write(request, match_id, body, write):
+    idempotency = _idempotency(request, body)
+    replay = await _replay(idempotency)
+    if replay is not None:
+        return replay
+    response, tournament_id = await run_in_threadpool(_live_write, match_id, write, idempotency)
+    if response is None:
+        return await _replay(idempotency) or JSONResponse({'error': 'Conflict'}, status_code=409)
+    if tournament_id is not None:
+        # Commit hors des workers Flask : leurs écouteurs du modèle de lecture ne le voient pas
+        readmodel.mark_stale([tournament_id], READMODEL_DIR)
+        hub.notify(match_id)
+    return response
+
+
+@admit('critical')
+async def start_match(request):
+    match_id = request.path_params['id']
+    denied = await _authorize(request, match_id)
+    if denied is not None:
+        return denied
+    body = await request.body()
+    data = _json_body(body)
+    if data is None:
+        return JSONResponse({'error': 'The body must be a JSON object'}, status_code=400)
+
+    def kickoff(state, claim):
+        if state.status != 'in_progress':
+            if _expected_mismatch(state, request, data):
+                return _state_conflict(state)
+            live_state.record_event(match_id, 'kickoff', minute=0)
+            state.checkpoint(release=True, force=True)
+        payload = {'status': 'success', 'match_status': state.status, 'version': state.version}
+        _store(claim, payload)
+        return JSONResponse(payload)
+
+    return await _write(request, match_id, body, kickoff)
+
+
+@admit('critical')
+async def end_match(request):
+    match_id = request.path_params['id']
+    denied = await _authorize(request, match_id)
+    if denied is not None:
+        return denied
+    body = await request.body()
+    data = _json_body(body)
+    if data is None:
+        return JSONResponse({'error': 'The body must be a JSON object'}, status_code=400)
+
+    def final_whistle(state, claim):
+        if state.status != 'completed':
+            if _expected_mismatch(state, request, data):
+                return _state_conflict(state)
+            # Même fin de match que routes.api_end_match : checkpoint forcé, puis index et notes
+            if live_state.finish(match_id) is None:
+                return JSONResponse({'error': 'Match not found'}, status_code=404)
+            match = db.session.get(Match, match_id)
+            matchups.record_result(match)
+            ratings.rate_match(match_id)
+            db.session.commit()
+        match = db.session.get(Match, match_id)
+        payload = {'status': 'success', 'match_status': match.status, 'version': match.version_id}
+        _store(claim, payload)
+        return JSONResponse(payload)
+
+    return await _write(request, match_id, body, final_whistle)
+
+
+routes = [
+    Route('/live/matches/{id:int}', live_match_data),
+    Route('/live/matches/{id:int}/stream', live_match_stream),
+    Route('/live/matches/{id:int}/score', update_score, methods=['POST']),
+    Route('/live/matches/{id:int}/start', start_match, methods=['POST']),
+    Route('/live/matches/{id:int}/end', end_match, methods=['POST']),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(routes=routes, lifespan=lifespan)
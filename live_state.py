@@ -0,0 +1,783 @@
+"""État en mémoire des matchs en direct, avec checkpoints périodiques.
+
+Chaque événement (but, carton, remplacement, tir, corner, faute, possession)
+n'écrit plus qu'une ligne dans match_event : le score, les statistiques du
+match, les minutes jouées et is_playing des joueurs sont tenus à jour dans un
+LiveMatchState, en mémoire du worker. Un thread écrit l'état dans Match,
+MatchStats et PlayerMatchPerformance (avec une copie JSON dans
+live_checkpoint) toutes les LIVE_CHECKPOINT_SECONDS secondes, et
+immédiatement au coup de sifflet final.
+
+match_event reste la source de vérité : un état est toujours le dernier
+checkpoint plus les événements suivants, rejoués dans l'ordre des id. Après
+un crash, le worker suivant recharge le checkpoint et rejoue ce qui manque ;
+un worker qui reçoit un événement écrit par un autre le rattrape de même.
+Le premier événement d'un match écrit aussi, dans sa transaction, un
+checkpoint de base (l'état tiré des lignes avant lui) : sans checkpoint, les
+lignes Match, MatchStats et PlayerMatchPerformance font foi.
+Les id sont attribués avant le commit : deux transactions concurrentes
+peuvent être visibles dans le désordre. Le rattrapage relit donc une fenêtre
+glissante (les LIVE_REPLAY_WINDOW derniers événements appliqués, dont les id
+sont gardés dans l'état et le checkpoint) et saute ce qui est déjà appliqué.
+
+Les titulaires sont ceux que la feuille de match (POST /api/matches/<id>/squad)
+marque is_starter ; sans eux, personne n'entre sur le terrain au coup d'envoi.
+Un seul worker à la fois (bail dans live_checkpoint) écrit les checkpoints ;
+répartir les matchs par identifiant au niveau du load balancer évite les
+rattrapages.
+
+    flask add-live-columns        # bases créées avant related_player_id et is_starter
+    flask recover-live-matches    # rejoue et checkpointe les matchs en cours
+"""
+import os
+import time
+import socket
+import logging
+import threading
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import jsonify
+from sqlalchemy import select, update, delete, func, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Match, MatchEvent, MatchStats, PlayerMatchPerformance, Player, Team, LiveCheckpoint
+from tenancy import use_tenant, fan_out
+import queries
+import outbox
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_INTERVAL = float(os.environ.get('LIVE_CHECKPOINT_SECONDS', '5'))
+LEASE = timedelta(seconds=float(os.environ.get('LIVE_LEASE_SECONDS', '30')))
+IDLE_EVICTION = float(os.environ.get('LIVE_IDLE_SECONDS', '600'))
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'[:100]
+RECENT_EVENTS = 10
+REPLAY_WINDOW = int(os.environ.get('LIVE_REPLAY_WINDOW', '100'))
+STARTERS = 11
+MAX_MINUTE = 130  # prolongations et temps additionnel compris
+
+# Compteurs de MatchStats, côté domicile puis extérieur : home_shots, away_shots, home_shots_on_target...
+STAT_FIELDS = ('shots', 'shots_on_target', 'corners', 'fouls', 'yellow_cards', 'red_cards')
+SHOTS, ON_TARGET, CORNERS, FOULS, YELLOWS, REDS = (2 * index for index in range(len(STAT_FIELDS)))
+SIDES = ('home', 'away')
+
+EVENT_TYPES = ('kickoff', 'goal', 'own_goal', 'yellow_card', 'red_card', 'substitution', 'shot',
+               'shot_on_target', 'corner', 'foul', 'possession', 'final_whistle')
+EVENT_DESCRIPTIONS = {
+    'kickoff': '🟢 Le match commence !',
+    'goal': '⚽ BUT ! {team} marque !',
+    'own_goal': '⚽ But contre son camp de {team} !',
+    'yellow_card': '🟨 Carton jaune pour {player}',
+    'red_card': '🟥 Carton rouge pour {player}',
+    'substitution': '🔁 {player} remplace {related}',
+    'final_whistle': '🔴 Fin du match !',
+}
+
+
+# Valeurs d'un événement fraîchement écrit, pour l'appliquer sans relire la ligne
+EventRow = namedtuple('EventRow', ['id', 'minute', 'event_type', 'team_id', 'player_id', 'related_player_id',
+                                   'description', 'timestamp'])
+
+
+class InvalidEvent(ValueError):
+    pass
+
+
+class PlayerLine:
+    """Feuille de match d'un joueur : compteurs du match et entrée sur le terrain"""
+    __slots__ = ('team_id', 'name', 'goals', 'assists', 'yellow_cards', 'red_cards', 'shots',
+                 'shots_on_target', 'minutes', 'on_since', 'selected', 'dirty')
+    COUNTERS = ('goals', 'assists', 'yellow_cards', 'red_cards', 'shots', 'shots_on_target')
+
+    def __init__(self, team_id, name, selected=False):
+        self.team_id = team_id
+        self.name = name
+        self.goals = self.assists = self.yellow_cards = self.red_cards = 0
+        self.shots = self.shots_on_target = self.minutes = 0
+        self.on_since = None  # minute d'entrée, None hors du terrain
+        self.selected = selected
+        self.dirty = False
+
+    def enter(self, minute):
+        if self.on_since is None:
+            self.on_since = minute
+            self.dirty = True
+
+    def leave(self, minute):
+        if self.on_since is not None:
+            self.minutes += max(0, minute - self.on_since)
+            self.on_since = None
+            self.dirty = True
+
+    def minutes_at(self, minute):
+        return self.minutes + (max(0, minute - self.on_since) if self.on_since is not None else 0)
+
+    def to_state(self):
+        return [getattr(self, field) for field in self.COUNTERS] + [self.minutes, self.on_since, self.selected]
+
+    def load_state(self, values):
+        *counters, self.minutes, self.on_since, self.selected = values
+        for field, value in zip(self.COUNTERS, counters):
+            setattr(self, field, value)
+
+
+class LiveMatchState:
+    """Score, statistiques et feuilles de match d'un match en direct, repliés depuis match_event"""
+    __slots__ = ('match_id', 'tournament_id', 'team_ids', 'team_names', 'status', 'score', 'stats',
+                 'possession', 'possession_side', 'possession_since', 'kickoff_at', 'minute', 'players',
+                 'version', 'last_event_id', 'replay_from', 'applied', 'recent', 'checkpointed_version',
+                 'checkpointed_at', 'accessed_at', 'dirty', 'lock')
+
+    def __init__(self, match):
+        self.match_id = match.id
+        self.tournament_id = match.tournament_id
+        self.team_ids = (match.home_team_id, match.away_team_id)
+        self.team_names = {}
+        self.status = match.status
+        self.score = [match.home_score or 0, match.away_score or 0]
+        self.stats = [0] * (2 * len(STAT_FIELDS))
+        self.possession = [0.0, 0.0]  # secondes de possession
+        self.possession_side = None
+        self.possession_since = None
+        self.kickoff_at = None
+        self.minute = 0
+        self.players = {}
+        self.version = match.version_id
+        self.last_event_id = 0
+        # Événements d'id <= replay_from compris dans l'état, plus ceux de `applied` (fenêtre de rattrapage)
+        self.replay_from = 0
+        self.applied = deque(maxlen=REPLAY_WINDOW)
+        self.recent = deque(maxlen=RECENT_EVENTS)
+        self.checkpointed_version = match.version_id
+        self.checkpointed_at = time.monotonic()
+        self.accessed_at = time.monotonic()
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    # -- chargement --------------------------------------------------------
+
+    @classmethod
+    def load(cls, match_id):
+        """Last checkpoint (or the current rows) plus the events written since"""
+        match = db.session.get(Match, match_id)
+        if match is None:
+            return None
+        state = cls(match)
+        state.team_names = dict(db.session.execute(select(Team.id, Team.name).where(Team.id.in_(state.team_ids))).all())
+        for player_id, team_id, name in db.session.execute(
+            select(Player.id, Player.team_id, Player.name).where(Player.team_id.in_(state.team_ids))
+        ):
+            state.players[player_id] = PlayerLine(team_id, name)
+
+        checkpoint = db.session.get(LiveCheckpoint, match_id)
+        if checkpoint is not None:
+            state.load_state(checkpoint.state)
+            # La ligne match a pu être modifiée hors du direct depuis : la version ne recule jamais
+            state.version = max(checkpoint.version, match.version_id)
+            state.last_event_id = checkpoint.last_event_id
+            # Checkpoints écrits avant la fenêtre de rattrapage : tout ce qui précède last_event_id est compris
+            state.replay_from = checkpoint.state.get('replay_from', checkpoint.last_event_id)
+            state.applied.extend(checkpoint.state.get('applied', ()))
+        else:
+            state._load_rows()
+        # Ce qui a été checkpointé correspond à la ligne match actuelle
+        state.checkpointed_version = match.version_id
+        caught_up = state.catch_up()
+        state.recent.extend(reversed(state.recent_events(RECENT_EVENTS)))
+        state.dirty = checkpoint is None or bool(caught_up)
+        return state
+
+    def _load_rows(self):
+        """No checkpoint: no live event was recorded since these rows were last written (see record_event)"""
+        last = db.session.execute(
+            select(func.max(MatchEvent.id), func.max(MatchEvent.minute)).where(MatchEvent.match_id == self.match_id)
+        ).one()
+        self.last_event_id, self.minute = last[0] or 0, last[1] or 0
+        self.replay_from = self.last_event_id
+        self.kickoff_at = db.session.scalar(
+            select(MatchEvent.timestamp).where(MatchEvent.match_id == self.match_id, MatchEvent.event_type == 'kickoff')
+            .order_by(MatchEvent.timestamp.desc(), MatchEvent.id.desc()).limit(1)
+        )
+        stats = db.session.scalar(select(MatchStats).filter_by(match_id=self.match_id))
+        if stats is not None:
+            for index in range(len(self.stats)):
+                self.stats[index] = getattr(stats, self._stat_column(index)) or 0
+            self.possession = [float(stats.home_possession or 50), float(stats.away_possession or 50)]
+        for performance in db.session.scalars(select(PlayerMatchPerformance).filter_by(match_id=self.match_id)):
+            line = self.players.get(performance.player_id)
+            if line is None:
+                continue
+            for field in PlayerLine.COUNTERS:
+                setattr(line, field, getattr(performance, field) or 0)
+            line.selected = bool(performance.is_selected)
+            if performance.is_playing:
+                # minutes_played d'un joueur sur le terrain compte jusqu'à la minute courante
+                line.on_since = max(0, self.minute - (performance.minutes_played or 0))
+            else:
+                line.minutes = performance.minutes_played or 0
+
+    def to_state(self):
+        return {
+            'status': self.status,
+            'score': self.score,
+            'stats': self.stats,
+            'possession': self.possession,
+            'possession_side': self.possession_side,
+            'possession_since': self.possession_since.isoformat() if self.possession_since else None,
+            'kickoff_at': self.kickoff_at.isoformat() if self.kickoff_at else None,
+            'minute': self.minute,
+            'players': {str(player_id): line.to_state() for player_id, line in self.players.items()
+                        if line.selected or line.on_since is not None or line.minutes
+                        or any(getattr(line, field) for field in PlayerLine.COUNTERS)},
+            'replay_from': self.replay_from,
+            'applied': list(self.applied),
+        }
+
+    def load_state(self, state):
+        self.status = state['status']
+        self.score = list(state['score'])
+        self.stats = list(state['stats'])
+        self.possession = list(state['possession'])
+        self.possession_side = state['possession_side']
+        self.possession_since = _parse_datetime(state['possession_since'])
+        self.kickoff_at = _parse_datetime(state['kickoff_at'])
+        self.minute = state['minute']
+        for player_id, values in state['players'].items():
+            line = self.players.get(int(player_id))
+            if line is not None:
+                line.load_state(values)
+
+    # -- événements --------------------------------------------------------
+
+    def side(self, team_id):
+        return self.team_ids.index(team_id) if team_id in self.team_ids else None
+
+    def clock(self):
+        """Current match minute, from the kickoff time when known"""
+        if self.kickoff_at is not None and self.status == 'in_progress':
+            elapsed = int((datetime.utcnow() - self.kickoff_at).total_seconds() // 60) + 1
+            return max(self.minute, min(elapsed, MAX_MINUTE))
+        return self.minute
+
+    def catch_up(self, before=None):
+        """Apply the events of this match not applied yet (written by any worker, committed in any order)"""
+        stmt = select(MatchEvent.id, MatchEvent.minute, MatchEvent.event_type, MatchEvent.team_id,
+                      MatchEvent.player_id, MatchEvent.related_player_id, MatchEvent.description,
+                      MatchEvent.timestamp) \
+            .where(MatchEvent.match_id == self.match_id, MatchEvent.id > self.replay_from).order_by(MatchEvent.id)
+        if before is not None:
+            stmt = stmt.where(MatchEvent.id < before)
+        applied = 0
+        for event in db.session.execute(stmt):
+            if event.id in self.applied:
+                continue
+            self.apply(event)
+            applied += 1
+        return applied
+
+    def apply(self, event):
+        """Fold one match_event row (or MatchEvent) into the state"""
+        # Une minute invalide déjà en base (avant la validation de record_event) ne bloque pas le rejeu
+        minute = event.minute if _valid_minute(event.minute) else self.minute
+        self.minute = max(self.minute, minute)
+        side = self.side(event.team_id)
+        scorer = self.players.get(event.player_id)
+        related = self.players.get(event.related_player_id)
+        kind = event.event_type
+
+        if kind == 'kickoff':
+            self.status = 'in_progress'
+            self.kickoff_at = event.timestamp
+            self._start_lineups(minute)
+        elif kind in ('goal', 'own_goal') and side is not None:
+            self.score[side if kind == 'goal' else 1 - side] += 1
+            if kind == 'goal':
+                self.stats[SHOTS + side] += 1
+                self.stats[ON_TARGET + side] += 1
+                if scorer:
+                    scorer.goals += 1
+                    scorer.shots += 1
+                    scorer.shots_on_target += 1
+                    scorer.dirty = True
+                if related:
+                    related.assists += 1
+                    related.dirty = True
+        elif kind in ('shot', 'shot_on_target') and side is not None:
+            self.stats[SHOTS + side] += 1
+            if kind == 'shot_on_target':
+                self.stats[ON_TARGET + side] += 1
+            if scorer:
+                scorer.shots += 1
+                scorer.shots_on_target += kind == 'shot_on_target'
+                scorer.dirty = True
+        elif kind in ('corner', 'foul') and side is not None:
+            self.stats[(CORNERS if kind == 'corner' else FOULS) + side] += 1
+        elif kind in ('yellow_card', 'red_card') and side is not None:
+            second_yellow = kind == 'yellow_card' and scorer is not None and scorer.yellow_cards >= 1
+            self.stats[(YELLOWS if kind == 'yellow_card' else REDS) + side] += 1
+            if second_yellow:
+                self.stats[REDS + side] += 1
+            if scorer:
+                if kind == 'yellow_card':
+                    scorer.yellow_cards += 1
+                if kind == 'red_card' or second_yellow:
+                    scorer.red_cards += 1
+                    scorer.leave(minute)
+                scorer.dirty = True
+        elif kind == 'substitution':
+            if related:
+                related.leave(minute)
+            if scorer:
+                scorer.enter(minute)
+        elif kind == 'possession' and side is not None:
+            self._close_possession(event.timestamp)
+            self.possession_side = side
+        elif kind == 'final_whistle':
+            self.status = 'completed'
+            self._close_possession(event.timestamp)
+            for line in self.players.values():
+                line.leave(minute)
+
+        if len(self.applied) == self.applied.maxlen:
+            # L'id qui sort de la fenêtre n'est plus rejoué : le plancher monte jusqu'à lui
+            self.replay_from = max(self.replay_from, self.applied[0])
+        self.applied.append(event.id)
+        self.last_event_id = max(self.last_event_id, event.id)
+        self.version += 1
+        self.dirty = True
+
+    def _start_lineups(self, minute):
+        """Players flagged is_playing, else the starting XI recorded with the squad (nobody without one)"""
+        if any(line.on_since is not None for line in self.players.values()):
+            return
+        starters = db.session.scalars(select(PlayerMatchPerformance.player_id).where(
+            PlayerMatchPerformance.match_id == self.match_id, PlayerMatchPerformance.is_starter.is_(True))).all()
+        for player_id in starters:
+            line = self.players.get(player_id)
+            if line is not None:
+                line.selected = True
+                line.enter(minute)
+
+    def _close_possession(self, at):
+        if self.possession_side is not None and self.possession_since is not None and at is not None:
+            self.possession[self.possession_side] += max(0.0, (at - self.possession_since).total_seconds())
+        self.possession_since = at
+
+    def possession_percent(self):
+        possession = list(self.possession)
+        if self.possession_side is not None and self.possession_since is not None and self.status == 'in_progress':
+            possession[self.possession_side] += max(0.0, (datetime.utcnow() - self.possession_since).total_seconds())
+        total = sum(possession)
+        if not total:
+            return 50, 50
+        home = round(100 * possession[0] / total)
+        return home, 100 - home
+
+    def describe(self, kind, team_id, player_id, related_player_id):
+        template = EVENT_DESCRIPTIONS.get(kind)
+        if template is None:
+            return None
+        player, related = self.players.get(player_id), self.players.get(related_player_id)
+        return template.format(team=self.team_names.get(team_id, ''), player=player.name if player else '',
+                               related=related.name if related else '')
+
+    def recent_events(self, limit):
+        """Latest events from match_event, names taken from the cached lineups"""
+        return queries.live_events(self.match_id, limit, team_names=self.team_names,
+                                   player_names={player_id: line.name for player_id, line in self.players.items()})
+
+    def event_dict(self, event):
+        player, team = self.players.get(event.player_id), self.team_names.get(event.team_id)
+        return {
+            'id': event.id,
+            'minute': event.minute,
+            'type': event.event_type,
+            'team': team,
+            'player': player.name if player else None,
+            'description': event.description,
+            'timestamp': event.timestamp.isoformat(),
+            'text': event.description,
+            'time': event.timestamp.strftime('%H:%M')
+        }
+
+    # -- lecture -----------------------------------------------------------
+
+    @staticmethod
+    def _stat_column(index):
+        return f'{SIDES[index % 2]}_{STAT_FIELDS[index // 2]}'
+
+    def stats_dict(self):
+        home_possession, away_possession = self.possession_percent()
+        stats = self.stats
+        return {
+            'possession': {'home': home_possession, 'away': away_possession},
+            'shots': {'home': stats[SHOTS], 'away': stats[SHOTS + 1]},
+            'shots_on_target': {'home': stats[ON_TARGET], 'away': stats[ON_TARGET + 1]},
+            'corners': {'home': stats[CORNERS], 'away': stats[CORNERS + 1]},
+            'fouls': {'home': stats[FOULS], 'away': stats[FOULS + 1]},
+            'cards': {
+                'home_yellow': stats[YELLOWS],
+                'away_yellow': stats[YELLOWS + 1],
+                'home_red': stats[REDS],
+                'away_red': stats[REDS + 1]
+            }
+        }
+
+    def to_dict(self):
+        """Same payload as api_live_match_data"""
+        return {
+            'home_score': self.score[0],
+            'away_score': self.score[1],
+            'status': self.status,
+            'version': self.version,
+            'minute': self.clock(),
+            'updates': list(self.recent)[::-1],
+            'stats': self.stats_dict()
+        }
+
+    # -- checkpoint --------------------------------------------------------
+
+    def _acquire_lease(self, now, force=False):
+        """Take or renew the checkpoint lease; False when another live worker holds it"""
+        checkpoint = db.session.get(LiveCheckpoint, self.match_id)
+        if checkpoint is None:
+            db.session.add(LiveCheckpoint(match_id=self.match_id, version=self.version, state={},
+                                          owner=WORKER_ID, lease_until=now + LEASE))
+            return True
+        held_elsewhere = checkpoint.owner not in (None, WORKER_ID) and checkpoint.lease_until and \
+            checkpoint.lease_until > now
+        if held_elsewhere and not force:
+            return False
+        # Un autre worker a checkpointé entre-temps : l'état en mémoire est en retard
+        if checkpoint.last_event_id > self.last_event_id:
+            self.catch_up()
+        checkpoint.owner, checkpoint.lease_until = WORKER_ID, now + LEASE
+        return True
+
+    def checkpoint(self, release=False, force=False):
+        """Write the state to Match, MatchStats, PlayerMatchPerformance and live_checkpoint.
+
+        Returns True once written, None when another worker holds the lease
+        (unless `force`), False when the match row was changed outside the
+        live path: the state must then be reloaded.
+        """
+        with self.lock, use_tenant(self.tournament_id):
+            now = datetime.utcnow()
+            if not self._acquire_lease(now, force):
+                db.session.rollback()
+                return None
+            written = db.session.execute(
+                update(Match.__table__)
+                .where(Match.__table__.c.id == self.match_id, Match.__table__.c.version_id == self.checkpointed_version)
+                .values(home_score=self.score[0], away_score=self.score[1], status=self.status, version_id=self.version)
+            ).rowcount
+            if not written:
+                db.session.rollback()
+                return False
+
+            stats = db.session.scalar(select(MatchStats).filter_by(match_id=self.match_id))
+            if stats is None:
+                stats = MatchStats(match_id=self.match_id)
+                db.session.add(stats)
+            for index, value in enumerate(self.stats):
+                setattr(stats, self._stat_column(index), value)
+            stats.home_possession, stats.away_possession = self.possession_percent()
+
+            minute = self.clock()
+            performances = {performance.player_id: performance for performance in db.session.scalars(
+                select(PlayerMatchPerformance).filter_by(match_id=self.match_id))}
+            for player_id, line in self.players.items():
+                if not (line.dirty or line.on_since is not None):
+                    continue
+                performance = performances.get(player_id)
+                if performance is None:
+                    performance = PlayerMatchPerformance(player_id=player_id, match_id=self.match_id,
+                                                         is_selected=line.selected)
+                    db.session.add(performance)
+                for field in PlayerLine.COUNTERS:
+                    setattr(performance, field, getattr(line, field))
+                performance.minutes_played = line.minutes_at(minute)
+                performance.is_playing = line.on_since is not None
+
+            checkpoint = db.session.get(LiveCheckpoint, self.match_id)
+            checkpoint.state = self.to_state()
+            checkpoint.version = self.version
+            checkpoint.last_event_id = self.last_event_id
+            if release:
+                checkpoint.owner = checkpoint.lease_until = None
+            db.session.commit()
+
+            for line in self.players.values():
+                line.dirty = False
+            self.checkpointed_version = self.version
+            self.checkpointed_at = time.monotonic()
+            self.dirty = False
+            return True
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _valid_minute(minute):
+    return isinstance(minute, int) and not isinstance(minute, bool) and 0 <= minute <= MAX_MINUTE
+
+
+class LiveRegistry:
+    """States of the live matches handled by this worker, and their checkpointer thread"""
+
+    def __init__(self):
+        self.states = {}
+        self.lock = threading.Lock()
+        self.app = None
+        self.thread = None
+
+    def peek(self, match_id):
+        return self.states.get(match_id)
+
+    def get(self, match_id):
+        state = self.states.get(match_id)
+        if state is None:
+            with self.lock:
+                state = self.states.get(match_id)
+                if state is None:
+                    state = LiveMatchState.load(match_id)
+                    if state is None:
+                        return None
+                    self.states[match_id] = state
+            self._start_checkpointer()
+        state.accessed_at = time.monotonic()
+        return state
+
+    def discard(self, match_id):
+        self.states.pop(match_id, None)
+
+    def _start_checkpointer(self):
+        if self.app is None or (self.thread is not None and self.thread.is_alive()):
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='live-checkpointer', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(CHECKPOINT_INTERVAL)
+            with self.app.app_context():
+                self.checkpoint_all()
+
+    def checkpoint_all(self, force=False):
+        """Checkpoint dirty states; evict idle and finished ones"""
+        done = 0
+        for match_id, state in list(self.states.items()):
+            try:
+                due = time.monotonic() - state.checkpointed_at >= CHECKPOINT_INTERVAL
+                if state.dirty and (due or force):
+                    written = state.checkpoint()
+                    if written is False:
+                        # Match modifié hors du direct : recharger au prochain accès
+                        self.discard(match_id)
+                        continue
+                    done += bool(written)
+                idle = time.monotonic() - state.accessed_at > IDLE_EVICTION
+                if not state.dirty and (idle or state.status == 'completed'):
+                    self.discard(match_id)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Live checkpoint failed for match %s', match_id)
+            finally:
+                db.session.remove()
+        return done
+
+
+registry = LiveRegistry()
+
+
+def record_event(match_id, event_type, team=None, player_id=None, related_player_id=None, minute=None,
+                 description=None):
+    """Append an event to match_event and apply it to the live state.
+
+    `team` is 'home', 'away' or a team id. Returns the state, or None when the
+    match does not exist. Raises InvalidEvent for inconsistent events.
+    """
+    if event_type not in EVENT_TYPES:
+        raise InvalidEvent(f'Unknown event type {event_type!r}')
+    if minute is not None and not _valid_minute(minute):
+        raise InvalidEvent(f'minute must be an integer between 0 and {MAX_MINUTE}')
+    state = registry.get(match_id)
+    if state is None:
+        return None
+    with state.lock:
+        # Valider contre l'état à jour : un autre worker a pu siffler la fin ou faire un remplacement
+        if state.catch_up():
+            state.recent.clear()
+            state.recent.extend(reversed(state.recent_events(RECENT_EVENTS)))
+        team_id = state.team_ids[SIDES.index(team)] if team in SIDES else team
+        if team_id is not None and state.side(team_id) is None:
+            raise InvalidEvent('Team does not play this match')
+        for pid in (player_id, related_player_id):
+            if pid is not None and (pid not in state.players or
+                                    (team_id is not None and state.players[pid].team_id != team_id)):
+                raise InvalidEvent(f'Player {pid} does not play for this team')
+        if event_type == 'substitution':
+            if player_id is None or related_player_id is None:
+                raise InvalidEvent('A substitution needs player_id (on) and related_player_id (off)')
+            if state.players[related_player_id].on_since is None:
+                raise InvalidEvent('The substituted player is not on the pitch')
+        if state.status == 'completed' and event_type != 'final_whistle':
+            raise InvalidEvent('The match is over')
+        if state.status == 'scheduled' and event_type != 'kickoff':
+            raise InvalidEvent('The match has not started')
+
+        if db.session.get(LiveCheckpoint, match_id) is None:
+            _write_baseline(state)
+        event = MatchEvent(
+            match_id=match_id,
+            minute=minute if minute is not None else state.clock(),
+            event_type=event_type,
+            team_id=team_id,
+            player_id=player_id,
+            related_player_id=related_player_id,
+            description=description or state.describe(event_type, team_id, player_id, related_player_id)
+        )
+        db.session.add(event)
+        db.session.flush()
+        row = EventRow(*(getattr(event, field) for field in EventRow._fields))
+        # Notification aux clubs dans la même transaction que l'événement
+        score = list(state.score)
+        side = state.side(team_id)
+        if event_type in ('goal', 'own_goal') and side is not None:
+            score[side if event_type == 'goal' else 1 - side] += 1
+        outbox.publish_event(event, state.tournament_id, state.team_ids, score)
+        db.session.commit()
+        # Événements écrits par d'autres workers depuis le dernier appliqué
+        if state.catch_up(before=row.id):
+            state.recent.clear()
+            state.recent.extend(reversed(state.recent_events(RECENT_EVENTS - 1)))
+        state.apply(row)
+        state.recent.append(state.event_dict(row))
+        return state
+
+
+def _write_baseline(state):
+    """Checkpoint of the state before the first live event, in the event's transaction.
+
+    Without it a reload would take the rows (not yet checkpointed) as the
+    whole state and skip the events recorded since.
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.add(LiveCheckpoint(match_id=state.match_id, version=state.version, state=state.to_state(),
+                                          last_event_id=state.last_event_id))
+    except IntegrityError:
+        # Écrit entre-temps par un autre worker
+        pass
+
+
+def current(match_id):
+    """Live state of a match, caught up with events written by other workers"""
+    state = registry.get(match_id)
+    if state is not None and state.status != 'completed':
+        with state.lock:
+            if state.catch_up():
+                state.recent.clear()
+                state.recent.extend(reversed(state.recent_events(RECENT_EVENTS)))
+    return state
+
+
+def finish(match_id):
+    """Record the final whistle and checkpoint right away, releasing the match.
+
+    Returns None when the match does not exist; raises InvalidEvent when it
+    has not kicked off.
+    """
+    state = registry.get(match_id)
+    if state is None:
+        return None
+    record_event(match_id, 'final_whistle', minute=max(90, state.clock()))
+    # Le match est terminé : ce worker écrit l'état final même s'il n'avait pas le bail
+    if state.checkpoint(release=True, force=True) is False:
+        registry.discard(match_id)
+        state = registry.get(match_id)
+        if state is None:
+            return None
+        state.checkpoint(release=True, force=True)
+    registry.discard(match_id)
+    return state
+
+
+def reset(match_id):
+    """Forget the live state after the match row was edited directly (admin score form)"""
+    registry.discard(match_id)
+    db.session.execute(delete(LiveCheckpoint).where(LiveCheckpoint.match_id == match_id))
+    db.session.commit()
+
+
+def conflict_response(state):
+    response = jsonify({
+        'error': 'conflict',
+        'message': 'This match was modified by someone else. Reload it and try again.',
+        'version': state.version,
+        'current': state.to_dict(),
+    })
+    response.status_code = 409
+    response.headers['ETag'] = f'"{state.version}"'
+    return response
+
+
+LIVE_COLUMNS = (
+    ('match_event', 'related_player_id', 'INTEGER'),
+    ('archived_match_event', 'related_player_id', 'INTEGER'),
+    ('player_match_performance', 'is_starter', 'BOOLEAN DEFAULT FALSE'),
+    ('archived_player_match_performance', 'is_starter', 'BOOLEAN DEFAULT FALSE'),
+)
+
+
+def ensure_schema():
+    """ALTER TABLE ... ADD COLUMN for the live columns missing from databases created before them"""
+    added = []
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        for table, column, ddl in LIVE_COLUMNS:
+            if table in tables and column not in {existing['name'] for existing in inspector.get_columns(table)}:
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+                added.append(f'{table}.{column}')
+    return added
+
+
+def recover():
+    """Replay and checkpoint every match in progress, e.g. after a worker crash"""
+    recovered = []
+    in_progress = fan_out(lambda: db.session.execute(
+        select(Match.id, Match.tournament_id).where(Match.status == 'in_progress').order_by(Match.id)
+    ).all(), key=lambda row: row.id)
+    for match_id, tournament_id in in_progress:
+        with use_tenant(tournament_id):
+            state = registry.get(match_id)
+            if state is not None and state.checkpoint():
+                recovered.append(match_id)
+    return recovered
+
+
+def init_app(app):
+    registry.app = app
+
+    @app.cli.command('add-live-columns')
+    def add_live_columns_command():
+        """Add match_event.related_player_id and player_match_performance.is_starter."""
+        added = ensure_schema()
+        print(f'Columns added: {", ".join(added) or "nothing (already present)"}')
+
+    @app.cli.command('recover-live-matches')
+    @click.option('--release/--keep', default=True, help='Release the checkpoint leases afterwards.')
+    def recover_live_matches_command(release):
+        """Replay the events of live matches since their last checkpoint."""
+        recovered = recover()
+        if release:
+            for match_id in recovered:
+                registry.peek(match_id).checkpoint(release=True)
+        print(f'{len(recovered)} live match(es) checkpointed: {", ".join(map(str, recovered)) or "-"}')
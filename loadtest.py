@@ -0,0 +1,341 @@
+"""Test de charge d'un jour de match contre une instance en cours d'exécution.
+
+1. Générer un jeu de données local (tournoi, équipes, effectifs, matchs en
+   direct et à venir, comptes spectateurs, arbitres, entraîneurs et
+   administrateurs avec un mot de passe commun) dans la base de l'instance :
+
+       python loadtest.py seed --database sqlite:///instance/football_tournament.db [--teams 16]
+
+   Le manifeste (identifiants des matchs, comptes) est écrit dans loadtest.json.
+
+2. Lancer le mélange de trafic, chaque utilisateur virtuel se connectant
+   d'abord par /login :
+
+       python loadtest.py run --base-url http://localhost:5000 --duration 60 \\
+           --spectators 500 --referees 4 --coaches 8 --admins 2
+
+   - spectateurs : GET /api/matches/<id>/live toutes les --poll-interval s
+   - arbitres    : POST /api/matches/<id>/score (avec Idempotency-Key)
+   - entraîneurs : POST /api/matches/<id>/squad (select_players_for_match)
+   - admins      : GET /tournaments/<id>/standings
+
+Le rapport donne par action le débit, les latences (p50/p90/p99/max), les
+réponses délestées (429/503) ou servies depuis un snapshot (X-Degraded) et
+les erreurs ; --report l'écrit aussi en JSON.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+MANIFEST = 'loadtest.json'
+PASSWORD = 'loadtest-password'
+ROLES = ('spectator', 'referee', 'coach', 'admin')
+SHED_STATUSES = (429, 503)
+
+
+# Jeu de données
+
+def seed(database, teams=16, players_per_team=23, live_matches=4, accounts=None):
+    """Create the dataset through the models and return the manifest"""
+    from flask import Flask
+    from werkzeug.security import generate_password_hash
+    from extensions import db
+    from models import User, Admin, Coach, Referee, Tournament, Team, Player, Match, MatchStats, TeamStats
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    db.init_app(app)
+    accounts = accounts or {}
+    tag = uuid.uuid4().hex[:6]
+    # Un seul hachage pour tous les comptes : générer des milliers de hachages prendrait des minutes
+    password_hash = generate_password_hash(PASSWORD)
+
+    with app.app_context():
+        db.create_all()
+        tournament = Tournament(name=f'Load test {tag}', start_date=date.today(), max_teams=teams, status='active')
+        db.session.add(tournament)
+        db.session.flush()
+
+        def account(model, role, index, **fields):
+            user = model(username=f'lt{tag}_{role}_{index}', email=f'lt{tag}_{role}_{index}@loadtest.invalid',
+                         first_name=role.title(), last_name=str(index), role=model.__mapper__.polymorphic_identity,
+                         password_hash=password_hash, **fields)
+            db.session.add(user)
+            return user
+
+        users = {role: [] for role in ROLES}
+        coaches = []
+        team_rows = []
+        for number in range(teams):
+            coach = account(Coach, 'coach', number)
+            team = Team(name=f'Load Test {tag} FC {number + 1}', city='Casablanca', tournament_id=tournament.id,
+                        coach=coach)
+            db.session.add(team)
+            team_rows.append(team)
+            coaches.append(coach)
+        db.session.flush()
+        positions = ['goalkeeper'] * 3 + ['defender'] * 8 + ['midfielder'] * 7 + ['forward'] * 5
+        squads = {}
+        for team in team_rows:
+            db.session.add(TeamStats(team_id=team.id))
+            players = [Player(name=f'{team.name} #{number + 1}', position=positions[number % len(positions)],
+                              jersey_number=number + 1, age=20 + number % 15, team_id=team.id)
+                       for number in range(players_per_team)]
+            db.session.add_all(players)
+            db.session.flush()
+            squads[team.id] = [player.id for player in players]
+
+        # Premières affiches en direct, le reste du calendrier à venir
+        now = datetime.utcnow()
+        fixtures = list(itertools.combinations(team_rows, 2))
+        live, scheduled = [], defaultdict(list)
+        for index, (home, away) in enumerate(fixtures):
+            in_progress = index < live_matches
+            match = Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id,
+                          match_date=now if in_progress else now + timedelta(days=1 + index // (teams // 2)),
+                          status='in_progress' if in_progress else 'scheduled', home_score=0, away_score=0)
+            db.session.add(match)
+            db.session.flush()
+            if in_progress:
+                db.session.add(MatchStats(match_id=match.id))
+                live.append(match.id)
+            else:
+                scheduled[home.id].append(match.id)
+                scheduled[away.id].append(match.id)
+
+        for role, model, fields in (('spectator', User, {}), ('referee', Referee, {'nationality': 'Moroccan'}),
+                                    ('admin', Admin, {})):
+            for index in range(accounts.get(role, 0)):
+                users[role].append(account(model, role, index, **fields).username)
+        users['coach'] = [coach.username for coach in coaches]
+        db.session.commit()
+
+        return {
+            'tournament_id': tournament.id,
+            'password': PASSWORD,
+            'live_matches': live,
+            'coaches': [
+                {'username': coach.username, 'team_id': team.id, 'players': squads[team.id],
+                 'matches': scheduled[team.id]}
+                for coach, team in zip(coaches, team_rows)
+            ],
+            'users': users,
+        }
+
+
+# Mesures
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, action, elapsed, outcome):
+        self.latencies[action].append(elapsed)
+        self.outcomes[action][outcome] += 1
+
+    async def call(self, action, request, ok=lambda response: response.status_code < 400):
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception as e:
+            self.record(action, time.perf_counter() - start, f'error:{type(e).__name__}')
+            return None
+        elapsed = time.perf_counter() - start
+        if response.status_code in SHED_STATUSES:
+            outcome = 'shed'
+        elif not ok(response):
+            outcome = f'error:{response.status_code}'
+        elif response.headers.get('X-Degraded'):
+            outcome = 'degraded'
+        else:
+            outcome = 'ok'
+        self.record(action, elapsed, outcome)
+        return response
+
+    def report(self):
+        duration = (self.finished or time.perf_counter()) - self.started
+        rows = {}
+        for action in sorted(self.latencies):
+            latencies = np.array(self.latencies[action]) * 1000
+            outcomes = self.outcomes[action]
+            errors = {key.split(':', 1)[1]: value for key, value in outcomes.items() if key.startswith('error:')}
+            p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+            rows[action] = {
+                'requests': len(latencies), 'ok': outcomes['ok'], 'degraded': outcomes['degraded'],
+                'shed': outcomes['shed'], 'errors': sum(errors.values()), 'error_kinds': errors,
+                'rps': len(latencies) / duration, 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+                'max_ms': latencies.max(),
+            }
+        return {'duration_s': duration, 'actions': rows}
+
+
+def print_report(report):
+    columns = ('requests', 'ok', 'degraded', 'shed', 'errors', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+    print(f'\n{report["duration_s"]:.1f}s')
+    print(f'{"action":<12}' + ''.join(f'{column:>10}' for column in columns))
+    for action, row in report['actions'].items():
+        cells = ''.join(f'{row[c]:>10.1f}' if isinstance(row[c], float) else f'{row[c]:>10}' for c in columns)
+        print(f'{action:<12}{cells}')
+        if row['error_kinds']:
+            print(f'{"":<12}errors: {row["error_kinds"]}')
+
+
+# Utilisateurs virtuels
+
+async def login(client, recorder, username, password):
+    # Connexion réussie : redirection vers autre chose que la page de connexion
+    response = await recorder.call('login', client.post('/login', data={'username': username, 'password': password}),
+                                   ok=lambda r: r.status_code == 302 and '/login' not in r.headers.get('Location', ''))
+    return response is not None and response.status_code == 302
+
+
+async def pause(seconds):
+    # ±20 % pour ne pas synchroniser tous les utilisateurs
+    await asyncio.sleep(seconds * random.uniform(0.8, 1.2))
+
+
+async def spectator(client, recorder, manifest, args, index, stop):
+    match_id = manifest['live_matches'][index % len(manifest['live_matches'])]
+    while not stop.is_set():
+        await recorder.call('live', client.get(f'/api/matches/{match_id}/live'))
+        await pause(args.poll_interval)
+
+
+async def referee(client, recorder, manifest, args, index, stop):
+    match_id = manifest['live_matches'][index % len(manifest['live_matches'])]
+    while not stop.is_set():
+        await pause(args.goal_interval)
+        await recorder.call('score', client.post(
+            f'/api/matches/{match_id}/score', json={'team': random.choice(('home', 'away'))},
+            headers={'Idempotency-Key': uuid.uuid4().hex}
+        ))
+
+
+async def coach(client, recorder, manifest, args, index, stop):
+    squad = manifest['coaches'][index % len(manifest['coaches'])]
+    if not squad['matches']:
+        return
+    while not stop.is_set():
+        selection = random.sample(squad['players'], min(18, len(squad['players'])))
+        await recorder.call('squad', client.post(f'/api/matches/{random.choice(squad["matches"])}/squad',
+                                                 json={'player_ids': selection, 'starter_ids': selection[:11]}))
+        await pause(args.squad_interval)
+
+
+async def admin(client, recorder, manifest, args, index, stop):
+    while not stop.is_set():
+        await recorder.call('standings', client.get(f'/tournaments/{manifest["tournament_id"]}/standings'))
+        await pause(args.standings_interval)
+
+
+SCENARIOS = {'spectator': spectator, 'referee': referee, 'coach': coach, 'admin': admin}
+
+
+async def virtual_user(role, index, transport, recorder, manifest, args, stop, delay):
+    import httpx
+
+    usernames = manifest['users'][role]
+    if not usernames:
+        return
+    await asyncio.sleep(delay)
+    # Le client n'est pas fermé : il partage le transport (et son pool de connexions) avec les autres
+    client = httpx.AsyncClient(base_url=args.base_url, transport=transport, timeout=args.timeout)
+    if await login(client, recorder, usernames[index % len(usernames)], manifest['password']):
+        await SCENARIOS[role](client, recorder, manifest, args, index, stop)
+
+
+async def run(manifest, args):
+    import httpx
+
+    counts = {'spectator': args.spectators, 'referee': args.referees, 'coach': args.coaches, 'admin': args.admins}
+    recorder = Recorder()
+    stop = asyncio.Event()
+    transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.connections))
+    total = sum(counts.values())
+    tasks = [
+        asyncio.create_task(virtual_user(role, index, transport, recorder, manifest, args, stop,
+                                         delay=args.ramp_up * position / max(total, 1)))
+        for position, (role, index) in enumerate(
+            (role, index) for role in ROLES for index in range(counts[role])
+        )
+    ]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.wait(tasks, timeout=args.timeout + max(args.poll_interval, args.goal_interval,
+                                                         args.squad_interval, args.standings_interval) * 1.2)
+    for task in tasks:
+        task.cancel()
+    recorder.finished = time.perf_counter()
+    await transport.aclose()
+    return recorder.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = subparsers.add_parser('seed', help='Create the load test dataset')
+    seed_parser.add_argument('--database', default=os.environ.get('DATABASE_URL'),
+                             help='SQLAlchemy URL of the instance database (default: DATABASE_URL)')
+    seed_parser.add_argument('--teams', type=int, default=16)
+    seed_parser.add_argument('--players-per-team', type=int, default=23)
+    seed_parser.add_argument('--live-matches', type=int, default=4)
+    seed_parser.add_argument('--spectator-accounts', type=int, default=1000)
+    seed_parser.add_argument('--referee-accounts', type=int, default=8)
+    seed_parser.add_argument('--admin-accounts', type=int, default=2)
+    seed_parser.add_argument('--manifest', default=MANIFEST)
+
+    run_parser = subparsers.add_parser('run', help='Drive a running instance')
+    run_parser.add_argument('--base-url', default='http://localhost:5000')
+    run_parser.add_argument('--manifest', default=MANIFEST)
+    run_parser.add_argument('--duration', type=float, default=60)
+    run_parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which users log in')
+    run_parser.add_argument('--spectators', type=int, default=200)
+    run_parser.add_argument('--referees', type=int, default=4)
+    run_parser.add_argument('--coaches', type=int, default=8)
+    run_parser.add_argument('--admins', type=int, default=2)
+    run_parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between spectator polls')
+    run_parser.add_argument('--goal-interval', type=float, default=5.0, help='Seconds between referee goals')
+    run_parser.add_argument('--squad-interval', type=float, default=10.0)
+    run_parser.add_argument('--standings-interval', type=float, default=3.0)
+    run_parser.add_argument('--connections', type=int, default=200, help='HTTP connection pool size')
+    run_parser.add_argument('--timeout', type=float, default=10.0)
+    run_parser.add_argument('--report', default=None, help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        if not args.database:
+            parser.error('--database or DATABASE_URL is required')
+        manifest = seed(args.database, teams=args.teams, players_per_team=args.players_per_team,
+                        live_matches=args.live_matches,
+                        accounts={'spectator': args.spectator_accounts, 'referee': args.referee_accounts,
+                                  'admin': args.admin_accounts})
+        with open(args.manifest, 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+        print(f'Tournament {manifest["tournament_id"]}: {len(manifest["live_matches"])} live matches, '
+              f'{sum(len(users) for users in manifest["users"].values())} accounts -> {args.manifest}')
+        return
+
+    with open(args.manifest) as handle:
+        manifest = json.load(handle)
+    report = asyncio.run(run(manifest, args))
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
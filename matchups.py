@@ -0,0 +1,147 @@
+"""Index des confrontations : face-à-face, bilans domicile/extérieur et forme.
+
+Les tables HeadToHead et TeamRecord sont tenues à jour de façon
+incrémentale quand un match se termine (quelques UPDATE atomiques), ce qui
+évite de parcourir home_matches/away_matches à chaque affichage.
+"""
+from collections import defaultdict
+
+from sqlalchemy import update, insert, select, or_
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Team, Match, HeadToHead, TeamRecord
+
+FORM_LENGTH = 5
+
+
+def _outcome(scored, conceded):
+    if scored > conceded:
+        return 'wins', 'W'
+    if scored == conceded:
+        return 'draws', 'D'
+    return 'losses', 'L'
+
+
+def _increment(session, model, keys, deltas):
+    """UPDATE col = col + delta, inserting the row first if it does not exist yet"""
+    where = [getattr(model, name) == value for name, value in keys.items()]
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items()}
+    if session.execute(update(model).where(*where).values(**values)).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(insert(model).values(**keys, **deltas))
+    except IntegrityError:
+        # Ligne créée entre-temps par une autre requête
+        session.execute(update(model).where(*where).values(**values))
+
+
+def _apply(session, match, home_score, away_score, sign):
+    for team_id, opponent_id, scored, conceded, side in (
+        (match.home_team_id, match.away_team_id, home_score, away_score, 'home'),
+        (match.away_team_id, match.home_team_id, away_score, home_score, 'away'),
+    ):
+        outcome, _ = _outcome(scored, conceded)
+        _increment(session, HeadToHead, {'team_id': team_id, 'opponent_id': opponent_id}, {
+            'played': sign, outcome: sign, 'goals_for': sign * scored, 'goals_against': sign * conceded,
+        })
+        _increment(session, TeamRecord, {'team_id': team_id}, {
+            f'{side}_played': sign, f'{side}_{outcome}': sign,
+            f'{side}_goals_for': sign * scored, f'{side}_goals_against': sign * conceded,
+        })
+
+
+def _rebuild_form(session, team_id):
+    recent = session.execute(
+        select(Match.home_team_id, Match.home_score, Match.away_score)
+        .where(Match.status == 'completed', or_(Match.home_team_id == team_id, Match.away_team_id == team_id))
+        .order_by(Match.match_date.desc(), Match.id.desc())
+        .limit(FORM_LENGTH)
+    ).all()
+    form = ''.join(
+        _outcome(home, away)[1] if home_team_id == team_id else _outcome(away, home)[1]
+        for home_team_id, home, away in reversed(recent)
+    )
+    session.execute(update(TeamRecord).where(TeamRecord.team_id == team_id).values(form=form))
+
+
+def record_result(match, previous=None, session=None):
+    """Fold a completed match into the index.
+
+    `previous` is the (home_score, away_score) already recorded when a
+    completed match is corrected; it is subtracted before the new score is
+    added. The form is rebuilt from the latest matches by date, the order
+    used by rebuild_tournament, whatever order the results come in. Runs in
+    the caller's transaction, which must commit.
+    """
+    session = session or db.session
+    home_score, away_score = match.home_score or 0, match.away_score or 0
+
+    if previous is not None:
+        _apply(session, match, previous[0], previous[1], -1)
+    _apply(session, match, home_score, away_score, +1)
+
+    # Un match reporté peut se terminer après des matchs plus tardifs au calendrier
+    session.flush()
+    for team_id in (match.home_team_id, match.away_team_id):
+        _rebuild_form(session, team_id)
+
+
+def rebuild_tournament(tournament_id, session=None):
+    """Recompute the whole index of a tournament from its completed matches"""
+    session = session or db.session
+    team_ids = list(session.scalars(select(Team.id).where(Team.tournament_id == tournament_id)))
+    session.execute(HeadToHead.__table__.delete().where(HeadToHead.team_id.in_(team_ids)))
+    session.execute(TeamRecord.__table__.delete().where(TeamRecord.team_id.in_(team_ids)))
+
+    pairs = defaultdict(lambda: defaultdict(int))
+    records = {team_id: defaultdict(int) for team_id in team_ids}
+    forms = defaultdict(str)
+    completed = session.execute(
+        select(Match.home_team_id, Match.away_team_id, Match.home_score, Match.away_score)
+        .where(Match.tournament_id == tournament_id, Match.status == 'completed')
+        .order_by(Match.match_date, Match.id)
+    )
+    for home_team_id, away_team_id, home_score, away_score in completed:
+        for team_id, opponent_id, scored, conceded, side in (
+            (home_team_id, away_team_id, home_score or 0, away_score or 0, 'home'),
+            (away_team_id, home_team_id, away_score or 0, home_score or 0, 'away'),
+        ):
+            outcome, letter = _outcome(scored, conceded)
+            pair = pairs[(team_id, opponent_id)]
+            pair['played'] += 1
+            pair[outcome] += 1
+            pair['goals_for'] += scored
+            pair['goals_against'] += conceded
+            record = records[team_id]
+            record[f'{side}_played'] += 1
+            record[f'{side}_{outcome}'] += 1
+            record[f'{side}_goals_for'] += scored
+            record[f'{side}_goals_against'] += conceded
+            forms[team_id] = (forms[team_id] + letter)[-FORM_LENGTH:]
+
+    pair_fields = ('played', 'wins', 'draws', 'losses', 'goals_for', 'goals_against')
+    record_fields = [f'{side}_{name}' for side in ('home', 'away') for name in pair_fields]
+    if pairs:
+        session.execute(insert(HeadToHead), [
+            dict({name: values[name] for name in pair_fields}, team_id=team_id, opponent_id=opponent_id)
+            for (team_id, opponent_id), values in pairs.items()
+        ])
+    if records:
+        session.execute(insert(TeamRecord), [
+            dict({name: values[name] for name in record_fields}, team_id=team_id, form=forms[team_id])
+            for team_id, values in records.items()
+        ])
+
+
+def records_for_tournament(tournament_id):
+    """{team_id: TeamRecord} for the standings page, in one query"""
+    return {
+        record.team_id: record
+        for record in TeamRecord.query.join(Team, Team.id == TeamRecord.team_id).filter(Team.tournament_id == tournament_id)
+    }
+
+
+def head_to_head_for_team(team_id):
+    return HeadToHead.query.filter_by(team_id=team_id).order_by(HeadToHead.played.desc()).all()
@@ -0,0 +1,185 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, request, Response, send_file, abort
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Tailles fixes des vignettes (largeur, hauteur)
+THUMBNAIL_SIZES = {
+    'small': (64, 64),
+    'medium': (240, 240),
+}
+
+ALLOWED_EXTENSIONS = {'jpg', 'png'}
+PIL_FORMATS = {'JPEG': 'jpg', 'PNG': 'png'}  # format détecté par Pillow -> extension stockée
+CHUNK_SIZE = 64 * 1024
+ONE_YEAR = 365 * 24 * 3600
+
+_FILENAME_RE = re.compile(r'^[0-9a-f]{64}\.(jpg|png)$')
+
+_thumbnail_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('MEDIA_THUMBNAIL_WORKERS', '2')),
+    thread_name_prefix='thumbnails'
+)
+_pending = {}  # (root, filename) -> génération en cours
+_pending_lock = threading.Lock()
+
+
+def _shard(filename):
+    return os.path.join(filename[:2], filename[2:4], filename)
+
+
+def original_path(root, filename):
+    return os.path.join(root, 'originals', _shard(filename))
+
+
+def thumbnail_path(root, filename, size):
+    # Les vignettes sont toujours encodées en JPEG
+    return os.path.join(root, 'thumbs', size, _shard(filename.rsplit('.', 1)[0] + '.jpg'))
+
+
+def _image_extension(path):
+    """Extension matching the decoded format; ValueError if the file is not a JPEG or PNG image"""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            extension = PIL_FORMATS.get(image.format)
+    except (Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+        extension = None
+    if extension is None:
+        raise ValueError('Images only!')
+    return extension
+
+
+def store_upload(file_storage):
+    """Store an uploaded image under its SHA-256 and queue its thumbnails.
+
+    The content is decoded with Pillow: the stored extension is the real
+    format, whatever the name of the uploaded file. Raises ValueError for
+    anything that is not a JPEG or PNG image.
+    Returns the content-addressed filename to save in Player.photo_filename.
+    """
+    root = current_app.config['MEDIA_ROOT']
+    extension = file_storage.filename.rsplit('.', 1)[-1].lower()
+    if extension == 'jpeg':
+        extension = 'jpg'
+    if extension not in ALLOWED_EXTENSIONS:
+        raise ValueError('Images only!')
+
+    os.makedirs(os.path.join(root, 'originals'), exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.join(root, 'originals'))
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        filename = f'{digest.hexdigest()}.{_image_extension(tmp_path)}'
+        path = original_path(root, filename)
+        if os.path.exists(path):
+            # Même contenu déjà stocké : rien à réécrire
+            os.unlink(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    schedule_thumbnails(root, filename)
+    return filename
+
+
+def generate_thumbnails(root, filename):
+    """Create every missing thumbnail for an original (runs in the worker pool)"""
+    source = original_path(root, filename)
+    for size, dimensions in THUMBNAIL_SIZES.items():
+        target = thumbnail_path(root, filename, size)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            thumbnail = ImageOps.fit(image, dimensions, Image.LANCZOS)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+            with os.fdopen(fd, 'wb') as tmp:
+                thumbnail.save(tmp, 'JPEG', quality=85, optimize=True)
+            os.replace(tmp_path, target)
+
+
+def _thumbnails_done(key, future):
+    with _pending_lock:
+        _pending.pop(key, None)
+    if future.exception():
+        logger.error('Thumbnail generation failed for %s: %s', key[1], future.exception())
+
+
+def schedule_thumbnails(root, filename):
+    """Queue the thumbnails of an original, once: a generation already pending is reused"""
+    key = (root, filename)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is not None:
+            return future
+        future = _pending[key] = _thumbnail_pool.submit(generate_thumbnails, root, filename)
+    future.add_done_callback(lambda f: _thumbnails_done(key, f))
+    return future
+
+
+def serve_media(filename, size=None):
+    """Serve an original or a thumbnail with immutable caching.
+
+    Content-addressed names never change content, so the hash doubles as the
+    ETag and revalidations are answered without touching the disk. When
+    MEDIA_ACCEL_REDIRECT_PREFIX is set, the bytes are sent by nginx instead
+    of the Python worker (USE_X_SENDFILE does the same for Apache/lighttpd).
+    """
+    if not _FILENAME_RE.match(filename) or (size is not None and size not in THUMBNAIL_SIZES):
+        abort(404)
+
+    root = current_app.config['MEDIA_ROOT']
+    etag = filename.rsplit('.', 1)[0] + (f'-{size}' if size else '')
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.cache_control.immutable = True
+        return response
+
+    path = original_path(root, filename)
+    if size is not None:
+        thumb = thumbnail_path(root, filename, size)
+        if os.path.exists(thumb):
+            path = thumb
+        elif os.path.exists(path):
+            # Vignette pas encore prête : servir l'original sans le mettre en cache
+            schedule_thumbnails(root, filename)
+            return send_file(path, conditional=True, max_age=0)
+    if not os.path.exists(path):
+        abort(404)
+
+    accel_prefix = current_app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        response = Response(mimetype='image/jpeg' if path.endswith('.jpg') else 'image/png')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + os.path.relpath(path, root).replace(os.sep, '/')
+    else:
+        response = send_file(path, conditional=True, etag=False, max_age=ONE_YEAR)
+
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
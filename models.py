@@ -1,8 +1,12 @@
 from extensions import db
 from datetime import datetime
 from sqlalchemy import func
+from sqlalchemy.orm import synonym
+import random
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import url_for
 from flask_login import UserMixin
+from concurrency import check_version, commit
 
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
@@ -10,10 +14,11 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
-    role = db.Column(db.String(50), nullable=False, default='user')
+    role = db.Column(db.String(50), nullable=False, default='user', index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    first_name = db.Column(db.String(80), nullable=True)
-    last_name = db.Column(db.String(80), nullable=True)
+    # Indexés pour la recherche par préfixe des sélecteurs (voir search.py)
+    first_name = db.Column(db.String(80), nullable=True, index=True)
+    last_name = db.Column(db.String(80), nullable=True, index=True)
     
     # Relations polymorphiques
     __mapper_args__ = {
@@ -77,8 +82,8 @@ class Team(db.Model):
         """Retourne la liste des joueurs disponibles pour le prochain match"""
         return Player.query.filter_by(team_id=self.id, is_available=True).all()
     
-    def select_players_for_match(self, match_id, player_ids):
-        """Sélectionne les joueurs pour un match spécifique"""
+    def select_players_for_match(self, match_id, player_ids, starter_ids=()):
+        """Sélectionne les joueurs pour un match spécifique, starter_ids étant les titulaires"""
         # Vérifier que tous les joueurs appartiennent à l'équipe
         players = Player.query.filter(
             Player.id.in_(player_ids),
@@ -109,6 +114,7 @@ class Team(db.Model):
             else:
                 # Mettre à jour si déjà existant
                 performance.is_selected = True
+            performance.is_starter = player.id in starter_ids
         
         db.session.commit()
         return players
@@ -148,6 +154,7 @@ class Tournament(db.Model):
     end_date = db.Column(db.Date)
     max_teams = db.Column(db.Integer, default=16)
     status = db.Column(db.String(50), default='registration')
+    tiebreak_rules = db.Column(db.String(255), nullable=True)  # preset name or comma-separated rules, see tiebreakers.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -155,22 +162,20 @@ class Tournament(db.Model):
     matches = db.relationship('Match', backref='tournament', lazy=True, cascade='all, delete-orphan')
 
     def get_standings(self):
-        """Calculate and return the standings for this tournament."""
-        # Fetch TeamStats for all teams in this tournament
-        # Order by points (desc), goal difference (desc), goals scored (desc)
-        # Ensure TeamStats exists for all teams - create if not
-        for team in self.teams:
-            if not TeamStats.query.filter_by(team_id=team.id).first():
-                db.session.add(TeamStats(team_id=team.id))
-        db.session.commit() # Commit new TeamStats before querying
-
-        standings = TeamStats.query.join(Team).filter(Team.tournament_id == self.id)
-        standings = standings.order_by(
-            TeamStats.points.desc(),
-            TeamStats.difference_des_buts.desc(),
-            TeamStats.goals_marques.desc()
-        ).all()
-        return standings
+        """TeamStats-like rows in ranking order, with the figures of the computation that ranked them"""
+        from types import SimpleNamespace
+        from tiebreakers import standings_for, team_stats_figures
+
+        teams = {team.id: team for team in self.teams}
+        cards = {stats.team_id: stats for stats in TeamStats.query.filter(TeamStats.team_id.in_(teams))}
+        rows = {row['team_id']: row for row in standings_for(self) if row['team_id'] in teams}
+        order = list(rows) + sorted(set(teams) - set(rows))
+        return [
+            SimpleNamespace(team_id=team_id, team=teams[team_id], **team_stats_figures(rows.get(team_id)),
+                            carton_jaunes=cards[team_id].carton_jaunes or 0 if team_id in cards else 0,
+                            cartons_rouges=cards[team_id].cartons_rouges or 0 if team_id in cards else 0)
+            for team_id in order
+        ]
 
     def __repr__(self):
         return f'<Tournament {self.name}>'
@@ -186,6 +191,8 @@ class Player(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_available = db.Column(db.Boolean, default=True)  # Si le joueur est disponible pour jouer
     photo_filename = db.Column(db.String(255), nullable=True) # Add column for photo filename
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')  # optimistic locking, see concurrency.py
+    __mapper_args__ = {'version_id_col': version_id}
 
     def __repr__(self):
         return f'<Player {self.name}>'
@@ -199,12 +206,27 @@ class Player(db.Model):
             db.session.commit()
         return stats
 
-    def toggle_availability(self):
-        """Change la disponibilité du joueur"""
+    def photo_url(self, size='medium'):
+        """URL de la photo (vignette 'small'/'medium', ou None pour l'original)"""
+        if not self.photo_filename:
+            return None
+        if size is None:
+            return url_for('player_photo', filename=self.photo_filename)
+        return url_for('player_photo_thumbnail', size=size, filename=self.photo_filename)
+
+    def toggle_availability(self, expected_version=None):
+        """Change la disponibilité du joueur (VersionConflict si modifié entre-temps)"""
+        check_version(self, expected_version)
         self.is_available = not self.is_available
-        db.session.commit()
+        commit(self)
         return self.is_available
 
+class MatchDirectory(db.Model):
+    """Match id allocator and match -> tournament lookup, kept in the main database (see tenancy.py)"""
+    __tablename__ = 'match_directory'
+    id = db.Column(db.Integer, primary_key=True)
+    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'), nullable=False, index=True)
+
 class Match(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'), nullable=False)
@@ -217,6 +239,8 @@ class Match(db.Model):
     status = db.Column(db.String(50), default='scheduled')
     round_number = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')  # optimistic locking, see concurrency.py
+    __mapper_args__ = {'version_id_col': version_id}
 
     # Add foreign key for the referee
     referee_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # Referee assignment is optional
@@ -227,28 +251,47 @@ class Match(db.Model):
     def __repr__(self):
         return f'<Match {self.home_team.name} vs {self.away_team.name} on {self.match_date}>'
     
+    @property
+    def updates(self):
+        """Former MatchUpdate backref, now the unified event list"""
+        return self.events
+
     @property
     def result_string(self):
         if self.status == 'completed':
             return f"{self.home_score} - {self.away_score}"
         return "vs"
 
-# Rename MatchUpdate to MatchEvent
 class MatchEvent(db.Model):
+    """Seule table des événements de match (l'ancienne table match_update y a été fusionnée, voir event_store.py)"""
     __tablename__ = 'match_event' # Explicitly define table name for clarity
+    __table_args__ = (
+        # Live reads: latest events of one match, newest first. Ordered by time, the rows merged
+        # from match_update (event_store.py) having received ids after the newer events
+        db.Index('ix_match_event_match_id_timestamp_id', 'match_id', 'timestamp', 'id'),
+        # Replay of the events recorded since a checkpoint (live_state.py)
+        db.Index('ix_match_event_match_id_id', 'match_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     match_id = db.Column(db.Integer, db.ForeignKey('match.id'), nullable=False)
     minute = db.Column(db.Integer)  # Match minute
     event_type = db.Column(db.String(50))  # goal, card, substitution, etc. # Renamed from update_type for clarity
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
     player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=True)
+    # Second joueur de l'événement : joueur remplacé (substitution), passeur décisif (goal)
+    related_player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=True)
     description = db.Column(db.Text) # More detailed description if needed
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    legacy_update_id = db.Column(db.Integer, unique=True, nullable=True)  # id in the former match_update table
+    
+    # Former MatchUpdate attribute name
+    update_type = synonym('event_type')
     
     # Relationships
     match = db.relationship('Match', backref='events') # Update backref to 'events'
     team = db.relationship('Team')
-    player = db.relationship('Player')
+    player = db.relationship('Player', foreign_keys=[player_id])
+    related_player = db.relationship('Player', foreign_keys=[related_player_id])
     
     def to_dict(self):
         return {
@@ -259,9 +302,83 @@ class MatchEvent(db.Model):
             'player': self.player.name if self.player else None,
             'description': self.description,
             'timestamp': self.timestamp.isoformat(),
+            'text': self.description,
             'time': self.timestamp.strftime('%H:%M')
         }
 
+# Compatibility alias for code written against the former live-update model
+MatchUpdate = MatchEvent
+
+class MatchStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), nullable=False)
+    home_possession = db.Column(db.Integer, default=50)
+    away_possession = db.Column(db.Integer, default=50)
+    home_shots = db.Column(db.Integer, default=0)
+    away_shots = db.Column(db.Integer, default=0)
+    home_shots_on_target = db.Column(db.Integer, default=0)
+    away_shots_on_target = db.Column(db.Integer, default=0)
+    home_corners = db.Column(db.Integer, default=0)
+    away_corners = db.Column(db.Integer, default=0)
+    home_fouls = db.Column(db.Integer, default=0)
+    away_fouls = db.Column(db.Integer, default=0)
+    home_yellow_cards = db.Column(db.Integer, default=0)
+    away_yellow_cards = db.Column(db.Integer, default=0)
+    home_red_cards = db.Column(db.Integer, default=0)
+    away_red_cards = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationship
+    match = db.relationship('Match', backref=db.backref('stats_detail', uselist=False))
+    
+    def register_goal(self, team):
+        """Simule l'évolution des statistiques après un but de 'home' ou 'away'"""
+        if team == 'home':
+            self.home_shots = (self.home_shots or 0) + random.randint(1, 3)
+            self.home_shots_on_target = (self.home_shots_on_target or 0) + 1
+        else:
+            self.away_shots = (self.away_shots or 0) + random.randint(1, 3)
+            self.away_shots_on_target = (self.away_shots_on_target or 0) + 1
+        
+        # Random possession adjustment
+        possession_change = random.randint(-5, 5)
+        if team == 'home':
+            self.home_possession = min(100, max(0, (self.home_possession or 50) + possession_change))
+            self.away_possession = 100 - self.home_possession
+        else:
+            self.away_possession = min(100, max(0, (self.away_possession or 50) + possession_change))
+            self.home_possession = 100 - self.away_possession
+    
+    def to_dict(self):
+        return {
+            'possession': {
+                'home': self.home_possession,
+                'away': self.away_possession
+            },
+            'shots': {
+                'home': self.home_shots,
+                'away': self.away_shots
+            },
+            'shots_on_target': {
+                'home': self.home_shots_on_target,
+                'away': self.away_shots_on_target
+            },
+            'corners': {
+                'home': self.home_corners,
+                'away': self.away_corners
+            },
+            'fouls': {
+                'home': self.home_fouls,
+                'away': self.away_fouls
+            },
+            'cards': {
+                'home_yellow': self.home_yellow_cards,
+                'away_yellow': self.away_yellow_cards,
+                'home_red': self.home_red_cards,
+                'away_red': self.away_red_cards
+            }
+        }
+
 class TeamStats(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False, unique=True)
@@ -276,6 +393,8 @@ class TeamStats(db.Model):
     carton_jaunes = db.Column(db.Integer, default=0)
     cartons_rouges = db.Column(db.Integer, default=0)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')  # optimistic locking, see concurrency.py
+    __mapper_args__ = {'version_id_col': version_id}
 
     # Relationship
     team = db.relationship('Team', backref='stats_detail', uselist=False)
@@ -283,6 +402,54 @@ class TeamStats(db.Model):
     def __repr__(self):
         return f'<TeamStats for Team {self.team_id}>'
 
+class HeadToHead(db.Model):
+    """Bilan d'une équipe face à un adversaire (une ligne par couple ordonné, voir matchups.py)"""
+    __tablename__ = 'head_to_head'
+    __table_args__ = (db.UniqueConstraint('team_id', 'opponent_id', name='uq_head_to_head_pair'),)
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    opponent_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    played = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    draws = db.Column(db.Integer, default=0)
+    losses = db.Column(db.Integer, default=0)
+    goals_for = db.Column(db.Integer, default=0)
+    goals_against = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    team = db.relationship('Team', foreign_keys=[team_id])
+    opponent = db.relationship('Team', foreign_keys=[opponent_id])
+
+    def __repr__(self):
+        return f'<HeadToHead {self.team_id} vs {self.opponent_id}>'
+
+class TeamRecord(db.Model):
+    """Bilans domicile/extérieur et forme récente d'une équipe (voir matchups.py)"""
+    __tablename__ = 'team_record'
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False, unique=True)
+    home_played = db.Column(db.Integer, default=0)
+    home_wins = db.Column(db.Integer, default=0)
+    home_draws = db.Column(db.Integer, default=0)
+    home_losses = db.Column(db.Integer, default=0)
+    home_goals_for = db.Column(db.Integer, default=0)
+    home_goals_against = db.Column(db.Integer, default=0)
+    away_played = db.Column(db.Integer, default=0)
+    away_wins = db.Column(db.Integer, default=0)
+    away_draws = db.Column(db.Integer, default=0)
+    away_losses = db.Column(db.Integer, default=0)
+    away_goals_for = db.Column(db.Integer, default=0)
+    away_goals_against = db.Column(db.Integer, default=0)
+    form = db.Column(db.String(10), default='')  # e.g. 'WDLWW', most recent result last
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationship
+    team = db.relationship('Team', backref=db.backref('record', uselist=False))
+
+    def __repr__(self):
+        return f'<TeamRecord for Team {self.team_id}>'
+
 class PlayerStats(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False, unique=True)
@@ -301,6 +468,8 @@ class PlayerStats(db.Model):
     clean_sheets = db.Column(db.Integer, default=0)  # For goalkeepers
     saves = db.Column(db.Integer, default=0)  # For goalkeepers
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')  # optimistic locking, see concurrency.py
+    __mapper_args__ = {'version_id_col': version_id}
     
     # Relationship
     player = db.relationship('Player', backref='stats_record', uselist=False)
@@ -328,6 +497,7 @@ class PlayerMatchPerformance(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_selected = db.Column(db.Boolean, default=False)  # Si le joueur est sélectionné pour le match
     is_playing = db.Column(db.Boolean, default=False)   # Si le joueur est sur le terrain
+    is_starter = db.Column(db.Boolean, default=False)   # Titulaire au coup d'envoi (feuille de match)
     
     # Relationships
     player = db.relationship('Player', backref='match_performances')
@@ -335,3 +505,206 @@ class PlayerMatchPerformance(db.Model):
     
     def __repr__(self):
         return f'<PlayerMatchPerformance for Player {self.player_id} in Match {self.match_id}>'
+
+class Job(db.Model):
+    """Tâche d'administration exécutée en arrière-plan (voir jobs.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed
+    params = db.Column(db.JSON, default=dict)
+    result = db.Column(db.JSON)
+    progress = db.Column(db.Integer, default=0)  # 0-100
+    message = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+# Archived tournaments (see archive.py): same columns as the hot tables, no foreign
+# keys since a tournament's rows are moved together, and read-only once written.
+def _archive_table(model, *indexes):
+    return db.Table(
+        f'archived_{model.__table__.name}',
+        *[db.Column(column.name, column.type, primary_key=column.primary_key,
+                    nullable=column.nullable, autoincrement=False)
+          for column in model.__table__.columns],
+        *indexes
+    )
+
+class ArchivedMatch(db.Model):
+    __table__ = _archive_table(Match, db.Index('ix_archived_match_tournament_id', 'tournament_id'))
+
+    home_team = db.relationship('Team', primaryjoin='foreign(ArchivedMatch.home_team_id) == Team.id', viewonly=True)
+    away_team = db.relationship('Team', primaryjoin='foreign(ArchivedMatch.away_team_id) == Team.id', viewonly=True)
+    tournament = db.relationship('Tournament', primaryjoin='foreign(ArchivedMatch.tournament_id) == Tournament.id',
+                                 viewonly=True)
+    events = db.relationship('ArchivedMatchEvent', primaryjoin='ArchivedMatch.id == foreign(ArchivedMatchEvent.match_id)',
+                             order_by='ArchivedMatchEvent.id', viewonly=True)
+
+    __repr__ = Match.__repr__
+    updates = Match.updates
+    result_string = Match.result_string
+
+class ArchivedMatchEvent(db.Model):
+    __table__ = _archive_table(MatchEvent, db.Index('ix_archived_match_event_match_id_id', 'match_id', 'id'))
+
+    team = db.relationship('Team', primaryjoin='foreign(ArchivedMatchEvent.team_id) == Team.id', viewonly=True)
+    player = db.relationship('Player', primaryjoin='foreign(ArchivedMatchEvent.player_id) == Player.id', viewonly=True)
+
+    to_dict = MatchEvent.to_dict
+
+class ArchivedMatchStats(db.Model):
+    __table__ = _archive_table(MatchStats, db.Index('ix_archived_match_stats_match_id', 'match_id'))
+
+class ArchivedPlayerMatchPerformance(db.Model):
+    __table__ = _archive_table(PlayerMatchPerformance,
+                               db.Index('ix_archived_player_match_performance_match_id', 'match_id'),
+                               db.Index('ix_archived_player_match_performance_player_id', 'player_id'))
+
+    player = db.relationship('Player', primaryjoin='foreign(ArchivedPlayerMatchPerformance.player_id) == Player.id',
+                             viewonly=True)
+    match = db.relationship('ArchivedMatch', primaryjoin='foreign(ArchivedPlayerMatchPerformance.match_id) == ArchivedMatch.id',
+                            viewonly=True)
+
+class IdempotencyKey(db.Model):
+    """Response of a POST sent with an Idempotency-Key header, replayed on retries"""
+    __table_args__ = (db.UniqueConstraint('scope', 'key', name='uq_idempotency_key_scope_key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(255), nullable=False)   # endpoint and path, e.g. api_update_score:/api/matches/3/score
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    status_code = db.Column(db.Integer)   # None while the first request is still running
+    content_type = db.Column(db.String(100))
+    body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope} {self.key}>'
+
+class TournamentSnapshot(db.Model):
+    """Final standings and player/team stats of an archived tournament, computed once"""
+    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'), primary_key=True)
+    standings = db.Column(db.JSON, nullable=False)        # ordered rows, see tiebreakers.TieBreaker.standings
+    team_aggregates = db.Column(db.JSON, nullable=False)  # {team_id: totals}
+    players = db.Column(db.JSON, nullable=False)          # {player_id: SeasonAnalytics.player_summary}
+    leaders = db.Column(db.JSON, nullable=False)          # {metric: [[player_id, value], ...]}
+    match_count = db.Column(db.Integer, default=0)
+    event_count = db.Column(db.Integer, default=0)
+    performance_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    tournament = db.relationship('Tournament', backref=db.backref('snapshot', uselist=False))
+
+    def player_summary(self, player_id):
+        return self.players.get(str(player_id))
+
+    def __repr__(self):
+        return f'<TournamentSnapshot {self.tournament_id}>'
+
+class LiveCheckpoint(db.Model):
+    """Last checkpoint of a live match state and the worker owning it (see live_state.py)"""
+    __tablename__ = 'live_checkpoint'
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # événements suivants rejoués au chargement
+    version = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.JSON, nullable=False)   # LiveMatchState.to_state()
+    owner = db.Column(db.String(100))            # host:pid du worker qui écrit les checkpoints
+    lease_until = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LiveCheckpoint match {self.match_id} at event {self.last_event_id}>'
+
+class SearchDocument(db.Model):
+    """Normalized text of a tournament, team or player, indexed for full-text search (see search.py)"""
+    __tablename__ = 'search_document'
+    __table_args__ = (db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_document_entity'),)
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # tournament, team, player
+    entity_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200), nullable=False)     # affichés tels quels dans les résultats
+    subtitle = db.Column(db.String(200))
+    title_terms = db.Column(db.Text)                        # mots sans accents ni majuscules
+    body_terms = db.Column(db.Text)
+    phonetic = db.Column(db.Text)                           # clés des variantes de translittération
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SearchDocument {self.entity_type} {self.entity_id}>'
+
+class OutboxMessage(db.Model):
+    """Notification written in the same transaction as the match change, delivered later (see outbox.py)"""
+    __tablename__ = 'outbox_message'
+    id = db.Column(db.Integer, primary_key=True)  # ordre de livraison
+    topic = db.Column(db.String(50), nullable=False)  # match.goal, match.ended...
+    tournament_id = db.Column(db.Integer, nullable=False, index=True)
+    match_id = db.Column(db.Integer, index=True)
+    coalesce_key = db.Column(db.String(100))  # messages de même clé : seul le dernier d'un lot est livré
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'topic': self.topic,
+            'tournament_id': self.tournament_id,
+            'match_id': self.match_id,
+            'created_at': self.created_at.isoformat() + 'Z',
+            'data': self.payload,
+        }
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.topic}>'
+
+class WebhookSubscriber(db.Model):
+    """Club endpoint receiving match notifications, signed with its secret"""
+    __tablename__ = 'webhook_subscriber'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(128), nullable=False)  # clé HMAC-SHA256 de l'en-tête X-Webhook-Signature
+    topics = db.Column(db.String(255))                   # séparés par des virgules, vide = tous
+    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'), nullable=True)  # vide = tous
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def wants(self, topic):
+        return not self.topics or topic in {t.strip() for t in self.topics.split(',')}
+
+    def __repr__(self):
+        return f'<WebhookSubscriber {self.name}>'
+
+class WebhookCursor(db.Model):
+    """Last outbox message delivered to a subscriber, and its retry backoff (one row per tenant database)"""
+    __tablename__ = 'webhook_cursor'
+    subscriber_id = db.Column(db.Integer, primary_key=True)  # webhook_subscriber.id, dans la base principale
+    last_message_id = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # échecs consécutifs
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    last_delivered_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<WebhookCursor subscriber {self.subscriber_id} at {self.last_message_id}>'
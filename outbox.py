@@ -0,0 +1,435 @@
+"""Notifications de match (buts, résultats...) livrées aux webhooks des clubs.
+
+Les écritures du direct n'appellent jamais le réseau : ``publish`` ajoute une
+ligne à outbox_message dans la transaction même de l'événement (match_event,
+score). Si la transaction échoue, la notification disparaît avec elle ; si
+elle réussit, la notification sera livrée tôt ou tard.
+
+Un dispatcher lit ensuite l'outbox de chaque tenant, à son rythme :
+
+- un lot par abonné et par passage : tous les messages qui l'intéressent
+  (sujets, tournoi) depuis son curseur webhook_cursor, en un seul POST JSON
+  signé (``X-Webhook-Signature: sha256=HMAC(secret, "<timestamp>.<corps>")``) ;
+- les messages d'une même ``coalesce_key`` (statistiques d'un match, score
+  corrigé) ne sont livrés que dans leur dernière version du lot ; les buts,
+  cartons, débuts et fins de match le sont tous ;
+- le curseur n'avance qu'après une réponse 2xx ; sinon l'abonné est retenté
+  avec un délai exponentiel (avec gigue, ``Retry-After`` respecté), sans
+  retarder les autres abonnés, livrés en parallèle ;
+- les id sont attribués avant le commit : un trou dans la suite des id peut
+  être une transaction encore en cours. Les curseurs ne dépassent pas le
+  premier trou, sauf si le message qui le suit a plus de OUTBOX_GAP_SECONDS
+  secondes (la transaction du trou a alors été annulée).
+
+La livraison est « au moins une fois » : un lot dont la réponse s'est perdue
+est renvoyé. Le couple (tournament_id, id) identifie un message pour le
+dédoublonnage côté club. Un seul dispatcher doit tourner à la fois :
+
+    flask dispatch-outbox [--once]     # processus dédié
+    OUTBOX_DISPATCHER=thread           # ou thread du serveur web (un seul worker)
+
+    flask add-webhook NAME URL [--topics match.goal,match.ended] [--tournament-id ID]
+    flask webhooks                     # abonnés, curseurs et dernières erreurs
+    flask purge-outbox [--days 7]      # messages livrés à tous les abonnés
+
+    python outbox.py stub --port 8765 --secret s3cr3t   # abonné de remplacement pour les tests
+"""
+import os
+import json
+import hmac
+import time
+import random
+import hashlib
+import logging
+import secrets
+import threading
+import urllib.error
+import urllib.request
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import select, delete, func
+
+from extensions import db
+from models import OutboxMessage, WebhookSubscriber, WebhookCursor
+from tenancy import router, activate
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = float(os.environ.get('OUTBOX_INTERVAL_SECONDS', '1'))
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '200'))
+TIMEOUT = float(os.environ.get('OUTBOX_TIMEOUT_SECONDS', '5'))
+WORKERS = int(os.environ.get('OUTBOX_WORKERS', '8'))
+BACKOFF_BASE = 5.0           # secondes, doublé à chaque échec
+BACKOFF_MAX = 3600.0
+# Au-delà, un id manquant est une transaction annulée (ou un saut de séquence), plus une écriture en cours
+GAP_TIMEOUT = timedelta(seconds=float(os.environ.get('OUTBOX_GAP_SECONDS', '60')))
+SCAN_SIZE = 10 * BATCH_SIZE
+
+TOPICS = ('match.started', 'match.goal', 'match.card', 'match.substitution', 'match.ended',
+          'match.result', 'match.stats')
+EVENT_TOPICS = {
+    'kickoff': 'match.started',
+    'goal': 'match.goal',
+    'own_goal': 'match.goal',
+    'yellow_card': 'match.card',
+    'red_card': 'match.card',
+    'substitution': 'match.substitution',
+    'final_whistle': 'match.ended',
+}  # autres événements (tirs, corners, fautes, possession) : match.stats, regroupés
+
+Subscriber = namedtuple('Subscriber', ['id', 'name', 'url', 'secret', 'topics', 'tournament_id', 'created_at'])
+
+
+def publish(topic, tournament_id, match_id, data, coalesce_key=None, session=None):
+    """Queue a notification in the caller's transaction, which must commit"""
+    session = session or db.session
+    message = OutboxMessage(topic=topic, tournament_id=tournament_id, match_id=match_id,
+                            coalesce_key=coalesce_key, payload=data)
+    session.add(message)
+    return message
+
+
+def publish_event(event, tournament_id, team_ids, score, session=None):
+    """Queue the notification of a match_event row; `score` is [home, away] after the event"""
+    topic = EVENT_TOPICS.get(event.event_type, 'match.stats')
+    return publish(topic, tournament_id, event.match_id, {
+        'event_type': event.event_type,
+        'minute': event.minute,
+        'team_id': event.team_id,
+        'player_id': event.player_id,
+        'related_player_id': event.related_player_id,
+        'description': event.description,
+        'home_team_id': team_ids[0],
+        'away_team_id': team_ids[1],
+        'home_score': score[0],
+        'away_score': score[1],
+    }, coalesce_key=f'match:{event.match_id}:stats' if topic == 'match.stats' else None, session=session)
+
+
+def publish_result(match, session=None):
+    """Queue the (possibly corrected) final score of a match"""
+    return publish('match.result', match.tournament_id, match.id, {
+        'home_team_id': match.home_team_id,
+        'away_team_id': match.away_team_id,
+        'home_score': match.home_score,
+        'away_score': match.away_score,
+        'status': match.status,
+    }, coalesce_key=f'match:{match.id}:result', session=session)
+
+
+def sign(secret, timestamp, body):
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f'sha256={digest}'
+
+
+def coalesce(messages):
+    """Messages of a batch, keeping only the latest of each coalesce key"""
+    latest = {message.coalesce_key: message.id for message in messages if message.coalesce_key}
+    return [message for message in messages if not message.coalesce_key or latest[message.coalesce_key] == message.id]
+
+
+def backoff(attempts, retry_after=None):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+    return timedelta(seconds=max(delay, min(retry_after or 0, BACKOFF_MAX)))
+
+
+def deliver(url, secret, body, delivery_id, timeout=TIMEOUT):
+    """POST one signed batch. Returns (error, retry_after seconds), error None on success."""
+    timestamp = str(int(time.time()))
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'User-Agent': 'football-webhooks/1',
+        'X-Webhook-Id': delivery_id,
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Signature': sign(secret, timestamp, body),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+        return None, None
+    except urllib.error.HTTPError as e:
+        retry_after = e.headers.get('Retry-After')
+        return f'HTTP {e.code}', float(retry_after) if retry_after and retry_after.isdigit() else None
+    except (urllib.error.URLError, OSError) as e:
+        return str(getattr(e, 'reason', e)), None
+
+
+def _subscribers():
+    return [Subscriber(s.id, s.name, s.url, s.secret,
+                       tuple(t.strip() for t in (s.topics or '').split(',') if t.strip()),
+                       s.tournament_id, s.created_at)
+            for s in db.session.scalars(select(WebhookSubscriber).where(WebhookSubscriber.active)
+                                        .order_by(WebhookSubscriber.id))]
+
+
+def _pending(subscriber, after, high):
+    query = select(OutboxMessage).where(OutboxMessage.id > after, OutboxMessage.id <= high)
+    if subscriber.topics:
+        query = query.where(OutboxMessage.topic.in_(subscriber.topics))
+    if subscriber.tournament_id:
+        query = query.where(OutboxMessage.tournament_id == subscriber.tournament_id)
+    return db.session.scalars(query.order_by(OutboxMessage.id).limit(BATCH_SIZE)).all()
+
+
+def _settled(after, now):
+    """Highest id such that every message up to it is committed, scanning the ids after `after`"""
+    high = after
+    for message_id, created_at in db.session.execute(
+        select(OutboxMessage.id, OutboxMessage.created_at).where(OutboxMessage.id > after)
+        .order_by(OutboxMessage.id).limit(SCAN_SIZE)
+    ):
+        # Trou récent : l'id manquant peut encore être commité, on s'arrête avant
+        if message_id != high + 1 and created_at > now - GAP_TIMEOUT:
+            break
+        high = message_id
+    return high
+
+
+def _dispatch_tenant(subscribers, executor):
+    now = datetime.utcnow()
+    cursors = {cursor.subscriber_id: cursor for cursor in db.session.scalars(
+        select(WebhookCursor).where(WebhookCursor.subscriber_id.in_([s.id for s in subscribers])))}
+    # Les curseurs enregistrés n'ont avancé que jusqu'à des positions vérifiées : les trous sont à chercher au-delà
+    verified = max((cursor.last_message_id for cursor in cursors.values()), default=None)
+    for subscriber in subscribers:
+        if subscriber.id not in cursors:
+            # Nouvel abonné : seulement les messages écrits après son inscription
+            start = db.session.scalar(select(func.max(OutboxMessage.id))
+                                      .where(OutboxMessage.created_at < subscriber.created_at)) or 0
+            cursors[subscriber.id] = WebhookCursor(subscriber_id=subscriber.id, last_message_id=start, attempts=0)
+            db.session.add(cursors[subscriber.id])
+    if verified is None:
+        verified = min(cursor.last_message_id for cursor in cursors.values())
+    high = _settled(verified, now)
+
+    batches = []  # (abonné, id du dernier message couvert, corps JSON)
+    for subscriber in subscribers:
+        cursor = cursors[subscriber.id]
+        if cursor.last_message_id >= high or (cursor.next_attempt_at and cursor.next_attempt_at > now):
+            continue
+        messages = _pending(subscriber, cursor.last_message_id, high)
+        if not messages:
+            cursor.last_message_id = high  # rien pour cet abonné jusqu'à high
+            continue
+        # Lot incomplet : tous les messages de l'abonné jusqu'à high y sont
+        last_id = messages[-1].id if len(messages) == BATCH_SIZE else high
+        body = json.dumps({'subscriber': subscriber.name,
+                           'messages': [message.to_dict() for message in coalesce(messages)]},
+                          separators=(',', ':')).encode()
+        batches.append((subscriber, last_id, body))
+    # Pas de connexion retenue pendant les appels réseau
+    db.session.commit()
+
+    futures = [(subscriber, last_id, executor.submit(deliver, subscriber.url, subscriber.secret, body,
+                                                      secrets.token_hex(16)))
+               for subscriber, last_id, body in batches]
+    delivered = 0
+    for subscriber, last_id, future in futures:
+        error, retry_after = future.result()
+        cursor = db.session.get(WebhookCursor, subscriber.id)
+        if error is None:
+            delivered += 1
+            cursor.last_message_id = last_id
+            cursor.attempts = 0
+            cursor.next_attempt_at = cursor.last_error = None
+            cursor.last_delivered_at = datetime.utcnow()
+        else:
+            cursor.attempts += 1
+            cursor.next_attempt_at = datetime.utcnow() + backoff(cursor.attempts, retry_after)
+            cursor.last_error = error[:500]
+            logger.warning(f'Webhook {subscriber.name} failed ({error}), attempt {cursor.attempts}')
+    db.session.commit()
+    return delivered
+
+
+def dispatch_once(executor):
+    """One delivery round over every tenant; returns the number of batches delivered"""
+    subscribers = _subscribers()
+    delivered = 0
+    if not subscribers:
+        return delivered
+    for tenant in router.tenants():
+        with activate(tenant):
+            try:
+                delivered += _dispatch_tenant(subscribers, executor)
+            except Exception:
+                db.session.rollback()
+                logger.exception(f'Outbox dispatch failed for tenant {tenant}')
+    return delivered
+
+
+def run(once=False):
+    with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='webhook') as executor:
+        while True:
+            try:
+                delivered = dispatch_once(executor)
+            finally:
+                db.session.remove()
+            if once:
+                return delivered
+            # Les événements rapprochés d'un intervalle partent dans le même lot
+            time.sleep(INTERVAL)
+
+
+def purge(days=7):
+    """Delete messages older than `days` that every active subscriber already received"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    ids = [subscriber.id for subscriber in _subscribers()]
+    total = 0
+    for tenant in router.tenants():
+        with activate(tenant):
+            query = delete(OutboxMessage).where(OutboxMessage.created_at < cutoff)
+            if ids:
+                # Abonné sans curseur dans ce tenant : il n'y a encore rien reçu
+                cursors = db.session.scalars(select(WebhookCursor.last_message_id)
+                                             .where(WebhookCursor.subscriber_id.in_(ids))).all()
+                query = query.where(OutboxMessage.id <= (min(cursors) if len(cursors) == len(ids) else 0))
+            total += db.session.execute(query).rowcount
+            db.session.commit()
+    return total
+
+
+class Dispatcher:
+    """In-process dispatcher thread (OUTBOX_DISPATCHER=thread)"""
+
+    def __init__(self):
+        self.app = None
+        self.thread = None
+
+    def start(self, app):
+        self.app = app
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    run()
+                except Exception:
+                    logger.exception('Outbox dispatcher stopped, restarting')
+            time.sleep(INTERVAL)
+
+
+dispatcher = Dispatcher()
+
+
+def init_app(app):
+    # Pas dans les workers des pools de processus (jobs.py), qui importent l'application
+    if os.environ.get('OUTBOX_DISPATCHER') == 'thread' and multiprocessing.parent_process() is None:
+        dispatcher.start(app)
+
+
+def register_cli(app):
+    @app.cli.command('dispatch-outbox')
+    @click.option('--once', is_flag=True, help='Deliver pending messages once and exit.')
+    def dispatch_outbox_command(once):
+        """Deliver outbox messages to webhook subscribers."""
+        delivered = run(once=once)
+        print(f'{delivered} batch(es) delivered')
+
+    @app.cli.command('purge-outbox')
+    @click.option('--days', type=int, default=7, show_default=True, help='Keep messages younger than this.')
+    def purge_outbox_command(days):
+        """Delete outbox messages delivered to every subscriber."""
+        print(f'{purge(days)} message(s) deleted')
+
+    @app.cli.command('add-webhook')
+    @click.argument('name')
+    @click.argument('url')
+    @click.option('--secret', default=None, help='HMAC key (generated when omitted).')
+    @click.option('--topics', default='', help=f'Comma-separated, all when omitted: {", ".join(TOPICS)}.')
+    @click.option('--tournament-id', type=int, default=None, help='Only this tournament.')
+    def add_webhook_command(name, url, secret, topics, tournament_id):
+        """Subscribe a club endpoint to match notifications."""
+        unknown = {t.strip() for t in topics.split(',') if t.strip()} - set(TOPICS)
+        if unknown:
+            raise click.BadParameter(f'Unknown topic(s): {", ".join(sorted(unknown))}', param_hint='--topics')
+        subscriber = WebhookSubscriber(name=name, url=url, secret=secret or secrets.token_hex(32),
+                                       topics=topics or None, tournament_id=tournament_id)
+        db.session.add(subscriber)
+        db.session.commit()
+        print(f'Webhook {subscriber.id} added, secret: {subscriber.secret}')
+
+    @app.cli.command('webhooks')
+    def webhooks_command():
+        """List webhook subscribers with their delivery state per tenant."""
+        subscribers = db.session.scalars(select(WebhookSubscriber).order_by(WebhookSubscriber.id)).all()
+        for tenant in router.tenants():
+            with activate(tenant):
+                high = db.session.scalar(select(func.max(OutboxMessage.id))) or 0
+                for subscriber in subscribers:
+                    cursor = db.session.get(WebhookCursor, subscriber.id)
+                    position = cursor.last_message_id if cursor else 0
+                    status = 'active' if subscriber.active else 'inactive'
+                    line = f'{subscriber.id:4} {subscriber.name:<20} {status:<8} {tenant}: at {position}/{high}'
+                    if cursor and cursor.last_error:
+                        line += f', {cursor.attempts} failure(s), last: {cursor.last_error}'
+                    print(line)
+
+
+def stub_server(port, secret=None, fail_rate=0.0):
+    """Stand-in subscriber (not started): checks signatures, prints received messages and keeps the
+    batches in `received`, fails at random when asked"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+    seen = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            timestamp = self.headers.get('X-Webhook-Timestamp', '')
+            if secret and not hmac.compare_digest(self.headers.get('X-Webhook-Signature', ''),
+                                                  sign(secret, timestamp, body)):
+                self.send_error(401)
+                return
+            if random.random() < self.server.fail_rate:
+                self.send_error(503)
+                return
+            with lock:
+                batch = json.loads(body)
+                self.server.received.append(batch)
+                for message in batch['messages']:
+                    key = (message['tournament_id'], message['id'])
+                    duplicate = ' (duplicate)' if key in seen else ''
+                    seen.add(key)
+                    print(f"{message['id']:6} {message['topic']:<18} match {message['match_id']}: "
+                          f"{json.dumps(message['data'], ensure_ascii=False)}{duplicate}", flush=True)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), Handler)
+    server.received, server.fail_rate = [], fail_rate
+    return server
+
+
+def stub(port, secret=None, fail_rate=0.0):
+    server = stub_server(port, secret, fail_rate)
+    print(f'Webhook stub listening on :{server.server_port}')
+    server.serve_forever()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    stub_parser = subparsers.add_parser('stub', help='Run a stand-in webhook subscriber')
+    stub_parser.add_argument('--port', type=int, default=8765)
+    stub_parser.add_argument('--secret', default=None, help='Reject deliveries not signed with this key')
+    stub_parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of deliveries answered 503')
+    args = parser.parse_args()
+    stub(args.port, args.secret, args.fail_rate)
+
+
+if __name__ == '__main__':
+    main()
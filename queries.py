@@ -0,0 +1,124 @@
+"""Requêtes des chemins chauds.
+
+Les événements du direct, interrogés à chaque rafraîchissement, sont
+construits par ``lambda_stmt`` : SQLAlchemy ne reconstruit pas l'instruction
+à chaque appel, il retrouve la version compilée à partir du code des lambdas
+et ne fait que lier les nouveaux paramètres (identifiant du match, limite...).
+Pour les derniers résultats et les classements de buteurs, la mesure ne
+montre aucun gain du lambda sur l'appel complet : ce sont des select()
+ordinaires, qui profitent du même cache de compilation. Avec ``rows=True``,
+les fonctions renvoient des ``Row`` ne contenant que les colonnes utiles au
+lieu d'entités ORM complètes (pas d'identity map, pas de chargement
+paresseux) : c'est là qu'est le gain des derniers résultats.
+
+Les requêtes sont enregistrées dans REGISTRY ; ``python bench_queries.py``
+compare leur coût à celui des requêtes ORM équivalentes.
+"""
+from collections import namedtuple
+
+from sqlalchemy import lambda_stmt, select
+
+from extensions import db
+from models import Team, Player, Match, MatchEvent, PlayerStats
+
+REGISTRY = {}
+
+LEADERBOARD_ORDER = {
+    'goals': PlayerStats.goals.desc(),
+    'assists': PlayerStats.assists.desc(),
+    'cards': (PlayerStats.yellow_cards + PlayerStats.red_cards).desc(),
+}
+
+RecentMatch = namedtuple('RecentMatch', ['id', 'tournament_id', 'match_date', 'home_score', 'away_score',
+                                         'home_team', 'away_team'])
+
+
+def hot_query(name):
+    """Register a statement builder so bench_queries.py can time it"""
+    def register(fn):
+        REGISTRY[name] = fn
+        return fn
+    return register
+
+
+@hot_query('recent_matches')
+def recent_matches_stmt(limit=5, rows=False):
+    if rows:
+        # Noms d'équipe lus à part (recent_matches) : la table team n'est pas dans les bases des tenants
+        stmt = select(Match.id, Match.tournament_id, Match.match_date, Match.home_score, Match.away_score,
+                      Match.home_team_id, Match.away_team_id)
+    else:
+        stmt = select(Match)
+    return stmt.where(Match.status == 'completed').order_by(Match.match_date.desc()).limit(limit)
+
+
+@hot_query('leaderboard')
+def leaderboard_stmt(metric, limit=10, rows=False):
+    order = LEADERBOARD_ORDER[metric]
+    if rows:
+        stmt = select(Player.id.label('player_id'), Player.name, Player.team_id, PlayerStats.goals,
+                      PlayerStats.assists, PlayerStats.yellow_cards, PlayerStats.red_cards)
+    else:
+        stmt = select(Player, PlayerStats)
+    return stmt.join(PlayerStats, Player.id == PlayerStats.player_id).order_by(order).limit(limit)
+
+
+@hot_query('live_events')
+def live_events_stmt(match_id, limit=10):
+    # match_event seule : dans un tenant à base séparée, team et player n'existent pas
+    stmt = lambda_stmt(lambda: select(
+        MatchEvent.id, MatchEvent.minute, MatchEvent.event_type, MatchEvent.description, MatchEvent.timestamp,
+        MatchEvent.team_id, MatchEvent.player_id
+    ))
+    stmt += lambda s: s.where(MatchEvent.match_id == match_id)\
+        .order_by(MatchEvent.timestamp.desc(), MatchEvent.id.desc()).limit(limit)
+    return stmt
+
+
+def recent_matches(limit=5, rows=False):
+    """Latest completed matches, newest first (RecentMatch tuples with team names when rows=True)"""
+    result = db.session.execute(recent_matches_stmt(limit, rows))
+    if not rows:
+        return result.scalars().all()
+    matches = result.all()
+    names = _names(Team, (team_id for row in matches for team_id in (row.home_team_id, row.away_team_id)))
+    return [RecentMatch(row.id, row.tournament_id, row.match_date, row.home_score, row.away_score,
+                        names.get(row.home_team_id), names.get(row.away_team_id)) for row in matches]
+
+
+def leaderboard(metric, limit=10, rows=False):
+    """(Player, PlayerStats) pairs, or Row(player_id, name, team_id, goals, ...) with rows=True"""
+    return db.session.execute(leaderboard_stmt(metric, limit, rows)).all()
+
+
+def _names(model, ids):
+    ids = {i for i in ids if i is not None}
+    return dict(db.session.execute(select(model.id, model.name).where(model.id.in_(ids))).all()) if ids else {}
+
+
+def live_events(match_id, limit=10, team_names=None, player_names=None):
+    """Latest events of a match as to_dict() payloads.
+
+    Team and player names come from `team_names` / `player_names` (id -> name,
+    e.g. the lineups cached by live_state) or from a second query on the main
+    database: the events may live in another tenant database.
+    """
+    rows = db.session.execute(live_events_stmt(match_id, limit)).all()
+    if team_names is None:
+        team_names = _names(Team, (row.team_id for row in rows))
+    if player_names is None:
+        player_names = _names(Player, (row.player_id for row in rows))
+    return [
+        {
+            'id': row.id,
+            'minute': row.minute,
+            'type': row.event_type,
+            'team': team_names.get(row.team_id),
+            'player': player_names.get(row.player_id),
+            'description': row.description,
+            'timestamp': row.timestamp.isoformat(),
+            'text': row.description,
+            'time': row.timestamp.strftime('%H:%M')
+        }
+        for row in rows
+    ]
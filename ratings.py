@@ -0,0 +1,138 @@
+"""Notes des joueurs (sur 10) calculées au coup de sifflet final.
+
+Toutes les performances d'un match (ou d'un tournoi entier) sont chargées en
+une requête, notées en une passe NumPy avec des poids propres à chaque poste,
+puis écrites par un seul UPDATE en masse (executemany sur la clé primaire).
+Modifier WEIGHTS ou les constantes ci-dessous suffit à changer la formule ;
+les tournois déjà joués se renotent avec le job ``rerate_tournament`` (route
+POST /tournaments/<id>/rerate des administrateurs) ou la commande :
+
+    flask rerate [--tournament-id ID]
+"""
+import click
+import numpy as np
+from sqlalchemy import select, update, or_
+
+from extensions import db
+from models import Tournament, Player, Match, PlayerMatchPerformance
+from analytics import POSITIONS
+from tenancy import lookup
+
+BASE_RATING = 6.0
+FULL_MATCH_BONUS = 0.5      # gagné au prorata des minutes jouées, jusqu'à 90
+PASS_ACCURACY_PIVOT = 0.75  # précision de passe neutre
+CLEAN_SHEET_MINUTES = 60
+MIN_RATING, MAX_RATING = 1.0, 10.0
+UPDATE_BATCH = 5000
+
+# Poids par poste : gardien, défenseur, milieu, attaquant (poste inconnu : milieu)
+WEIGHTS = {
+    'goals':           (1.2, 1.0, 0.9, 0.8),
+    'assists':         (0.8, 0.7, 0.6, 0.6),
+    'shots_on_target': (0.1, 0.15, 0.15, 0.2),
+    'tackles':         (0.05, 0.15, 0.12, 0.08),
+    'interceptions':   (0.05, 0.15, 0.1, 0.05),
+    'saves':           (0.35, 0.0, 0.0, 0.0),
+    'yellow_cards':    (-0.5, -0.5, -0.5, -0.5),
+    'red_cards':       (-1.5, -1.5, -1.5, -1.5),
+    'pass_accuracy':   (1.0, 1.5, 2.0, 1.0),   # multiplie (précision - PASS_ACCURACY_PIVOT)
+    'clean_sheet':     (1.0, 0.6, 0.2, 0.0),
+    'goals_conceded':  (-0.3, -0.2, 0.0, 0.0),
+}
+COUNTED = ('goals', 'assists', 'shots_on_target', 'tackles', 'interceptions', 'saves', 'yellow_cards', 'red_cards')
+FEATURES = COUNTED + ('pass_accuracy', 'clean_sheet', 'goals_conceded')
+WEIGHT_MATRIX = np.array([WEIGHTS[feature] for feature in FEATURES], dtype=np.float64).T  # (poste, variable)
+UNKNOWN_POSITION = POSITIONS.index('midfielder')
+
+
+def _rating_query(*where):
+    """Selected players, or players who came on, of completed matches (tenant tables only)"""
+    return select(
+        PlayerMatchPerformance.id, PlayerMatchPerformance.player_id, Match.home_team_id,
+        PlayerMatchPerformance.minutes_played, PlayerMatchPerformance.passes, PlayerMatchPerformance.passes_completed,
+        Match.home_score, Match.away_score,
+        *[getattr(PlayerMatchPerformance, name) for name in COUNTED]
+    ).join(Match, Match.id == PlayerMatchPerformance.match_id)\
+     .where(Match.status == 'completed',
+            or_(PlayerMatchPerformance.is_selected, PlayerMatchPerformance.minutes_played > 0),
+            *where)
+
+
+def _rating_rows(session, *where):
+    """Rows of _rating_query laid out for compute(), position and side taken from the player table"""
+    rows = session.execute(_rating_query(*where)).all()
+    players = lookup(Player.id, (row.player_id for row in rows), Player.position, Player.team_id, session=session)
+    return [
+        (row.id, players[row.player_id].position, row.minutes_played, row.passes, row.passes_completed,
+         players[row.player_id].team_id == row.home_team_id, row.home_score, row.away_score, *row[8:])
+        for row in rows if row.player_id in players
+    ]
+
+
+def compute(rows):
+    """(performance ids, ratings) for rows of _rating_rows, in one vectorized pass"""
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    columns = list(zip(*rows))
+    ids = np.asarray(columns[0], dtype=np.int64)
+    positions = np.array([POSITIONS.index(p.lower()) if p and p.lower() in POSITIONS else UNKNOWN_POSITION
+                          for p in columns[1]], dtype=np.int64)
+    minutes, passes, completed, is_home, home_score, away_score = (
+        np.asarray([value or 0 for value in column], dtype=np.float64) for column in columns[2:8]
+    )
+    counted = np.asarray([[value or 0 for value in column] for column in columns[8:]], dtype=np.float64).T
+
+    conceded = np.where(is_home > 0, away_score, home_score)
+    accuracy = np.divide(completed, passes, out=np.full_like(passes, PASS_ACCURACY_PIVOT), where=passes > 0)
+    features = np.column_stack((
+        counted,
+        accuracy - PASS_ACCURACY_PIVOT,
+        (conceded == 0) & (minutes >= CLEAN_SHEET_MINUTES),
+        conceded * np.minimum(minutes, 90) / 90,
+    ))
+
+    ratings = BASE_RATING + FULL_MATCH_BONUS * np.minimum(minutes, 90) / 90 \
+        + np.einsum('ij,ij->i', features, WEIGHT_MATRIX[positions])
+    ratings = np.round(np.clip(ratings, MIN_RATING, MAX_RATING), 1)
+    # Sélectionné sans entrer en jeu : pas de note
+    return ids, np.where(minutes > 0, ratings, 0.0)
+
+
+def _write(session, ids, ratings):
+    for start in range(0, len(ids), UPDATE_BATCH):
+        session.execute(update(PlayerMatchPerformance), [
+            {'id': int(performance_id), 'rating': float(rating)}
+            for performance_id, rating in zip(ids[start:start + UPDATE_BATCH], ratings[start:start + UPDATE_BATCH])
+        ])
+    return len(ids)
+
+
+def rate_match(match_id, session=None):
+    """Rate every player of a completed match. Runs in the caller's transaction, which must commit."""
+    session = session or db.session
+    ids, ratings = compute(_rating_rows(session, Match.id == match_id))
+    return _write(session, ids, ratings)
+
+
+def rate_tournament(tournament_id, session=None):
+    """Re-rate all completed matches of a tournament, e.g. after a formula change"""
+    session = session or db.session
+    if session.scalar(select(Tournament.status).where(Tournament.id == tournament_id)) == 'archived':
+        raise ValueError('Archived tournaments are read-only')
+    ids, ratings = compute(_rating_rows(session, Match.tournament_id == tournament_id))
+    count = _write(session, ids, ratings)
+    session.commit()
+    return count
+
+
+def register_cli(app):
+    @app.cli.command('rerate')
+    @click.option('--tournament-id', type=int, default=None, help='Only this tournament.')
+    def rerate_command(tournament_id):
+        """Recompute player match ratings with the current formula."""
+        from tenancy import use_tenant
+        ids = [tournament_id] if tournament_id else db.session.scalars(
+            select(Tournament.id).where(Tournament.status != 'archived').order_by(Tournament.id)).all()
+        for tid in ids:
+            with use_tenant(tid):
+                print(f'Tournament {tid}: {rate_tournament(tid)} performance(s) rated')
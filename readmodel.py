@@ -0,0 +1,497 @@
+"""Modèle de lecture d'un tournoi en mémoire partagée entre les workers.
+
+Le tournoi, ses équipes dans l'ordre du classement (avec les chiffres du
+classement, les cartons de TeamStats et TeamRecord), ses matchs et ses effectifs sont sérialisés dans un fichier
+binaire compact (READMODEL_DIR/tournament-<id>.bin, à placer sur un disque
+local, idéalement tmpfs) :
+
+    en-tête | sections (tableaux NumPy structurés) | table des chaînes UTF-8
+
+Chaque worker ouvre le fichier par mmap et lit les sections avec
+``np.frombuffer`` sans copie : les pages viennent du cache du noyau,
+partagé par tous les processus, donc la mémoire par worker ne grandit pas
+avec le nombre de tournois consultés et les pages publiques ne touchent
+plus la base. Seules les lignes affichées sont décodées en objets.
+
+Après chaque commit qui modifie un tournoi, une équipe, ses statistiques,
+un match ou un joueur, le worker qui a écrit reconstruit le fichier dans un
+thread (les écritures rapprochées sont regroupées) puis le remplace
+atomiquement ; les autres workers voient le changement d'inode au prochain
+``load`` et remappent le nouveau fichier. Les écritures en masse qui ne
+passent pas par le flush appellent ``invalidate`` elles-mêmes. Les calendriers
+publiés par feeds.py sont reconstruits dans la même passe.
+
+En attendant le thread, le commit date un marqueur tournament-<id>.stale :
+un ``load`` qui trouve le marqueur plus récent que le fichier reconstruit
+lui-même (et les calendriers), si bien que la page qui suit une écriture
+(redirection après un formulaire, un import...) la voit toujours, quel que
+soit le worker. Le service ASGI du direct, sans thread de reconstruction,
+n'écrit que le marqueur (``mark_stale``).
+
+    flask build-read-models [--tournament-id ID]
+"""
+import os
+import mmap
+import time
+import struct
+import logging
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import click
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, select
+
+from extensions import db
+from models import Tournament, Team, TeamStats, TeamRecord, Player, Match
+from tenancy import TenantSession, use_tenant
+from tiebreakers import standings_for, team_stats_figures
+import feeds
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TRM1'
+HEADER = struct.Struct('<4sHHid')   # magic, version du format, nombre de sections, id du tournoi, date de construction
+SECTION = struct.Struct('<QQ')      # offset, longueur en octets
+FORMAT_VERSION = 1
+ALIGN = 8
+NONE = 0xFFFFFFFF                   # offset d'une chaîne absente (None)
+DEBOUNCE = float(os.environ.get('READMODEL_DEBOUNCE_SECONDS', '0.2'))
+
+STR = ('<u4', (2,))                 # (offset, longueur) dans la table des chaînes
+STATS_FIELDS = ('matches_played', 'victoires', 'nuls', 'defaites', 'goals_marques', 'buts_encaisses',
+                'difference_des_buts', 'points', 'carton_jaunes', 'cartons_rouges')
+RECORD_FIELDS = ('home_played', 'home_wins', 'home_draws', 'home_losses', 'home_goals_for', 'home_goals_against',
+                 'away_played', 'away_wins', 'away_draws', 'away_losses', 'away_goals_for', 'away_goals_against')
+
+# Entiers absents (None) stockés à -1 ; dates en ordinal, 0 pour None ; instants en secondes depuis 1970
+META_DTYPE = np.dtype([('id', '<i4'), ('name', STR), ('description', STR), ('status', STR),
+                       ('start_date', '<i4'), ('end_date', '<i4'), ('max_teams', '<i4')])
+TEAM_DTYPE = np.dtype([('id', '<i4'), ('name', STR), ('city', STR), ('founded_year', '<i4'), ('coach_id', '<i4'),
+                       ('has_record', 'u1'), ('form', STR)]
+                      + [(field, '<i4') for field in STATS_FIELDS + RECORD_FIELDS])
+MATCH_DTYPE = np.dtype([('id', '<i4'), ('home_team_id', '<i4'), ('away_team_id', '<i4'), ('match_date', '<i8'),
+                        ('venue', STR), ('home_score', '<i4'), ('away_score', '<i4'), ('status', STR),
+                        ('round_number', '<i4'), ('referee_id', '<i4')])
+PLAYER_DTYPE = np.dtype([('id', '<i4'), ('team_id', '<i4'), ('name', STR), ('position', STR),
+                         ('jersey_number', '<i4'), ('age', '<i4'), ('nationality', STR), ('is_available', 'u1'),
+                         ('photo_filename', STR)])
+SECTIONS = (('meta', META_DTYPE), ('teams', TEAM_DTYPE), ('matches', MATCH_DTYPE), ('players', PLAYER_DTYPE))
+
+# Modèles dont l'écriture rend le modèle de lecture périmé, et comment retrouver le tournoi
+_WATCHED = {
+    Tournament: lambda obj: ('tournament', obj.id),
+    Team: lambda obj: ('tournament', obj.tournament_id),
+    Match: lambda obj: ('tournament', obj.tournament_id),
+    TeamStats: lambda obj: ('team', obj.team_id),
+    TeamRecord: lambda obj: ('team', obj.team_id),
+    Player: lambda obj: ('team', obj.team_id),
+}
+
+
+def directory():
+    return current_app.config['READMODEL_DIR']
+
+
+def path_for(tournament_id):
+    return os.path.join(directory(), f'tournament-{tournament_id}.bin')
+
+
+def marker_for(tournament_id, path=None):
+    return os.path.join(path or directory(), f'tournament-{tournament_id}.stale')
+
+
+def mark_stale(tournament_ids, path=None):
+    """Date the markers of tournaments whose committed changes are not in their file yet;
+    `path` is the read model directory when called outside Flask"""
+    now = time.time_ns()
+    path = path or directory()
+    os.makedirs(path, exist_ok=True)
+    for tournament_id in tournament_ids:
+        marker = marker_for(tournament_id, path)
+        with open(marker, 'a'):
+            pass
+        os.utime(marker, ns=(now, now))
+
+
+def _is_stale(tournament_id, stat):
+    # Le fichier porte comme date le début de sa construction (voir build)
+    try:
+        return os.stat(marker_for(tournament_id)).st_mtime_ns > stat.st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+class _Strings:
+    """UTF-8 string table, identical strings stored once"""
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = {}
+
+    def ref(self, value):
+        if value is None:
+            return (NONE, 0)
+        if value not in self.offsets:
+            data = str(value).encode('utf-8')
+            self.offsets[value] = (len(self.blob), len(data))
+            self.blob += data
+        return self.offsets[value]
+
+
+def _int(value):
+    return -1 if value is None else int(value)
+
+
+def _ordinal(value):
+    return value.toordinal() if value else 0
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _timestamp(value):
+    return int((value - EPOCH).total_seconds()) if value else 0
+
+
+def _standings(tournament, team_ids):
+    """{team_id: standings row} in ranking order, teams absent from the rows last"""
+    rows = {row['team_id']: row for row in standings_for(tournament) if row['team_id'] in team_ids}
+    return dict(rows, **{team_id: None for team_id in sorted(team_ids - set(rows))})
+
+
+def serialize(tournament_id):
+    """Binary read model of a tournament, or None if it does not exist"""
+    import archive
+
+    tournament = db.session.get(Tournament, tournament_id)
+    if tournament is None:
+        return None
+    strings = _Strings()
+    teams = {team.id: team for team in Team.query.filter_by(tournament_id=tournament_id)}
+    stats = {row.team_id: row for row in TeamStats.query.filter(TeamStats.team_id.in_(teams))}
+    records = {row.team_id: row for row in TeamRecord.query.filter(TeamRecord.team_id.in_(teams))}
+    source = archive.sources(tournament_id).match
+    matches = source.query.filter_by(tournament_id=tournament_id).order_by(source.match_date, source.id).all()
+    players = Player.query.filter(Player.team_id.in_(teams)).order_by(Player.team_id, Player.jersey_number, Player.id).all()
+
+    meta = np.zeros(1, META_DTYPE)
+    meta[0] = (tournament.id, strings.ref(tournament.name), strings.ref(tournament.description),
+               strings.ref(tournament.status), _ordinal(tournament.start_date), _ordinal(tournament.end_date),
+               _int(tournament.max_teams))
+
+    # Équipes dans l'ordre du classement : le rang est l'indice dans la section ; les chiffres sont ceux
+    # du même calcul, TeamStats ne fournit que les cartons
+    standings = _standings(tournament, set(teams))
+    team_rows = np.zeros(len(standings), TEAM_DTYPE)
+    for index, (team_id, row) in enumerate(standings.items()):
+        team, team_stats, record = teams[team_id], stats.get(team_id), records.get(team_id)
+        figures = team_stats_figures(row)
+        team_rows[index] = (
+            team.id, strings.ref(team.name), strings.ref(team.city), _int(team.founded_year), _int(team.coach_id),
+            record is not None, strings.ref(record.form if record else None),
+            *[figures[field] if field in figures else (getattr(team_stats, field) or 0) if team_stats else 0
+              for field in STATS_FIELDS],
+            *[(getattr(record, field) or 0) if record else 0 for field in RECORD_FIELDS],
+        )
+
+    match_rows = np.zeros(len(matches), MATCH_DTYPE)
+    for index, match in enumerate(matches):
+        match_rows[index] = (match.id, match.home_team_id, match.away_team_id, _timestamp(match.match_date),
+                             strings.ref(match.venue), _int(match.home_score), _int(match.away_score),
+                             strings.ref(match.status), _int(match.round_number), _int(match.referee_id))
+
+    player_rows = np.zeros(len(players), PLAYER_DTYPE)
+    for index, player in enumerate(players):
+        player_rows[index] = (player.id, player.team_id, strings.ref(player.name), strings.ref(player.position),
+                              _int(player.jersey_number), _int(player.age), strings.ref(player.nationality),
+                              bool(player.is_available), strings.ref(player.photo_filename))
+
+    sections = [meta.tobytes(), team_rows.tobytes(), match_rows.tobytes(), player_rows.tobytes(), bytes(strings.blob)]
+    header_size = HEADER.size + SECTION.size * len(sections)
+    offset = header_size
+    table, body = [], bytearray()
+    for data in sections:
+        padding = -offset % ALIGN
+        body += b'\0' * padding
+        offset += padding
+        table.append(SECTION.pack(offset, len(data)))
+        body += data
+        offset += len(data)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), tournament_id, time.time()) + b''.join(table) + bytes(body)
+
+
+def build(tournament_id):
+    """Write the read model of a tournament atomically; returns its path, or None if it does not exist"""
+    started = time.time_ns()
+    with use_tenant(tournament_id):
+        data = serialize(tournament_id)
+    path = path_for(tournament_id)
+    if data is None:
+        if os.path.exists(path):
+            os.unlink(path)
+        return None
+    os.makedirs(directory(), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory(), prefix=f'.tournament-{tournament_id}-')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(data)
+        # Un commit marqué après `started` peut manquer au fichier : il reste périmé
+        os.utime(tmp, ns=(started, started))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+class TournamentView:
+    """Zero-copy reader of a read model file; rows are decoded into plain objects on access"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.stat = os.fstat(handle.fileno())
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, self.tournament_id, self.built_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a tournament read model (version {FORMAT_VERSION})')
+        spans = [SECTION.unpack_from(self._map, HEADER.size + SECTION.size * i) for i in range(count)]
+        for (name, dtype), (offset, length) in zip(SECTIONS, spans):
+            setattr(self, f'_{name}', np.frombuffer(self._map, dtype=dtype, count=length // dtype.itemsize,
+                                                    offset=offset))
+        offset, length = spans[len(SECTIONS)]
+        self._strings = memoryview(self._map)[offset:offset + length]
+        self._team_objects = None
+
+    def _str(self, ref):
+        offset, length = int(ref[0]), int(ref[1])
+        if offset == NONE:
+            return None
+        return str(self._strings[offset:offset + length], 'utf-8')
+
+    @staticmethod
+    def _opt(value):
+        value = int(value)
+        return None if value == -1 else value
+
+    @property
+    def tournament(self):
+        row = self._meta[0]
+        return SimpleNamespace(
+            id=int(row['id']), name=self._str(row['name']), description=self._str(row['description']),
+            status=self._str(row['status']),
+            start_date=date.fromordinal(int(row['start_date'])) if row['start_date'] else None,
+            end_date=date.fromordinal(int(row['end_date'])) if row['end_date'] else None,
+            max_teams=self._opt(row['max_teams']),
+        )
+
+    def _teams_by_id(self):
+        if self._team_objects is None:
+            self._team_objects = {
+                int(row['id']): SimpleNamespace(
+                    id=int(row['id']), name=self._str(row['name']), city=self._str(row['city']),
+                    founded_year=self._opt(row['founded_year']), coach_id=self._opt(row['coach_id']),
+                    tournament_id=self.tournament_id,
+                )
+                for row in self._teams
+            }
+        return self._team_objects
+
+    def teams(self):
+        teams = self._teams_by_id()
+        return sorted(teams.values(), key=lambda team: team.id)
+
+    def standings(self):
+        """{'team', 'stats', 'record'} rows in ranking order, record being the home/away TeamRecord and form"""
+        teams = self._teams_by_id()
+        rows = []
+        for row in self._teams:
+            team = teams[int(row['id'])]
+            stats = SimpleNamespace(team_id=team.id, team=team, **{field: int(row[field]) for field in STATS_FIELDS})
+            record = SimpleNamespace(team_id=team.id, form=self._str(row['form']) or '',
+                                     **{field: int(row[field]) for field in RECORD_FIELDS}) if row['has_record'] else None
+            rows.append({'team': team, 'stats': stats, 'record': record})
+        return rows
+
+    def matches(self, team_id=None):
+        """Fixtures and results by date, optionally those of one team"""
+        rows = self._matches
+        if team_id is not None:
+            rows = rows[(rows['home_team_id'] == team_id) | (rows['away_team_id'] == team_id)]
+        teams = self._teams_by_id()
+        return [
+            SimpleNamespace(
+                id=int(row['id']), tournament_id=self.tournament_id,
+                home_team_id=int(row['home_team_id']), away_team_id=int(row['away_team_id']),
+                home_team=teams.get(int(row['home_team_id'])), away_team=teams.get(int(row['away_team_id'])),
+                match_date=EPOCH + timedelta(seconds=int(row['match_date'])), venue=self._str(row['venue']),
+                home_score=self._opt(row['home_score']), away_score=self._opt(row['away_score']),
+                status=self._str(row['status']), round_number=self._opt(row['round_number']),
+                referee_id=self._opt(row['referee_id']),
+            )
+            for row in rows
+        ]
+
+    def squad(self, team_id):
+        """Players of a team by jersey number; the section is sorted by team, so this is a binary search"""
+        ids = self._players['team_id']
+        start, end = np.searchsorted(ids, team_id, 'left'), np.searchsorted(ids, team_id, 'right')
+        return [
+            SimpleNamespace(
+                id=int(row['id']), team_id=team_id, name=self._str(row['name']), position=self._str(row['position']),
+                jersey_number=self._opt(row['jersey_number']), age=self._opt(row['age']),
+                nationality=self._str(row['nationality']), is_available=bool(row['is_available']),
+                photo_filename=self._str(row['photo_filename']),
+            )
+            for row in self._players[start:end]
+        ]
+
+
+_views = {}
+_views_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def _current_stat(tournament_id, path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return None if _is_stale(tournament_id, stat) else stat
+
+
+def load(tournament_id):
+    """Current read model of a tournament, built on first use or while a rebuild is pending;
+    None if the tournament does not exist"""
+    path = path_for(tournament_id)
+    stat = _current_stat(tournament_id, path)
+    if stat is None:
+        with _build_lock:
+            # Un autre thread du worker vient peut-être de le reconstruire
+            stat = _current_stat(tournament_id, path)
+            if stat is None:
+                if build(tournament_id) is None:
+                    return None
+                stat = os.stat(path)
+                if os.path.exists(marker_for(tournament_id)):
+                    # Changement pas encore vu par le thread (ou écrit par le service du direct)
+                    feeds.build(tournament_id)
+    view = _views.get(tournament_id)
+    if view is None or (view.stat.st_ino, view.stat.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+        # Fichier remplacé par un autre worker : l'ancien mapping est libéré avec ses dernières vues
+        view = TournamentView(path)
+        with _views_lock:
+            _views[tournament_id] = view
+    return view
+
+
+class Rebuilder:
+    """Background thread rebuilding the read models changed by committed transactions"""
+
+    def __init__(self):
+        self.app = None
+        self.pending = set()        # identifiants de tournois
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, tournament_ids):
+        if self.app is None or not tournament_ids:
+            return
+        with self.condition:
+            self.pending |= tournament_ids
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='readmodel-rebuilder', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+            # Regroupe les commits rapprochés (buts, checkpoints du direct) en une seule reconstruction
+            time.sleep(DEBOUNCE)
+            with self.condition:
+                tournament_ids, self.pending = self.pending, set()
+            with self.app.app_context():
+                self.rebuild(tournament_ids)
+
+    def rebuild(self, tournament_ids):
+        try:
+            for tournament_id in sorted(tournament_ids):
+                # Calendriers publiés (feeds.py), réécrits seulement si leur contenu change ; avant le
+                # modèle de lecture, dont la date dit à feeds.serve que les calendriers sont à jour
+                feeds.build(tournament_id)
+                build(tournament_id)
+        except Exception:
+            logger.exception('Read model rebuild failed for %s', sorted(tournament_ids))
+        finally:
+            db.session.remove()
+
+
+rebuilder = Rebuilder()
+
+
+def _committed(tournament_ids):
+    tournament_ids = {tournament_id for tournament_id in tournament_ids if tournament_id is not None}
+    if rebuilder.app is None or not tournament_ids:
+        return
+    mark_stale(tournament_ids)
+    rebuilder.schedule(tournament_ids)
+
+
+def invalidate(*tournament_ids):
+    """Rebuild after committed writes that bypass the session flush (bulk INSERT/DELETE, other sessions)"""
+    _committed(set(tournament_ids))
+
+
+_team_tournaments = {}  # équipe -> tournoi, pour connaître les tournois touchés sans requête au commit
+
+
+def _collect_flushed(session, flush_context):
+    tournament_ids = session.info.setdefault('readmodel_changes', set())
+    team_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        describe = _WATCHED.get(type(obj))
+        if describe is None:
+            continue
+        kind, key = describe(obj)
+        if kind == 'team':
+            team_ids.add(key)
+        else:
+            tournament_ids.add(key)
+        if type(obj) is Team and obj.id is not None:
+            _team_tournaments[obj.id] = obj.tournament_id
+    unknown = {team_id for team_id in team_ids if team_id is not None and team_id not in _team_tournaments}
+    if unknown:
+        _team_tournaments.update(session.execute(select(Team.id, Team.tournament_id).where(Team.id.in_(unknown))).all())
+    tournament_ids.update(_team_tournaments[team_id] for team_id in team_ids if team_id in _team_tournaments)
+
+
+def _schedule_committed(session):
+    _committed(session.info.pop('readmodel_changes', set()))
+
+
+def _forget_rolled_back(session):
+    session.info.pop('readmodel_changes', None)
+
+
+event.listen(TenantSession, 'after_flush', _collect_flushed)
+event.listen(TenantSession, 'after_commit', _schedule_committed)
+event.listen(TenantSession, 'after_rollback', _forget_rolled_back)
+
+
+def init_app(app):
+    app.config.setdefault('READMODEL_DIR', os.path.join(tempfile.gettempdir(), 'football-readmodel'))
+    rebuilder.app = app
+
+    @app.cli.command('build-read-models')
+    @click.option('--tournament-id', type=int, default=None, help='Only this tournament.')
+    def build_read_models_command(tournament_id):
+        """Write the shared read model files of tournaments."""
+        ids = [tournament_id] if tournament_id else db.session.scalars(select(Tournament.id)).all()
+        for tid in ids:
+            print(f'Tournament {tid}: {build(tid) or "not found"}')
@@ -1,15 +1,38 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, abort
 from app import app, db
-from models import Tournament, Team, Player, Match, MatchUpdate, MatchStats, PlayerStats, PlayerMatchPerformance
+from decorators import admin_required, coach_required, idempotent
+from concurrency import VersionConflict, check_version, expected_version, commit
+from db_pool import pool_stats
+from media import store_upload, serve_media
+from jobs import enqueue
+from export import EXPORTS, FORMATS, export_chunks, available as export_available
+from analytics import SeasonAnalytics
+import matchups
+import archive
+import queries
+import search
+import live_state
+import ratings
+import outbox
+import readmodel
+import feeds
+from admission import admit, controller as admission_controller
+from simulation import qualification_report, MAX_SIMS
+from tenancy import fan_out
+from flask_login import current_user
+from models import Tournament, Team, Player, Match, MatchStats, PlayerMatchPerformance, Job, TournamentSnapshot
 from forms import TournamentForm, TeamForm, PlayerForm, MatchForm, ScoreForm
-from datetime import datetime, timedelta
-import itertools
-import random
+import os
+import uuid
 
 @app.route('/')
 def index():
     tournaments = Tournament.query.order_by(Tournament.created_at.desc()).limit(5).all()
-    recent_matches = Match.query.filter_by(status='completed').order_by(Match.match_date.desc()).limit(5).all()
+    # Matchs répartis entre les bases des tournois : top 5 de chaque base puis fusion
+    recent_matches = fan_out(
+        lambda: queries.recent_matches(5, rows=app.config.get('HOT_QUERY_ROWS', False)),
+        key=lambda match: match.match_date, reverse=True, limit=5
+    )
     return render_template('index.html', tournaments=tournaments, recent_matches=recent_matches)
 
 # Tournament routes
@@ -27,7 +50,8 @@ def create_tournament():
             description=form.description.data,
             start_date=form.start_date.data,
             end_date=form.end_date.data,
-            max_teams=form.max_teams.data
+            max_teams=form.max_teams.data,
+            tiebreak_rules=form.tiebreak_rules.data
         )
         db.session.add(tournament)
         db.session.commit()
@@ -37,55 +61,87 @@ def create_tournament():
 
 @app.route('/tournaments/<int:id>')
 def tournament_detail(id):
-    tournament = Tournament.query.get_or_404(id)
-    teams = Team.query.filter_by(tournament_id=id).all()
-    matches = Match.query.filter_by(tournament_id=id).order_by(Match.match_date).all()
-    
-    # Calculate standings
-    standings = []
-    for team in teams:
-        stats = team.get_stats()
-        standings.append({
-            'team': team,
-            'stats': stats
-        })
-    
-    # Sort standings by points, then goal difference, then goals for
-    standings.sort(key=lambda x: (x['stats']['points'], x['stats']['goal_difference'], x['stats']['goals_for']), reverse=True)
+    # Lu dans le modèle de lecture partagé (voir readmodel.py), y compris les matchs archivés
+    view = readmodel.load(id)
+    if view is None:
+        abort(404)
     
-    return render_template('tournaments/detail.html', tournament=tournament, teams=teams, matches=matches, standings=standings)
+    return render_template('tournaments/detail.html', tournament=view.tournament, teams=view.teams(),
+                           matches=view.matches(), standings=view.standings())
 
 @app.route('/tournaments/<int:id>/generate_fixtures', methods=['POST'])
 def generate_fixtures(id):
     tournament = Tournament.query.get_or_404(id)
-    teams = Team.query.filter_by(tournament_id=id).all()
+    ensure_writable(tournament)
+    team_count = Team.query.filter_by(tournament_id=id).count()
     
-    if len(teams) < 2:
+    if team_count < 2:
         flash('Need at least 2 teams to generate fixtures!', 'error')
         return redirect(url_for('tournament_detail', id=id))
     
-    # Delete existing matches
-    Match.query.filter_by(tournament_id=id).delete()
-    
-    # Generate round-robin fixtures
-    team_combinations = list(itertools.combinations(teams, 2))
-    start_date = tournament.start_date
-    
-    for i, (home_team, away_team) in enumerate(team_combinations):
-        match_date = start_date + timedelta(days=i * 3)  # Matches every 3 days
-        match = Match(
-            tournament_id=id,
-            home_team_id=home_team.id,
-            away_team_id=away_team.id,
-            match_date=match_date,
-            round_number=1
-        )
-        db.session.add(match)
-    
-    tournament.status = 'active'
-    db.session.commit()
-    flash('Fixtures generated successfully!', 'success')
-    return redirect(url_for('tournament_detail', id=id))
+    # La génération (suppression + recréation de tous les matchs) tourne en arrière-plan
+    job = enqueue('generate_fixtures', created_by=current_user, tournament_id=id)
+    return job_accepted(job, 'Fixture generation started', url_for('tournament_detail', id=id))
+
+@app.route('/tournaments/<int:id>/recompute_stats', methods=['POST'])
+@admin_required
+def recompute_stats(id):
+    ensure_writable(Tournament.query.get_or_404(id))
+    job = enqueue('recompute_tournament_stats', created_by=current_user, tournament_id=id)
+    return job_accepted(job, 'Stats recomputation started', url_for('standings', id=id))
+
+@app.route('/tournaments/<int:id>/rerate', methods=['POST'])
+@admin_required
+def rerate_tournament(id):
+    # Après un changement de formule (voir ratings.py)
+    ensure_writable(Tournament.query.get_or_404(id))
+    job = enqueue('rerate_tournament', created_by=current_user, tournament_id=id)
+    return job_accepted(job, 'Player re-rating started', url_for('tournament_detail', id=id))
+
+@app.route('/tournaments/<int:id>/archive', methods=['POST'])
+@admin_required
+def archive_tournament(id):
+    tournament = Tournament.query.get_or_404(id)
+    if tournament.status == 'archived':
+        flash('Tournament is already archived.', 'info')
+        return redirect(url_for('tournament_detail', id=id))
+    if not archive.archivable(tournament):
+        flash('Only completed tournaments can be archived.', 'error')
+        return redirect(url_for('tournament_detail', id=id))
+    job = enqueue('archive_tournament', created_by=current_user, tournament_id=id)
+    return job_accepted(job, 'Archival started', url_for('tournament_detail', id=id))
+
+def ensure_writable(tournament):
+    """Les tournois archivés sont en lecture seule"""
+    if tournament.status == 'archived':
+        abort(409, description='Archived tournaments are read-only')
+
+def job_accepted(job, message, next_url):
+    """202 + job id pour les clients JSON, sinon flash et redirection"""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job.id, 'status_url': url_for('job_status', id=job.id)}), 202
+    flash(f'{message} (job #{job.id}).', 'info')
+    return redirect(next_url)
+
+@app.route('/jobs/<int:id>')
+@admin_required
+def job_status(id):
+    job = Job.query.get_or_404(id)
+    return jsonify(job.to_dict())
+
+@app.route('/tournaments/<int:id>/export/<table>.<fmt>')
+@admin_required
+def export_season(id, table, fmt):
+    tournament = Tournament.query.get_or_404(id)
+    if table not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    if not export_available(fmt):
+        abort(501, description='Parquet export requires pyarrow, which is not installed on this server')
+    
+    # Les lignes sont envoyées au fil de la lecture du curseur
+    response = Response(stream_with_context(export_chunks(id, table, fmt)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="tournament-{tournament.id}-{table}.{fmt}"'
+    return response
 
 # Team routes
 @app.route('/teams')
@@ -134,7 +190,8 @@ def team_detail(id):
             'stats': player_stats
         })
     
-    return render_template('teams/detail.html', team=team, players=players_with_stats, stats=stats)
+    return render_template('teams/detail.html', team=team, players=players_with_stats, stats=stats,
+                         record=team.record, head_to_head=matchups.head_to_head_for_team(id))
 
 # Player routes
 @app.route('/players')
@@ -142,6 +199,21 @@ def players():
     players = Player.query.join(Team).order_by(Team.name, Player.jersey_number).all()
     return render_template('players/list.html', players=players)
 
+# Full-text search over tournaments, teams and players (see search.py)
+@app.route('/search')
+def search_page():
+    query = request.args.get('q', '')
+    kinds = [kind for kind in request.args.getlist('type') if kind in search.INDEXED] or None
+    results = [search.as_dict(row) for row in search.search(query, kinds=kinds, limit=search.MAX_RESULTS)]
+    return render_template('search.html', query=query, results=results)
+
+@app.route('/api/search')
+@admit('standard')
+def api_search():
+    kinds = [kind for kind in request.args.getlist('type') if kind in search.INDEXED] or None
+    rows = search.search(request.args.get('q', ''), kinds=kinds, limit=request.args.get('limit', 20, type=int))
+    return jsonify({'results': [search.as_dict(row) for row in rows]})
+
 @app.route('/teams/<int:team_id>/players/create', methods=['GET', 'POST'])
 def create_player(team_id):
     team = Team.query.get_or_404(team_id)
@@ -162,6 +234,12 @@ def create_player(team_id):
             nationality=form.nationality.data,
             team_id=team_id
         )
+        if form.photo.data:
+            try:
+                player.photo_filename = store_upload(form.photo.data)
+            except ValueError as e:
+                flash(str(e), 'error')
+                return render_template('players/create.html', form=form, team=team)
         db.session.add(player)
         db.session.commit()
         flash(f'Player "{player.name}" added successfully!', 'success')
@@ -169,10 +247,56 @@ def create_player(team_id):
     
     return render_template('players/create.html', form=form, team=team)
 
+@app.route('/players/<int:id>/photo', methods=['POST'])
+@admin_required
+def upload_player_photo(id):
+    player = Player.query.get_or_404(id)
+    photo = request.files.get('photo')
+    if not photo or not photo.filename:
+        flash('No photo selected!', 'error')
+        return redirect(url_for('player_detail', id=id))
+    try:
+        player.photo_filename = store_upload(photo)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('player_detail', id=id))
+    db.session.commit()
+    flash('Photo updated successfully!', 'success')
+    return redirect(url_for('player_detail', id=id))
+
+@app.route('/media/players/<filename>')
+def player_photo(filename):
+    return serve_media(filename)
+
+@app.route('/media/players/<size>/<filename>')
+def player_photo_thumbnail(size, filename):
+    return serve_media(filename, size=size)
+
+@app.route('/tournaments/<int:tournament_id>/import/<kind>', methods=['POST'])
+@admin_required
+def bulk_import(tournament_id, kind):
+    ensure_writable(Tournament.query.get_or_404(tournament_id))
+    upload = request.files.get('file')
+    fmt = upload.filename.rsplit('.', 1)[-1].lower() if upload and upload.filename else None
+    fmt = 'json' if fmt in ('json', 'jsonl', 'ndjson') else fmt
+    if kind not in ('teams', 'players') or fmt not in ('csv', 'json'):
+        flash('Please upload a CSV or JSON file of teams or players.', 'error')
+        return redirect(url_for('tournament_detail', id=tournament_id))
+    
+    # Le fichier est traité par un worker : on le copie hors de la requête
+    import_dir = os.path.join(app.instance_path, 'imports')
+    os.makedirs(import_dir, exist_ok=True)
+    path = os.path.join(import_dir, f'{uuid.uuid4().hex}.{fmt}')
+    upload.save(path)
+    
+    job = enqueue('bulk_import', created_by=current_user, kind=kind, path=path, fmt=fmt, tournament_id=tournament_id)
+    return job_accepted(job, f'Import of {kind} started', url_for('tournament_detail', id=tournament_id))
+
 # Match routes
 @app.route('/matches')
 def matches():
-    matches = Match.query.order_by(Match.match_date.desc()).all()
+    matches = fan_out(lambda: Match.query.order_by(Match.match_date.desc()).all(),
+                      key=lambda match: match.match_date, reverse=True)
     return render_template('matches/list.html', matches=matches)
 
 @app.route('/matches/<int:id>/update_score', methods=['GET', 'POST'])
@@ -183,12 +307,31 @@ def update_score(id):
     if request.method == 'GET':
         form.home_score.data = match.home_score
         form.away_score.data = match.away_score
+        form.version.data = match.version_id
     
     if form.validate_on_submit():
-        match.home_score = form.home_score.data
-        match.away_score = form.away_score.data
-        match.status = 'completed'
-        db.session.commit()
+        try:
+            check_version(match, expected_version({'version': form.version.data}))
+            # Score déjà pris en compte dans l'index des confrontations en cas de correction
+            previous = (match.home_score, match.away_score) if match.status == 'completed' else None
+            match.home_score = form.home_score.data
+            match.away_score = form.away_score.data
+            match.status = 'completed'
+            matchups.record_result(match, previous=previous)
+            # Le score change les clean sheets et buts encaissés : notes recalculées
+            ratings.rate_match(id)
+            outbox.publish_result(match)
+            commit(match)
+            # Score saisi à la main : l'état en direct repartira de cette ligne
+            live_state.reset(id)
+        except VersionConflict:
+            db.session.rollback()
+            db.session.refresh(match)
+            flash('This score was changed by someone else meanwhile. Check the current score and try again.', 'error')
+            form.home_score.data = match.home_score
+            form.away_score.data = match.away_score
+            form.version.data = match.version_id
+            return render_template('matches/update_score.html', form=form, match=match), 409
         flash('Match score updated successfully!', 'success')
         return redirect(url_for('matches'))
     
@@ -196,21 +339,30 @@ def update_score(id):
 
 @app.route('/tournaments/<int:id>/standings')
 def standings(id):
-    tournament = Tournament.query.get_or_404(id)
-    teams = Team.query.filter_by(tournament_id=id).all()
-    
-    standings = []
-    for team in teams:
-        stats = team.get_stats()
-        standings.append({
-            'team': team,
-            'stats': stats
-        })
+    view = readmodel.load(id)
+    if view is None:
+        abort(404)
     
-    # Sort standings by points, then goal difference, then goals for
-    standings.sort(key=lambda x: (x['stats']['points'], x['stats']['goal_difference'], x['stats']['goals_for']), reverse=True)
-    
-    return render_template('standings.html', tournament=tournament, standings=standings)
+    return render_template('standings.html', tournament=view.tournament, standings=view.standings())
+
+@app.route('/feeds/<kind>/<int:key>.<fmt>')
+def fixtures_feed(kind, key, fmt):
+    # Hors des préfixes /tournaments/<id> et /teams/<id> : aucun tenant à résoudre, donc aucune requête
+    return feeds.serve(kind, key, fmt)
+
+@app.route('/tournaments/<int:id>/simulation')
+@admit('standard')
+def tournament_simulation(id):
+    Tournament.query.get_or_404(id)
+    report = qualification_report(
+        id,
+        qualify=request.args.get('qualify', 1, type=int),
+        relegate=request.args.get('relegate', 0, type=int),
+        # Route publique : calcul borné, au moins une simulation
+        n_sims=max(1, min(request.args.get('sims', MAX_SIMS, type=int), MAX_SIMS)),
+        seed=request.args.get('seed', type=int)
+    )
+    return jsonify(report)
 
 # Live Match Routes
 @app.route('/matches/<int:id>/live')
@@ -227,122 +379,170 @@ def live_match(id):
 
 # API Routes for Live Updates
 @app.route('/api/matches/<int:id>/live')
+@admit('spectator')
 def api_live_match_data(id):
     match = Match.query.get_or_404(id)
     
-    # Get recent updates (last 10)
-    recent_updates = MatchUpdate.query.filter_by(match_id=id)\
-                                    .order_by(MatchUpdate.timestamp.desc())\
-                                    .limit(10).all()
-    
-    # Get match stats
-    stats = match.stats_detail
-    
-    response_data = {
-        'home_score': match.home_score,
-        'away_score': match.away_score,
-        'status': match.status,
-        'updates': [update.to_dict() for update in recent_updates],
-        'stats': stats.to_dict() if stats else None
-    }
-    
-    return jsonify(response_data)
+    # Match en cours : état en mémoire (voir live_state.py), la ligne match n'est écrite qu'aux checkpoints
+    if match.status == 'in_progress' or live_state.registry.peek(id):
+        response_data = live_state.current(id).to_dict()
+    else:
+        # Get recent updates (last 10), team and player names joined in a cached statement
+        recent_updates = queries.live_events(id, limit=10)
+        
+        # Get match stats
+        stats = match.stats_detail
+        
+        response_data = {
+            'home_score': match.home_score,
+            'away_score': match.away_score,
+            'status': match.status,
+            'version': match.version_id,
+            'updates': recent_updates,
+            'stats': stats.to_dict() if stats else None
+        }
+    
+    response = jsonify(response_data)
+    # Renvoyé dans If-Match par les POST suivants
+    response.headers['ETag'] = f'"{response_data["version"]}"'
+    return response
+
+def live_event_response(id, event_type, data, **fields):
+    """Apply an event to the live state; 404, 409 (stale If-Match / version) or 400 on failure"""
+    state = live_state.registry.get(id)
+    if state is None:
+        abort(404)
+    expected = expected_version(data)
+    if expected is not None and expected != state.version:
+        return live_state.conflict_response(state)
+    try:
+        state = live_state.record_event(id, event_type, **fields)
+    except live_state.InvalidEvent as error:
+        return jsonify({'error': str(error)}), 400
+    payload = state.to_dict()
+    payload['updates'] = payload['updates'][:1]
+    return jsonify(payload)
 
 @app.route('/api/matches/<int:id>/score', methods=['POST'])
+@admit('critical')
+@idempotent
 def api_update_score(id):
-    match = Match.query.get_or_404(id)
-    data = request.get_json()
-    
+    data = request.get_json(silent=True) or {}
     team = data.get('team')  # 'home' or 'away'
-    
-    if team == 'home':
-        match.home_score += 1
-        team_obj = Team.query.get(match.home_team_id)
-    elif team == 'away':
-        match.away_score += 1
-        team_obj = Team.query.get(match.away_team_id)
-    else:
+    if team not in ('home', 'away'):
         return jsonify({'error': 'Invalid team'}), 400
-    
-    # Create match update
-    update = MatchUpdate(
-        match_id=id,
-        minute=random.randint(1, 90),
-        update_type='goal',
-        team_id=team_obj.id,
-        description=f'⚽ BUT ! {team_obj.name} marque !'
-    )
-    
-    # Update match stats
-    if not match.stats_detail:
-        stats = MatchStats(match_id=id)
-        db.session.add(stats)
-    else:
-        stats = match.stats_detail
-    
-    # Simulate some stats updates
-    if team == 'home':
-        stats.home_shots += random.randint(1, 3)
-        stats.home_shots_on_target += 1
-    else:
-        stats.away_shots += random.randint(1, 3)
-        stats.away_shots_on_target += 1
-    
-    # Random possession adjustment
-    possession_change = random.randint(-5, 5)
-    if team == 'home':
-        stats.home_possession = min(100, max(0, stats.home_possession + possession_change))
-        stats.away_possession = 100 - stats.home_possession
-    else:
-        stats.away_possession = min(100, max(0, stats.away_possession + possession_change))
-        stats.home_possession = 100 - stats.away_possession
-    
-    db.session.add(update)
-    db.session.commit()
-    
-    return jsonify({
-        'home_score': match.home_score,
-        'away_score': match.away_score,
-        'status': match.status,
-        'stats': stats.to_dict(),
-        'updates': [update.to_dict()]
-    })
+    return live_event_response(id, 'goal', data, team=team, player_id=data.get('player_id'),
+                               related_player_id=data.get('assist_player_id'), minute=data.get('minute'))
+
+@app.route('/api/matches/<int:id>/events', methods=['POST'])
+@admit('critical')
+@idempotent
+def api_record_event(id):
+    # Cartons, remplacements (player_id entre, related_player_id sort), tirs, corners, fautes, possession
+    data = request.get_json() or {}
+    if data.get('type') in ('kickoff', 'final_whistle'):
+        return jsonify({'error': 'Use the start and end endpoints'}), 400
+    return live_event_response(id, data.get('type'), data, team=data.get('team'), player_id=data.get('player_id'),
+                               related_player_id=data.get('related_player_id'), minute=data.get('minute'),
+                               description=data.get('description'))
 
 @app.route('/api/matches/<int:id>/start', methods=['POST'])
+@admit('critical')
+@idempotent
 def api_start_match(id):
-    match = Match.query.get_or_404(id)
-    match.status = 'in_progress'
-    
-    # Create kick-off update
-    update = MatchUpdate(
-        match_id=id,
-        minute=0,
-        update_type='kickoff',
-        description='🟢 Le match commence !'
-    )
-    
-    db.session.add(update)
-    db.session.commit()
-    
-    return jsonify({'status': 'success', 'match_status': match.status})
+    state = live_state.registry.get(id)
+    if state is None:
+        abort(404)
+    if state.status != 'in_progress':
+        expected = expected_version()
+        if expected is not None and expected != state.version:
+            return live_state.conflict_response(state)
+        try:
+            live_state.record_event(id, 'kickoff', minute=0)
+        except live_state.InvalidEvent as error:
+            return jsonify({'error': str(error)}), 409
+        # Changement de statut : écrit tout de suite pour les pages qui lisent la ligne match
+        state.checkpoint()
+    
+    return jsonify({'status': 'success', 'match_status': state.status, 'version': state.version})
 
 @app.route('/api/matches/<int:id>/end', methods=['POST'])
+@admit('critical')
+@idempotent
 def api_end_match(id):
     match = Match.query.get_or_404(id)
-    match.status = 'completed'
-    
-    # Create final whistle update
-    update = MatchUpdate(
-        match_id=id,
-        minute=90,
-        update_type='final_whistle',
-        description='🔴 Fin du match !'
-    )
-    
-    db.session.add(update)
+    if match.status == 'completed':
+        return jsonify({'status': 'success', 'match_status': match.status, 'version': match.version_id})
+    state = live_state.registry.get(id)
+    if state is None:
+        abort(404)
+    expected = expected_version()
+    if expected is not None and expected != state.version:
+        return live_state.conflict_response(state)
+    
+    # Coup de sifflet final, puis checkpoint immédiat du score et des minutes jouées
+    try:
+        if live_state.finish(id) is None:
+            abort(404)
+    except live_state.InvalidEvent as error:
+        return jsonify({'error': str(error)}), 409
+    match = db.session.get(Match, id)
+    matchups.record_result(match)
+    ratings.rate_match(id)
     db.session.commit()
     
-    return jsonify({'status': 'success', 'match_status': match.status})
+    return jsonify({'status': 'success', 'match_status': match.status, 'version': match.version_id})
+
+@app.route('/api/matches/<int:id>/squad', methods=['POST'])
+@coach_required
+def api_submit_squad(id):
+    # Feuille de match de l'équipe de l'entraîneur connecté, avant le coup d'envoi
+    match = Match.query.get_or_404(id)
+    team = current_user.team
+    if team is None or team.id not in (match.home_team_id, match.away_team_id):
+        return jsonify({'error': 'Your team does not play this match'}), 403
+    if match.status != 'scheduled':
+        return jsonify({'error': 'The squad can only be changed before kickoff'}), 409
+    data = request.get_json(silent=True) or {}
+    player_ids, starter_ids = data.get('player_ids'), data.get('starter_ids', [])
+    if not isinstance(player_ids, list) or not all(isinstance(pid, int) for pid in player_ids):
+        return jsonify({'error': 'player_ids must be a list of player ids'}), 400
+    # Titulaires : sous-ensemble de la sélection, entrés sur le terrain au coup d'envoi
+    if not isinstance(starter_ids, list) or not all(isinstance(pid, int) for pid in starter_ids) \
+            or not set(starter_ids) <= set(player_ids) or len(set(starter_ids)) > live_state.STARTERS:
+        return jsonify({'error': f'starter_ids must list at most {live_state.STARTERS} of the selected players'}), 400
+    players = team.select_players_for_match(id, player_ids, set(starter_ids))
+    # L'état en mémoire (et son checkpoint) précède la feuille de match
+    live_state.reset(id)
+    return jsonify({'match_id': id, 'team_id': team.id, 'selected': sorted(player.id for player in players),
+                    'starters': sorted(player.id for player in players if player.id in set(starter_ids))})
+
+# Admin diagnostics
+@app.route('/admin/db/pool')
+@admin_required
+def admin_pool_stats():
+    # Statistiques du pool de ce worker uniquement (un pool par processus gunicorn)
+    return jsonify(pool_stats(db.engine))
+
+@app.route('/admin/admission')
+@admin_required
+def admin_admission_stats():
+    # Compteurs par voie et requêtes en cours de ce worker (voir admission.py)
+    return jsonify(admission_controller.stats())
+
+@app.route('/api/users/search')
+@admin_required
+def api_user_search():
+    # Suggestions des sélecteurs entraîneur/arbitre : colonnes affichées uniquement, pas d'entités
+    role = request.args.get('role')
+    if role not in (None, '', 'coach', 'referee', 'admin'):
+        return jsonify({'error': 'unknown role'}), 400
+    rows = search.search_users(request.args.get('q', ''), role=role or None,
+                               limit=request.args.get('limit', 20, type=int))
+    return jsonify({'results': [
+        {'id': row.id, 'label': search.label(row), 'username': row.username, 'role': row.role}
+        for row in rows
+    ]})
 
 # Player Statistics Routes
 @app.route('/players/<int:id>')
@@ -350,34 +550,50 @@ def player_detail(id):
     player = Player.query.get_or_404(id)
     stats = player.get_stats()
     
+    tournament = player.team.tournament
+    
     # Get recent match performances
-    recent_performances = PlayerMatchPerformance.query.filter_by(player_id=id)\
-                                                    .order_by(PlayerMatchPerformance.created_at.desc())\
-                                                    .limit(10).all()
+    performance = archive.sources(tournament.id).performance
+    recent_performances = performance.query.filter_by(player_id=id)\
+                                           .order_by(performance.created_at.desc())\
+                                           .limit(10).all()
+    
+    # Stats par 90 minutes, forme et percentiles sur le tournoi de l'équipe (figées si archivé)
+    if tournament.status == 'archived' and tournament.snapshot:
+        analytics = tournament.snapshot.player_summary(player.id)
+    else:
+        analytics = SeasonAnalytics.for_tournament(tournament.id).player_summary(player.id)
     
-    return render_template('players/detail.html', player=player, stats=stats, recent_performances=recent_performances)
+    return render_template('players/detail.html', player=player, stats=stats, recent_performances=recent_performances,
+                         analytics=analytics)
 
 @app.route('/players/stats')
 def player_stats_leaderboard():
-    # Get top scorers
-    top_scorers = db.session.query(Player, PlayerStats)\
-                           .join(PlayerStats, Player.id == PlayerStats.player_id)\
-                           .order_by(PlayerStats.goals.desc())\
-                           .limit(10).all()
-    
-    # Get top assists
-    top_assists = db.session.query(Player, PlayerStats)\
-                           .join(PlayerStats, Player.id == PlayerStats.player_id)\
-                           .order_by(PlayerStats.assists.desc())\
-                           .limit(10).all()
-    
-    # Get most cards
-    most_cards = db.session.query(Player, PlayerStats)\
-                          .join(PlayerStats, Player.id == PlayerStats.player_id)\
-                          .order_by((PlayerStats.yellow_cards + PlayerStats.red_cards).desc())\
-                          .limit(10).all()
+    # Top scorers, assists and cards (cached statements, see queries.py)
+    rows = app.config.get('HOT_QUERY_ROWS', False)
+    top_scorers = queries.leaderboard('goals', rows=rows)
+    top_assists = queries.leaderboard('assists', rows=rows)
+    most_cards = queries.leaderboard('cards', rows=rows)
+    
+    # Classements par 90 minutes pour un tournoi donné (?tournament_id=)
+    per90_leaders = {}
+    tournament_id = request.args.get('tournament_id', type=int)
+    if tournament_id:
+        snapshot = TournamentSnapshot.query.get(tournament_id) if archive.is_archived(tournament_id) else None
+        if snapshot:
+            leaders = snapshot.leaders
+        else:
+            season = SeasonAnalytics.for_tournament(tournament_id)
+            leaders = {metric: season.leaders(metric) for metric in archive.LEADER_METRICS}
+        ids = {player_id for rows in leaders.values() for player_id, _ in rows}
+        players_by_id = {p.id: p for p in Player.query.filter(Player.id.in_(ids))} if ids else {}
+        per90_leaders = {
+            metric: [(players_by_id[player_id], value) for player_id, value in rows]
+            for metric, rows in leaders.items()
+        }
     
     return render_template('players/stats.html', 
                          top_scorers=top_scorers, 
                          top_assists=top_assists, 
-                         most_cards=most_cards)
+                         most_cards=most_cards,
+                         per90_leaders=per90_leaders)
@@ -0,0 +1,396 @@
+"""Recherche : utilisateurs des sélecteurs et plein texte sur tournois, équipes, joueurs.
+
+Utilisateurs. Les formulaires d'administration ne chargent plus toute la
+table user : le champ (forms.UserSearchField) n'envoie qu'un identifiant, et
+la liste de suggestions vient de /api/users/search?q=...&role=coach, qui ne
+lit que les colonnes affichées. Selon la base :
+
+- SQLite     : table FTS5 user_search (contenu externe, maintenue par triggers)
+- PostgreSQL : index trigrammes pg_trgm sur username, first_name, last_name
+- autres     : recherche par préfixe sur les colonnes indexées
+
+Plein texte (/search, /api/search). Chaque tournoi, équipe et joueur a un
+SearchDocument contenant ses mots normalisés (minuscules, sans accents) et
+une clé "phonétique" par mot qui rapproche les graphies d'un même nom
+translittéré (Mohamed/Muhammad, Youssef/Yusuf, Chérif/Sherif). Les documents
+sont mis à jour après chaque flush qui touche un de ces objets, et par
+l'import en masse. Index : FTS5 (bm25) sous SQLite, tsvector + GIN sous
+PostgreSQL, LIKE ailleurs.
+
+    flask create-search-index
+    flask rebuild-search-index      # (ré)indexe toutes les entités existantes
+"""
+import re
+import unicodedata
+from datetime import datetime
+
+from flask import url_for
+from sqlalchemy import select, text, or_, and_, func, inspect, insert, delete, event, table, column, literal_column
+
+from extensions import db
+from tenancy import TenantSession
+from models import User, Tournament, Team, Player, SearchDocument
+
+SEARCH_COLUMNS = ('username', 'first_name', 'last_name')
+FTS_TABLE = 'user_search'
+MAX_RESULTS = 50
+
+FTS5_DDL = (
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        username, first_name, last_name,
+        content='user', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2", prefix='2 3'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON user BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON user BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF username, first_name, last_name ON user BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+        INSERT INTO {FTS_TABLE}(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END''',
+)
+
+TRGM_DDL = ('CREATE EXTENSION IF NOT EXISTS pg_trgm',) + tuple(
+    f'CREATE INDEX IF NOT EXISTS ix_user_{column}_trgm ON "user" USING gin (lower({column}) gin_trgm_ops)'
+    for column in SEARCH_COLUMNS
+)
+
+# Documents plein texte : entité -> (modèle, champs du titre, champs du corps)
+INDEXED = {
+    'tournament': (Tournament, ('name',), ('description',)),
+    'team': (Team, ('name',), ('city',)),
+    'player': (Player, ('name',), ('nationality', 'position')),
+}
+DOCUMENT_FTS_TABLE = 'search_index'
+BM25_WEIGHTS = (10.0, 3.0, 1.0)  # title_terms, body_terms, phonetic
+
+DOCUMENT_FTS5_DDL = (
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {DOCUMENT_FTS_TABLE} USING fts5(
+        title_terms, body_terms, phonetic,
+        content='search_document', content_rowid='id', prefix='2 3'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS search_index_ai AFTER INSERT ON search_document BEGIN
+        INSERT INTO {DOCUMENT_FTS_TABLE}(rowid, title_terms, body_terms, phonetic)
+        VALUES (new.id, new.title_terms, new.body_terms, new.phonetic);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS search_index_ad AFTER DELETE ON search_document BEGIN
+        INSERT INTO {DOCUMENT_FTS_TABLE}({DOCUMENT_FTS_TABLE}, rowid, title_terms, body_terms, phonetic)
+        VALUES ('delete', old.id, old.title_terms, old.body_terms, old.phonetic);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS search_index_au AFTER UPDATE ON search_document BEGIN
+        INSERT INTO {DOCUMENT_FTS_TABLE}({DOCUMENT_FTS_TABLE}, rowid, title_terms, body_terms, phonetic)
+        VALUES ('delete', old.id, old.title_terms, old.body_terms, old.phonetic);
+        INSERT INTO {DOCUMENT_FTS_TABLE}(rowid, title_terms, body_terms, phonetic)
+        VALUES (new.id, new.title_terms, new.body_terms, new.phonetic);
+    END''',
+)
+
+# Même expression dans l'index et dans les requêtes, sinon PostgreSQL n'utilise pas l'index
+TSVECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(title_terms, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body_terms, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(phonetic, '')), 'D')"
+)
+DOCUMENT_TSVECTOR_DDL = (
+    f'CREATE INDEX IF NOT EXISTS ix_search_document_tsv ON search_document USING gin (({TSVECTOR_SQL}))',
+)
+
+LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae', 'ß': 'ss', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th', 'ı': 'i'})
+
+# Graphies françaises et anglaises des noms arabes translittérés, appliquées dans l'ordre
+TRANSLITERATION = tuple((re.compile(pattern), replacement) for pattern, replacement in (
+    (r'^ou(?=[aei])', 'w'),        # Oualid -> Walid
+    (r'ou|oo', 'u'),               # Youssef -> Yussef, Mustapha/Moustapha
+    (r'ee', 'i'),                  # Kareem -> Karim
+    (r'[cs]h', 'x'),               # Chérif / Sherif
+    (r'dj', 'j'),                  # Djamel -> Jamel
+    (r'kh', 'k'),                  # Khaled -> Kaled
+    (r'[dgt]h', lambda m: m.group(0)[0]),
+    (r'ph', 'f'),
+    (r'q|ck', 'k'),                # Qadir -> Kadir
+    (r'c(?=[eiy])', 's'),          # Youcef -> Yousef
+    (r'c', 'k'),
+    (r'(?<=[aeiou])h$', ''),       # Abdallah -> Abdalla
+    (r'(.)\1+', r'\1'),            # Mohammed -> Mohamed
+))
+
+DOCUMENT_BATCH = 1000
+RESULT_ENDPOINTS = {'tournament': 'tournament_detail', 'team': 'team_detail', 'player': 'player_detail'}
+
+_fts_ready = {}
+_kinds = {model: kind for kind, (model, _, _) in INDEXED.items()}
+
+
+def _tokens(term):
+    return re.findall(r'\w+', term or '')
+
+
+def _like_prefix(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def label(row):
+    """'First Last (username)', or just the username when no name is set"""
+    name = ' '.join(part for part in (row.first_name, row.last_name) if part)
+    return f'{name} ({row.username})' if name else row.username
+
+
+def normalize(value):
+    """Lowercase words without accents or ligatures: "Éloïse N'Golo" -> ['eloise', 'n', 'golo']"""
+    value = unicodedata.normalize('NFKD', str(value or '').lower().translate(LIGATURES))
+    return re.findall(r'\w+', ''.join(char for char in value if not unicodedata.combining(char)))
+
+
+def phonetic_key(word):
+    """Skeleton shared by the spellings of a transliterated name: Mohamed, Muhammad, Mouhammed -> 'mhmd'"""
+    if len(word) < 3 or not (word.isascii() and word.isalpha()):
+        return None
+    for pattern, replacement in TRANSLITERATION:
+        word = pattern.sub(replacement, word)
+    # Voyelle initiale unifiée (Oussama/Usama/Osama), autres voyelles supprimées
+    key = ('a' if word[0] in 'aeiou' else word[0]) + re.sub(r'[aeiouy]', '', word[1:])
+    return key if len(key) >= 2 else None
+
+
+def ensure_search_index():
+    """Create the name indexes and the FTS5 tables / trigram and tsvector indexes; safe to run several times"""
+    with db.engine.begin() as connection:
+        for index in User.__table__.indexes:
+            index.create(connection, checkfirst=True)
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            tables = set(inspect(connection).get_table_names())
+            for table, statements in ((FTS_TABLE, FTS5_DDL), (DOCUMENT_FTS_TABLE, DOCUMENT_FTS5_DDL)):
+                for statement in statements:
+                    connection.execute(text(statement))
+                if table not in tables:
+                    connection.execute(text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            for statement in TRGM_DDL + DOCUMENT_TSVECTOR_DDL:
+                connection.execute(text(statement))
+    _fts_ready.clear()
+    return dialect
+
+
+def _has_fts(table):
+    key = (db.engine.url, table)
+    if key not in _fts_ready:
+        _fts_ready[key] = (db.engine.dialect.name == 'sqlite'
+                           and table in inspect(db.engine).get_table_names())
+    return _fts_ready[key]
+
+
+def _columns():
+    return [getattr(User, column) for column in SEARCH_COLUMNS]
+
+
+def _fts_statement(tokens):
+    query = ' '.join(f'"{token}"*' for token in tokens)
+    matches = text(f'SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query') \
+        .bindparams(query=query).columns(rowid=db.Integer, rank=db.Float).subquery()
+    # Un ORDER BY dans la sous-requête ne garantit pas l'ordre de la jointure
+    return select(User.id, User.username, User.first_name, User.last_name, User.role) \
+        .join(matches, matches.c.rowid == User.id).order_by(matches.c.rank, User.username)
+
+
+def _like_statement(tokens, trigram):
+    # Chaque mot doit commencer (préfixe) ou apparaître (trigrammes) dans l'un des champs
+    conditions = []
+    for token in tokens:
+        if trigram:
+            pattern = '%' + _like_prefix(token.lower())
+            conditions.append(or_(*(func.lower(name).like(pattern, escape='\\') for name in _columns())))
+        else:
+            conditions.append(or_(*(name.like(_like_prefix(token), escape='\\') for name in _columns())))
+    return select(User.id, User.username, User.first_name, User.last_name, User.role) \
+        .where(and_(*conditions)).order_by(User.username)
+
+
+def search_users(term, role=None, limit=20):
+    """Users matching every word of `term` as Row(id, username, first_name, last_name, role)"""
+    tokens = _tokens(term)
+    if not tokens:
+        return []
+    if _has_fts(FTS_TABLE):
+        stmt = _fts_statement(tokens)
+    else:
+        stmt = _like_statement(tokens, trigram=db.engine.dialect.name == 'postgresql')
+    if role:
+        stmt = stmt.where(User.role == role)
+    return db.session.execute(stmt.limit(min(limit, MAX_RESULTS))).all()
+
+
+def _document(kind, obj):
+    """search_document row of an entity (ORM object or Row with the indexed columns)"""
+    _, title_fields, body_fields = INDEXED[kind]
+    title = ' '.join(str(getattr(obj, field)) for field in title_fields if getattr(obj, field))
+    body = [str(getattr(obj, field)) for field in body_fields if getattr(obj, field)]
+    title_terms = normalize(title)
+    return {
+        'entity_type': kind,
+        'entity_id': obj.id,
+        'title': title[:200],
+        'subtitle': ' · '.join(body)[:200] or None,
+        'title_terms': ' '.join(title_terms),
+        'body_terms': ' '.join(normalize(' '.join(body))),
+        'phonetic': ' '.join(dict.fromkeys(key for key in map(phonetic_key, title_terms) if key)),
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def _write(session, kind, documents, removed_ids=()):
+    table = SearchDocument.__table__
+    ids = [document['entity_id'] for document in documents] + list(removed_ids)
+    if ids:
+        session.execute(delete(table).where(table.c.entity_type == kind, table.c.entity_id.in_(ids)))
+    if documents:
+        session.execute(insert(table), documents)
+
+
+def index_entities(kind, ids, session=None):
+    """(Re)index entities by id, e.g. after a bulk INSERT that bypassed the ORM"""
+    session = session or db.session
+    model, title_fields, body_fields = INDEXED[kind]
+    columns = [model.id] + [getattr(model, field) for field in title_fields + body_fields]
+    ids = list(ids)
+    for start in range(0, len(ids), DOCUMENT_BATCH):
+        chunk = ids[start:start + DOCUMENT_BATCH]
+        rows = session.execute(select(*columns).where(model.id.in_(chunk))).all()
+        _write(session, kind, [_document(kind, row) for row in rows], set(chunk) - {row.id for row in rows})
+
+
+def rebuild_index():
+    """Reindex every tournament, team and player; returns {kind: count}"""
+    ensure_search_index()
+    table = SearchDocument.__table__
+    counts = {}
+    for kind, (model, title_fields, body_fields) in INDEXED.items():
+        db.session.execute(delete(table).where(table.c.entity_type == kind))
+        columns = [model.id] + [getattr(model, field) for field in title_fields + body_fields]
+        last_id, counts[kind] = 0, 0
+        while True:
+            rows = db.session.execute(
+                select(*columns).where(model.id > last_id).order_by(model.id).limit(DOCUMENT_BATCH)
+            ).all()
+            if not rows:
+                break
+            _write(db.session, kind, [_document(kind, row) for row in rows])
+            counts[kind] += len(rows)
+            last_id = rows[-1].id
+        db.session.commit()
+    return counts
+
+
+def _reindex_flushed(session, flush_context):
+    # Après le flush, new/dirty/deleted décrivent encore ce qui vient d'être écrit
+    changed, removed = {}, {}
+    for obj in session.new:
+        if type(obj) in _kinds:
+            changed.setdefault(_kinds[type(obj)], []).append(obj)
+    for obj in session.dirty:
+        kind = _kinds.get(type(obj))
+        if kind is None:
+            continue
+        state = inspect(obj)
+        _, title_fields, body_fields = INDEXED[kind]
+        if any(state.attrs[field].history.has_changes() for field in title_fields + body_fields):
+            changed.setdefault(kind, []).append(obj)
+    for obj in session.deleted:
+        if type(obj) in _kinds:
+            removed.setdefault(_kinds[type(obj)], []).append(obj.id)
+    for kind in changed.keys() | removed.keys():
+        _write(session, kind, [_document(kind, obj) for obj in changed.get(kind, [])], removed.get(kind, ()))
+
+
+event.listen(TenantSession, 'after_flush', _reindex_flushed)
+
+
+def _fts5_match(tokens):
+    clauses = []
+    for token in tokens:
+        alternatives = [f'{{title_terms body_terms}} : "{token}"*']
+        key = phonetic_key(token)
+        if key:
+            # Préfixe sur la clé seulement quand elle est assez discriminante
+            alternatives.append(f'phonetic : "{key}"' + ('*' if len(key) >= 3 else ''))
+        clauses.append('(' + ' OR '.join(alternatives) + ')')
+    return ' AND '.join(clauses)
+
+
+def _tsquery(tokens):
+    clauses = []
+    for token in tokens:
+        key = phonetic_key(token)
+        alternatives = [f'{token}:*'] + ([f'{key}' + (':*' if len(key) >= 3 else '')] if key else [])
+        clauses.append('(' + ' | '.join(alternatives) + ')')
+    return ' & '.join(clauses)
+
+
+def search(term, kinds=None, limit=20):
+    """Documents matching every word of `term`, best first.
+
+    Returns Row(entity_type, entity_id, title, subtitle, score), score higher is better.
+    """
+    tokens = normalize(term)
+    if not tokens:
+        return []
+    doc = SearchDocument.__table__.c
+    columns = (doc.entity_type, doc.entity_id, doc.title, doc.subtitle)
+    dialect = db.engine.dialect.name
+    if _has_fts(DOCUMENT_FTS_TABLE):
+        fts = table(DOCUMENT_FTS_TABLE, column('rowid'), column(DOCUMENT_FTS_TABLE))
+        score = -func.bm25(literal_column(DOCUMENT_FTS_TABLE), *BM25_WEIGHTS)
+        stmt = select(*columns, score.label('score')).select_from(fts) \
+            .join(SearchDocument.__table__, doc.id == fts.c.rowid) \
+            .where(fts.c[DOCUMENT_FTS_TABLE].match(_fts5_match(tokens))).order_by(score.desc())
+    elif dialect == 'postgresql':
+        vector = literal_column(f'({TSVECTOR_SQL})')
+        query = func.to_tsquery('simple', _tsquery(tokens))
+        score = func.ts_rank(vector, query)
+        stmt = select(*columns, score.label('score')).where(vector.op('@@')(query)).order_by(score.desc())
+    else:
+        conditions = []
+        for token in tokens:
+            pattern = '%' + _like_prefix(token)
+            alternatives = [doc.title_terms.like(pattern, escape='\\'), doc.body_terms.like(pattern, escape='\\')]
+            key = phonetic_key(token)
+            if key:
+                alternatives.append(doc.phonetic.like('%' + _like_prefix(key), escape='\\'))
+            conditions.append(or_(*alternatives))
+        stmt = select(*columns, literal_column('0').label('score')).where(and_(*conditions)).order_by(doc.title)
+    if kinds:
+        stmt = stmt.where(doc.entity_type.in_(kinds))
+    return db.session.execute(stmt.limit(min(limit, MAX_RESULTS))).all()
+
+
+def as_dict(row):
+    return {
+        'type': row.entity_type,
+        'id': row.entity_id,
+        'title': row.title,
+        'subtitle': row.subtitle,
+        'score': round(float(row.score), 4),
+        'url': url_for(RESULT_ENDPOINTS[row.entity_type], id=row.entity_id),
+    }
+
+
+def register_cli(app):
+    @app.cli.command('create-search-index')
+    def create_search_index_command():
+        """Create the indexes used by the user and full-text search."""
+        dialect = ensure_search_index()
+        backend = {'sqlite': 'FTS5', 'postgresql': 'pg_trgm / tsvector'}.get(dialect, 'prefix')
+        print(f'Search indexes ready ({backend})')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Reindex every tournament, team and player for /search."""
+        counts = rebuild_index()
+        print(', '.join(f'{count} {kind}(s)' for kind, count in counts.items()) + ' indexed')
@@ -0,0 +1,228 @@
+"""Simulation des matchs restants d'un tournoi (qui peut encore se qualifier ?).
+
+Les buts de chaque match restant suivent une loi de Poisson dont la moyenne
+dépend de l'attaque et de la défense des deux équipes (buts marqués et
+encaissés jusqu'ici). Les scores de toutes les simulations sont tirés d'un
+coup dans des matrices NumPy et les simulations sont réparties sur un pool de
+processus. Quand il reste peu de matchs, toutes les combinaisons
+victoire/nul/défaite sont énumérées avec leur probabilité exacte.
+"""
+import os
+import math
+import threading
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import select
+
+from extensions import db
+from models import Team
+from archive import sources
+
+SIM_WORKERS = int(os.environ.get('SIM_WORKERS', str(os.cpu_count() or 2)))
+MAX_SIMS = int(os.environ.get('SIM_MAX_SIMS', '100000'))  # plafond des simulations demandées par la route publique
+CHUNK_SIZE = 25000
+EXACT_MAX_MATCHES = 10      # 3^10 = 59 049 combinaisons
+REMAINING = ('scheduled', 'in_progress')  # un match en cours est simulé comme s'il n'avait pas commencé
+HOME_ADVANTAGE = 1.1
+MAX_GOALS = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn : pas de fork d'un serveur multithreadé (voir jobs.py)
+            _executor = ProcessPoolExecutor(max_workers=SIM_WORKERS, mp_context=get_context('spawn'))
+        return _executor
+
+
+class SeasonState:
+    """Current table and remaining fixtures as index arrays"""
+
+    def __init__(self, team_ids, completed, remaining):
+        self.team_ids = list(team_ids)
+        index = {team_id: i for i, team_id in enumerate(self.team_ids)}
+        n = len(self.team_ids)
+
+        self.points = np.zeros(n, dtype=np.int64)
+        self.goals_for = np.zeros(n, dtype=np.int64)
+        self.goals_against = np.zeros(n, dtype=np.int64)
+        played = np.zeros(n, dtype=np.int64)
+        for home, away, home_score, away_score in completed:
+            h, a = index[home], index[away]
+            self.goals_for[h] += home_score
+            self.goals_against[h] += away_score
+            self.goals_for[a] += away_score
+            self.goals_against[a] += home_score
+            played[h] += 1
+            played[a] += 1
+            if home_score > away_score:
+                self.points[h] += 3
+            elif home_score < away_score:
+                self.points[a] += 3
+            else:
+                self.points[h] += 1
+                self.points[a] += 1
+
+        self.home = np.array([index[home] for home, _ in remaining], dtype=np.int64)
+        self.away = np.array([index[away] for _, away in remaining], dtype=np.int64)
+
+        # Force offensive/défensive lissée (un match fictif moyen pour les équipes sans historique)
+        total_goals = self.goals_for.sum()
+        league_rate = (total_goals / played.sum()) if played.sum() else 1.3
+        attack = (self.goals_for + league_rate) / (played + 1) / league_rate
+        defence = (self.goals_against + league_rate) / (played + 1) / league_rate
+        self.lambda_home = league_rate * attack[self.home] * defence[self.away] * HOME_ADVANTAGE
+        self.lambda_away = league_rate * attack[self.away] * defence[self.home]
+
+    @classmethod
+    def for_tournament(cls, tournament_id):
+        team_ids = list(db.session.scalars(select(Team.id).where(Team.tournament_id == tournament_id).order_by(Team.id)))
+        match = sources(tournament_id).match
+        matches = db.session.execute(
+            select(match.home_team_id, match.away_team_id, match.home_score, match.away_score, match.status)
+            .where(match.tournament_id == tournament_id)
+        ).all()
+        completed = [(h, a, hs or 0, as_ or 0) for h, a, hs, as_, status in matches if status == 'completed']
+        remaining = [(h, a) for h, a, _, _, status in matches if status in REMAINING]
+        return cls(team_ids, completed, remaining)
+
+    def incidence(self):
+        """(matches x teams) one-hot matrices of the home and away sides"""
+        n_matches, n_teams = len(self.home), len(self.team_ids)
+        home = np.zeros((n_matches, n_teams))
+        away = np.zeros((n_matches, n_teams))
+        home[np.arange(n_matches), self.home] = 1
+        away[np.arange(n_matches), self.away] = 1
+        return home, away
+
+
+def _positions(points, goal_difference, goals_for, rng):
+    """Rank matrix (simulations x teams): points, goal difference, goals, then random"""
+    key = points * 1e8 + (goal_difference + 5000) * 1e3 + goals_for + rng.random(points.shape)
+    order = np.argsort(-key, axis=1)
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order, np.arange(points.shape[1]), axis=1)
+    return positions
+
+
+def _position_counts(positions, weights=None):
+    n_teams = positions.shape[1]
+    flat = (np.arange(n_teams) * n_teams + positions).ravel()
+    if weights is not None:
+        weights = np.repeat(weights, n_teams)
+    return np.bincount(flat, weights=weights, minlength=n_teams * n_teams).reshape(n_teams, n_teams)
+
+
+def simulate_chunk(seed, n_sims, base, home, away, lambda_home, lambda_away):
+    """Monte Carlo over n_sims seasons; returns (teams x positions) counts and summed points"""
+    rng = np.random.default_rng(seed)
+    points, goals_for, goals_against = base
+    home_goals = rng.poisson(lambda_home, size=(n_sims, len(lambda_home)))
+    away_goals = rng.poisson(lambda_away, size=(n_sims, len(lambda_away)))
+
+    home_points = 3 * (home_goals > away_goals) + (home_goals == away_goals)
+    away_points = 3 * (away_goals > home_goals) + (home_goals == away_goals)
+    sim_points = points + home_points @ home + away_points @ away
+    sim_for = goals_for + home_goals @ home + away_goals @ away
+    sim_against = goals_against + away_goals @ home + home_goals @ away
+
+    positions = _positions(sim_points, sim_for - sim_against, sim_for, rng)
+    return _position_counts(positions), sim_points.sum(axis=0)
+
+
+def _outcome_probabilities(lambda_home, lambda_away):
+    """P(home win), P(draw), P(away win) per match from independent Poisson scores"""
+    goals = np.arange(MAX_GOALS + 1)
+    log_factorial = np.array([math.lgamma(k + 1) for k in goals])
+    home_pmf = np.exp(goals * np.log(lambda_home[:, None]) - lambda_home[:, None] - log_factorial)
+    away_pmf = np.exp(goals * np.log(lambda_away[:, None]) - lambda_away[:, None] - log_factorial)
+    joint = home_pmf[:, :, None] * away_pmf[:, None, :]
+    home_win = np.tril(np.ones((MAX_GOALS + 1, MAX_GOALS + 1)), -1)
+    probabilities = np.stack([
+        (joint * home_win).sum(axis=(1, 2)),
+        np.trace(joint, axis1=1, axis2=2),
+        (joint * home_win.T).sum(axis=(1, 2)),
+    ], axis=1)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def enumerate_outcomes(state):
+    """Exact position probabilities over every win/draw/loss combination.
+
+    Goal margins are unknown in this mode, so equal points are split on the
+    current goal difference and goals scored.
+    """
+    n_matches = len(state.home)
+    home, away = state.incidence()
+    outcome_probabilities = _outcome_probabilities(state.lambda_home, state.lambda_away)
+
+    digits = (np.arange(3 ** n_matches)[:, None] // 3 ** np.arange(n_matches)) % 3
+    weights = outcome_probabilities[np.arange(n_matches), digits].prod(axis=1)
+    home_points = np.where(digits == 0, 3, np.where(digits == 1, 1, 0))
+    away_points = np.where(digits == 2, 3, np.where(digits == 1, 1, 0))
+    points = state.points + home_points @ home + away_points @ away
+
+    goal_difference = np.broadcast_to(state.goals_for - state.goals_against, points.shape)
+    goals_for = np.broadcast_to(state.goals_for, points.shape)
+    positions = _positions(points, goal_difference, goals_for, np.random.default_rng(0))
+    return _position_counts(positions, weights), (points * weights[:, None]).sum(axis=0)
+
+
+def simulate(state, n_sims=100000, seed=None, exact=None):
+    """Position probability matrix (teams x positions) and expected points"""
+    if exact is None:
+        exact = len(state.home) <= EXACT_MAX_MATCHES
+    if exact:
+        counts, points = enumerate_outcomes(state)
+        return counts / counts.sum(axis=1, keepdims=True), points, 'exact'
+    if n_sims < 1:
+        raise ValueError('n_sims must be at least 1')
+
+    home, away = state.incidence()
+    base = (state.points, state.goals_for, state.goals_against)
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(n_sims / CHUNK_SIZE))
+    sizes = [min(CHUNK_SIZE, n_sims - i * CHUNK_SIZE) for i in range(len(seeds))]
+    futures = [
+        _get_executor().submit(simulate_chunk, chunk_seed, size, base, home, away,
+                               state.lambda_home, state.lambda_away)
+        for chunk_seed, size in zip(seeds, sizes)
+    ]
+    counts = sum(f.result()[0] for f in futures)
+    points = sum(f.result()[1] for f in futures)
+    return counts / n_sims, points / n_sims, 'monte_carlo'
+
+
+def qualification_report(tournament_id, qualify=1, relegate=0, n_sims=100000, seed=None):
+    state = SeasonState.for_tournament(tournament_id)
+    if not state.team_ids:
+        return {'method': None, 'remaining_matches': 0, 'teams': []}
+    if len(state.home) == 0:
+        probabilities, expected_points, method = simulate(state, exact=True)
+    else:
+        probabilities, expected_points, method = simulate(state, n_sims=n_sims, seed=seed)
+
+    n_teams = len(state.team_ids)
+    teams = [
+        {
+            'team_id': team_id,
+            'points': int(state.points[i]),
+            'expected_points': round(float(expected_points[i]), 2),
+            'qualify': round(float(probabilities[i, :qualify].sum()), 4),
+            'relegate': round(float(probabilities[i, n_teams - relegate:].sum()), 4) if relegate else 0.0,
+            'positions': [round(float(p), 4) for p in probabilities[i]],
+        }
+        for i, team_id in enumerate(state.team_ids)
+    ]
+    teams.sort(key=lambda row: (-row['qualify'], -row['expected_points']))
+    return {
+        'method': method,
+        'simulations': n_sims if method == 'monte_carlo' else None,
+        'remaining_matches': int(len(state.home)),
+        'teams': teams,
+    }
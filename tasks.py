@@ -0,0 +1,179 @@
+"""Handlers des tâches d'arrière-plan (voir jobs.py)"""
+import os
+import itertools
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import func, or_
+
+from extensions import db
+from jobs import job
+import matchups
+from tenancy import lookup
+from models import Tournament, Team, Player, Match, MatchStats, TeamStats, PlayerStats, PlayerMatchPerformance
+
+
+@job('generate_fixtures')
+def generate_fixtures(ctx, tournament_id):
+    """Delete and regenerate the round-robin fixtures of a tournament"""
+    tournament = db.session.get(Tournament, tournament_id)
+    if tournament.status == 'archived':
+        raise ValueError('Archived tournaments are read-only')
+    teams = Team.query.filter_by(tournament_id=tournament_id).all()
+    if len(teams) < 2:
+        raise ValueError('Need at least 2 teams to generate fixtures!')
+
+    # Generate round-robin fixtures
+    team_combinations = list(itertools.combinations(teams, 2))
+    start_date = tournament.start_date
+    ctx.progress(10, f'Replacing fixtures with {len(team_combinations)} matches')
+
+    # Suppression et recréation dans une seule transaction
+    Match.query.filter_by(tournament_id=tournament_id).delete()
+    for i, (home_team, away_team) in enumerate(team_combinations):
+        match_date = start_date + timedelta(days=i * 3)  # Matches every 3 days
+        db.session.add(Match(
+            tournament_id=tournament_id,
+            home_team_id=home_team.id,
+            away_team_id=away_team.id,
+            match_date=match_date,
+            round_number=1
+        ))
+    # Les face-à-face et bilans des anciens matchs disparaissent avec eux
+    matchups.rebuild_tournament(tournament_id)
+
+    tournament.status = 'active'
+    db.session.commit()
+    return {'matches': len(team_combinations)}
+
+
+@job('recompute_tournament_stats')
+def recompute_tournament_stats(ctx, tournament_id):
+    """Rebuild TeamStats and PlayerStats of a tournament from its completed matches"""
+    if db.session.get(Tournament, tournament_id).status == 'archived':
+        raise ValueError('Archived tournaments are read-only')
+    teams = {team.id: team for team in Team.query.filter_by(tournament_id=tournament_id)}
+    totals = defaultdict(lambda: defaultdict(int))
+
+    completed = db.session.query(Match, MatchStats)\
+                          .outerjoin(MatchStats, MatchStats.match_id == Match.id)\
+                          .filter(Match.tournament_id == tournament_id, Match.status == 'completed')
+    for match, match_stats in completed:
+        for team_id, scored, conceded, side in (
+            (match.home_team_id, match.home_score or 0, match.away_score or 0, 'home'),
+            (match.away_team_id, match.away_score or 0, match.home_score or 0, 'away'),
+        ):
+            row = totals[team_id]
+            row['matches_played'] += 1
+            row['goals_marques'] += scored
+            row['buts_encaisses'] += conceded
+            if scored > conceded:
+                row['victoires'] += 1
+            elif scored == conceded:
+                row['nuls'] += 1
+            else:
+                row['defaites'] += 1
+            if match_stats is not None:
+                row['carton_jaunes'] += getattr(match_stats, f'{side}_yellow_cards') or 0
+                row['cartons_rouges'] += getattr(match_stats, f'{side}_red_cards') or 0
+    ctx.progress(30, 'Team totals computed')
+
+    # Un seul agrégat SQL pour tous les joueurs du tournoi, sur les tables du tenant
+    played = (Match.tournament_id == tournament_id, Match.status == 'completed',
+              PlayerMatchPerformance.minutes_played > 0)
+    rollup = db.session.query(
+        PlayerMatchPerformance.player_id,
+        func.count(PlayerMatchPerformance.id).label('matches_played'),
+        func.sum(PlayerMatchPerformance.goals).label('goals'),
+        func.sum(PlayerMatchPerformance.assists).label('assists'),
+        func.sum(PlayerMatchPerformance.yellow_cards).label('yellow_cards'),
+        func.sum(PlayerMatchPerformance.red_cards).label('red_cards'),
+        func.sum(PlayerMatchPerformance.minutes_played).label('minutes_played'),
+        func.sum(PlayerMatchPerformance.shots).label('shots'),
+        func.sum(PlayerMatchPerformance.shots_on_target).label('shots_on_target'),
+        func.sum(PlayerMatchPerformance.passes).label('passes'),
+        func.sum(PlayerMatchPerformance.passes_completed).label('passes_completed'),
+        func.sum(PlayerMatchPerformance.tackles).label('tackles'),
+        func.sum(PlayerMatchPerformance.interceptions).label('interceptions'),
+        func.sum(PlayerMatchPerformance.saves).label('saves'),
+    ).join(Match, Match.id == PlayerMatchPerformance.match_id)\
+     .filter(*played)\
+     .group_by(PlayerMatchPerformance.player_id)\
+     .all()
+    # Équipe des joueurs dans la base principale ; clean sheets d'après les seuls matchs à 0 but encaissé
+    player_teams = {player_id: row.team_id for player_id, row in
+                    lookup(Player.id, (row.player_id for row in rollup), Player.team_id).items()}
+    rollup = [row for row in rollup if row.player_id in player_teams]
+    clean_sheets = defaultdict(int)
+    for player_id, home_team_id, home_score, away_score in db.session.query(
+        PlayerMatchPerformance.player_id, Match.home_team_id, Match.home_score, Match.away_score
+    ).join(Match, Match.id == PlayerMatchPerformance.match_id)\
+     .filter(*played, or_(Match.home_score == 0, Match.away_score == 0)):
+        conceded = away_score if player_teams.get(player_id) == home_team_id else home_score
+        clean_sheets[player_id] += conceded == 0
+    ctx.progress(70, 'Player totals computed')
+
+    existing = {stats.team_id: stats for stats in TeamStats.query.filter(TeamStats.team_id.in_(teams))}
+    for team_id in teams:
+        stats = existing.get(team_id) or TeamStats(team_id=team_id)
+        row = totals[team_id]
+        for field in ('matches_played', 'victoires', 'nuls', 'defaites', 'goals_marques',
+                      'buts_encaisses', 'carton_jaunes', 'cartons_rouges'):
+            setattr(stats, field, row[field])
+        stats.difference_des_buts = row['goals_marques'] - row['buts_encaisses']
+        stats.points = 3 * row['victoires'] + row['nuls']
+        db.session.add(stats)
+
+    player_ids = [row.player_id for row in rollup]
+    existing = {stats.player_id: stats for stats in PlayerStats.query.filter(PlayerStats.player_id.in_(player_ids))}
+    for row in rollup:
+        stats = existing.get(row.player_id) or PlayerStats(player_id=row.player_id)
+        for field in ('matches_played', 'goals', 'assists', 'yellow_cards', 'red_cards', 'minutes_played',
+                      'shots', 'shots_on_target', 'passes', 'tackles', 'interceptions', 'saves'):
+            setattr(stats, field, getattr(row, field) or 0)
+        stats.clean_sheets = clean_sheets[row.player_id]
+        stats.pass_accuracy = round(100.0 * (row.passes_completed or 0) / row.passes, 1) if row.passes else 0.0
+        db.session.add(stats)
+
+    # Face-à-face et bilans domicile/extérieur repartent des mêmes matchs
+    matchups.rebuild_tournament(tournament_id)
+
+    db.session.commit()
+    return {'teams': len(teams), 'players': len(rollup)}
+
+
+@job('rerate_tournament')
+def rerate_tournament(ctx, tournament_id):
+    """Recompute the player match ratings of a tournament with the current formula"""
+    import ratings
+    ctx.progress(10, 'Rating completed matches')
+    return {'performances': ratings.rate_tournament(tournament_id)}
+
+
+@job('archive_tournament', max_attempts=1)
+def archive_tournament(ctx, tournament_id):
+    """Snapshot a completed tournament and move its matches to the archive tables"""
+    import archive
+    snapshot = archive.archive_tournament(tournament_id)
+    return {'matches': snapshot.match_count, 'events': snapshot.event_count,
+            'performances': snapshot.performance_count}
+
+
+@job('bulk_import', max_attempts=1)
+def bulk_import(ctx, kind, path, fmt, tournament_id):
+    """Import teams or players from an uploaded CSV/JSON file"""
+    import importer
+    run = {'teams': importer.import_teams, 'players': importer.import_players}[kind]
+    try:
+        size = os.path.getsize(path) or 1
+        with open(path, 'rb') as stream:
+            def on_batch(report):
+                # Appelé après le commit de chaque lot
+                ctx.progress(99 * stream.tell() // size,
+                             f'{report.created} {kind} created, {report.error_count} rejected')
+            report = run(stream, fmt, tournament_id, on_batch=on_batch)
+    finally:
+        # max_attempts=1 : le fichier ne resservira pas, même si l'import échoue
+        if os.path.exists(path):
+            os.unlink(path)
+    return report.to_dict()
@@ -0,0 +1,384 @@
+"""Répartition des tournois sur plusieurs bases (ou schémas) de données.
+
+Les tables qui grossissent avec chaque ligue (matchs, événements,
+statistiques de match et performances des joueurs) sont routées vers le
+"tenant" du tournoi concerné ; les autres tables (utilisateurs, tournois,
+équipes, joueurs, classements) restent dans la base principale.
+
+Configuration :
+
+    TENANT_DATABASE_URLS="league_a=postgresql://db-a/football,league_b=postgresql://db-b/football"
+    TENANT_MAP="1-100=league_a,101-=league_b,7=default/league_7"
+
+Chaque entrée de TENANT_MAP associe un identifiant ou une plage
+d'identifiants de tournoi à une clé de connexion (``default`` pour la base
+principale), suivie éventuellement de ``/schema`` pour un schéma PostgreSQL
+dédié. Les tournois non listés restent dans la base principale. Sans
+TENANT_MAP, tout se comporte comme avant.
+
+Le tenant actif est choisi par ``use_tenant(tournament_id)`` ou, pour une
+requête HTTP, d'après l'URL (tournoi, équipe ou match). Les lectures qui
+couvrent tous les tournois passent par ``fan_out``. Les identifiants de
+match sont alloués dans la table match_directory de la base principale pour
+rester uniques d'une base à l'autre (les autres identifiants, événements ou
+performances, restent propres à chaque base).
+
+Une base séparée ne contient que les tables de tenant : aucune requête ne
+joint une table de tenant à une table partagée. Les colonnes partagées
+(nom et poste d'un joueur, nom d'une équipe) sont lues à part par ``lookup``
+dans la base principale, puis associées en Python.
+"""
+import os
+import re
+import heapq
+import itertools
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from sqlalchemy import event, insert, select
+from sqlalchemy.schema import CreateTable, CreateIndex
+from sqlalchemy.sql.util import find_tables
+from flask import g, request
+from flask_sqlalchemy.session import Session
+
+TENANT_TABLES = frozenset(('match', 'match_event', 'match_stats', 'player_match_performance',
+                           'archived_match', 'archived_match_event', 'archived_match_stats',
+                           'archived_player_match_performance', 'live_checkpoint',
+                           'outbox_message', 'webhook_cursor'))
+
+Tenant = namedtuple('Tenant', ['bind_key', 'schema'])
+DEFAULT_TENANT = Tenant(None, None)
+
+LOOKUP_CHUNK = 5000
+MATCH_CACHE_SIZE = 65536
+
+_SCHEMA_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_current_tenant = ContextVar('current_tenant', default=DEFAULT_TENANT)
+
+# Routes dont le paramètre `id` désigne un match ou un tournoi
+MATCH_RULE_PREFIXES = ('/matches/<int:id>', '/api/matches/<int:id>')
+TOURNAMENT_RULE_PREFIXES = ('/tournaments/<int:id>',)
+TEAM_RULE_PREFIXES = ('/teams/<int:id>',)
+PLAYER_RULE_PREFIXES = ('/players/<int:id>',)
+TOURNAMENT_FEED_PREFIX = '/feeds/<kind>/'
+
+
+def binds_from_env():
+    """SQLALCHEMY_BINDS entries from TENANT_DATABASE_URLS"""
+    binds = {}
+    for entry in os.environ.get('TENANT_DATABASE_URLS', '').split(','):
+        if entry.strip():
+            key, _, url = entry.partition('=')
+            binds[key.strip()] = url.strip()
+    return binds
+
+
+def _parse_tenant(value):
+    bind_key, _, schema = value.strip().partition('/')
+    if schema and not _SCHEMA_NAME.match(schema):
+        raise ValueError(f'Invalid tenant schema name: {schema!r}')
+    return Tenant(None if bind_key in ('', 'default') else bind_key, schema or None)
+
+
+def parse_tenant_map(value):
+    """[(first_id, last_id or None, Tenant)] from a TENANT_MAP string"""
+    ranges = []
+    for entry in (value or '').split(','):
+        if not entry.strip():
+            continue
+        span, _, target = entry.partition('=')
+        first, dash, last = span.strip().partition('-')
+        first = int(first)
+        last = (int(last) if last else None) if dash else first
+        ranges.append((first, last, _parse_tenant(target)))
+    return ranges
+
+
+class TenantRouter:
+    """Tournament id -> Tenant, from the parsed TENANT_MAP ranges"""
+
+    def __init__(self, ranges):
+        # Les entrées les plus précises (un seul tournoi) passent avant les plages
+        self.ranges = sorted(ranges, key=lambda r: (r[1] is None, (r[1] or 0) - r[0]))
+
+    @property
+    def sharded(self):
+        return bool(self.ranges)
+
+    def tenant_for(self, tournament_id):
+        if tournament_id is None:
+            return DEFAULT_TENANT
+        for first, last, tenant in self.ranges:
+            if first <= tournament_id and (last is None or tournament_id <= last):
+                return tenant
+        return DEFAULT_TENANT
+
+    def tenants(self):
+        """Every configured tenant, the main database first"""
+        seen = [DEFAULT_TENANT]
+        for _, _, tenant in self.ranges:
+            if tenant not in seen:
+                seen.append(tenant)
+        return seen
+
+
+router = TenantRouter(parse_tenant_map(os.environ.get('TENANT_MAP')))
+
+
+def current_tenant():
+    return _current_tenant.get()
+
+
+def tenant_for_tournament(tournament_id):
+    return router.tenant_for(tournament_id)
+
+
+_match_tournaments = {}
+
+
+def _match_tournament(match_id):
+    tournament_id = _match_tournaments.get(match_id)
+    if tournament_id is not None:
+        return tournament_id
+    from extensions import db
+    from models import MatchDirectory
+    tournament_id = db.session.execute(
+        select(MatchDirectory.tournament_id).where(MatchDirectory.id == match_id)
+    ).scalar()
+    # Un match ne change jamais de tournoi : le résultat peut rester en cache, mais pas une absence
+    # (identifiant pas encore alloué, le match peut être créé ensuite)
+    if tournament_id is not None:
+        if len(_match_tournaments) >= MATCH_CACHE_SIZE:
+            _match_tournaments.clear()
+        _match_tournaments[match_id] = tournament_id
+    return tournament_id
+
+
+def tenant_for_match(match_id):
+    if not router.sharded:
+        return DEFAULT_TENANT
+    return router.tenant_for(_match_tournament(match_id))
+
+
+def tenant_for_team(team_id):
+    if not router.sharded:
+        return DEFAULT_TENANT
+    from extensions import db
+    from models import Team
+    return router.tenant_for(db.session.execute(select(Team.tournament_id).where(Team.id == team_id)).scalar())
+
+
+def tenant_for_player(player_id):
+    if not router.sharded:
+        return DEFAULT_TENANT
+    from extensions import db
+    from models import Team, Player
+    return router.tenant_for(db.session.execute(
+        select(Team.tournament_id).join(Player, Player.team_id == Team.id).where(Player.id == player_id)
+    ).scalar())
+
+
+@contextmanager
+def activate(tenant):
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def use_tenant(tournament_id):
+    """Route tenant tables to the database of `tournament_id` inside the block"""
+    return activate(router.tenant_for(tournament_id))
+
+
+def fan_out(query, key, reverse=False, limit=None):
+    """Run `query()` against every tenant and merge the already sorted results.
+
+    `query` must return rows sorted by `key` (descending when `reverse`), so a
+    per-tenant LIMIT is enough for a global top-N. Relationships that live in
+    a tenant table should be eager-loaded by `query`, since lazy loads happen
+    later outside of the tenant.
+    """
+    if not router.sharded:
+        return list(query())[:limit] if limit else list(query())
+    results = []
+    for tenant in router.tenants():
+        with activate(tenant):
+            results.append(list(query()))
+    return list(itertools.islice(heapq.merge(*results, key=key, reverse=reverse), limit))
+
+
+def lookup(key, ids, *columns, session=None):
+    """{id: Row(key, *columns)} read from a shared table (Player, Team...) on the main database.
+
+    Replaces a join between a tenant table and a shared table, which a tenant
+    in a separate database cannot run. `ids` are read in chunks to stay under
+    the bound parameter limits.
+    """
+    from extensions import db
+    session = session or db.session
+    ids = sorted({value for value in ids if value is not None})
+    found = {}
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        for row in session.execute(select(key, *columns).where(key.in_(ids[start:start + LOOKUP_CHUNK]))):
+            found[row[0]] = row
+    return found
+
+
+def _touches_tenant_tables(mapper, clause):
+    if mapper is not None:
+        table = getattr(sa.inspect(mapper), 'local_table', None)
+        if table is not None and table.name in TENANT_TABLES:
+            return True
+    if isinstance(clause, sa.sql.ClauseElement):
+        return any(getattr(table, 'name', None) in TENANT_TABLES
+                   for table in find_tables(clause, include_joins=True, include_aliases=True))
+    return False
+
+
+class TenantSession(Session):
+    """Flask-SQLAlchemy session that sends tenant tables to the active tenant"""
+
+    _tenant_engines = {}
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            tenant = _current_tenant.get()
+            if tenant != DEFAULT_TENANT and _touches_tenant_tables(mapper, clause):
+                return self._tenant_engine(tenant)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _tenant_engine(self, tenant):
+        engines = self._db.engines
+        if tenant.bind_key not in engines:
+            raise sa.exc.UnboundExecutionError(
+                f"Tenant bind key '{tenant.bind_key}' is not in TENANT_DATABASE_URLS."
+            )
+        engine = engines[tenant.bind_key]
+        if tenant.schema is None:
+            return engine
+        key = (id(engine), tenant.schema)
+        if key not in self._tenant_engines:
+            # Même pool de connexions, search_path positionné à chaque transaction
+            self._tenant_engines[key] = engine.execution_options(tenant_schema=tenant.schema)
+        return self._tenant_engines[key]
+
+
+def _set_search_path(connection):
+    schema = connection.get_execution_options().get('tenant_schema')
+    if schema:
+        # SET LOCAL : rétabli automatiquement à la fin de la transaction
+        connection.exec_driver_sql(f'SET LOCAL search_path TO "{schema}", public')
+
+
+def _allocate_match_ids(session, flush_context, instances):
+    """Take ids of new matches from match_directory so they are unique across tenants"""
+    if not router.sharded:
+        return
+    from models import Match, MatchDirectory
+    for obj in session.new:
+        if isinstance(obj, Match) and obj.id is None:
+            tournament_id = obj.tournament_id if obj.tournament_id is not None else obj.tournament.id
+            obj.id = session.execute(
+                insert(MatchDirectory).values(tournament_id=tournament_id)
+            ).inserted_primary_key[0]
+
+
+event.listen(TenantSession, 'before_flush', _allocate_match_ids)
+
+
+def _tenant_for_request():
+    view_args = request.view_args or {}
+    rule = request.url_rule.rule if request.url_rule else ''
+    if 'tournament_id' in view_args:
+        return router.tenant_for(view_args['tournament_id'])
+    if 'id' in view_args:
+        if rule.startswith(TOURNAMENT_RULE_PREFIXES):
+            return router.tenant_for(view_args['id'])
+        if rule.startswith(MATCH_RULE_PREFIXES):
+            return tenant_for_match(view_args['id'])
+        if rule.startswith(TEAM_RULE_PREFIXES):
+            return tenant_for_team(view_args['id'])
+        if rule.startswith(PLAYER_RULE_PREFIXES):
+            return tenant_for_player(view_args['id'])
+    if 'team_id' in view_args:
+        return tenant_for_team(view_args['team_id'])
+    if rule.startswith(TOURNAMENT_FEED_PREFIX) and view_args.get('kind') == 'tournaments':
+        return router.tenant_for(view_args['key'])
+    # Paramètre de requête, par exemple /players/stats?tournament_id=...
+    tournament_id = request.args.get('tournament_id', type=int)
+    if tournament_id is not None:
+        return router.tenant_for(tournament_id)
+    # Le reste (/search, /players, flux d'équipe /feeds/teams/...) ne lit que des tables partagées, ou
+    # entre lui-même dans le tenant du tournoi (feeds.build) : aucune requête pour résoudre un tenant
+    return DEFAULT_TENANT
+
+
+def create_tenant_tables(tenant):
+    """Create the tenant tables in a shard database or schema (no FK to shared tables)"""
+    from extensions import db
+    engine = db.engines[tenant.bind_key]
+    tables = [db.metadata.tables[name] for name in sorted(TENANT_TABLES, key=_creation_order)]
+    with engine.connect() as connection:
+        if tenant.schema:
+            connection = connection.execution_options(schema_translate_map={None: tenant.schema})
+            connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS "{tenant.schema}"')
+        inspector = sa.inspect(connection)
+        for table in tables:
+            if inspector.has_table(table.name, schema=tenant.schema):
+                continue
+            local_fks = [fk for fk in table.foreign_key_constraints if fk.referred_table.name in TENANT_TABLES]
+            connection.execute(CreateTable(table, include_foreign_key_constraints=local_fks))
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+        connection.commit()
+
+
+def backfill_match_directory():
+    """Register the matches already in the main database so new ids do not collide"""
+    from extensions import db
+    with db.engines[None].begin() as connection:
+        return connection.exec_driver_sql(
+            'INSERT INTO match_directory (id, tournament_id) '
+            'SELECT m.id, m.tournament_id FROM match m '
+            'WHERE NOT EXISTS (SELECT 1 FROM match_directory d WHERE d.id = m.id)'
+        ).rowcount
+
+
+def _creation_order(name):
+    # match avant les tables qui la référencent
+    return (name != 'match', name)
+
+
+def init_app(app):
+    """Install request routing, search_path handling and the shard CLI"""
+
+    @app.before_request
+    def _enter_tenant():
+        if router.sharded:
+            g._tenant_token = _current_tenant.set(_tenant_for_request())
+
+    @app.teardown_request
+    def _leave_tenant(exc=None):
+        token = g.pop('_tenant_token', None)
+        if token is not None:
+            _current_tenant.reset(token)
+
+    from extensions import db
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'postgresql':
+                event.listen(engine, 'begin', _set_search_path)
+
+    @app.cli.command('create-tenant-tables')
+    def create_tenant_tables_command():
+        """Create the match tables in every configured tenant database/schema."""
+        print(f'{backfill_match_directory()} existing match(es) registered in match_directory')
+        for tenant in router.tenants():
+            if tenant != DEFAULT_TENANT:
+                create_tenant_tables(tenant)
+                print(f'Tenant tables ready in {tenant.bind_key or "default"}'
+                      f'{"/" + tenant.schema if tenant.schema else ""}')
@@ -0,0 +1,16 @@
+import pytest
+from flask import Flask
+
+from extensions import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    # Application minimale : base SQLite jetable, sans les routes ni les tâches de fond
+    app = Flask(__name__)
+    app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/test.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,40 @@
+import math
+
+from analytics import SeasonAnalytics, COUNTING_STATS
+
+
+def row(player_id, match_id, minutes, goals=0, position='forward'):
+    stats = dict.fromkeys(COUNTING_STATS, 0)
+    stats['goals'] = goals
+    return (player_id, 1, position, match_id, minutes, 7.0, *stats.values())
+
+
+def test_empty_season_has_no_figures():
+    season = SeasonAnalytics([])
+    assert all(values.size == 0 for values in season.per90().values())
+    assert season.leaders('goals_per90') == []
+    assert season.player_summaries() == {}
+
+
+def test_percentiles_leave_out_players_below_the_minutes_floor():
+    rows = [row(1, match, 90, goals=1) for match in (1, 2, 3)] + \
+           [row(2, match, 90) for match in (1, 2, 3)] + \
+           [row(3, 1, 20, goals=2)]
+    summaries = SeasonAnalytics(rows).player_summaries()
+
+    assert summaries[1]['percentiles']['goals_per90'] == 100.0
+    assert summaries[2]['percentiles']['goals_per90'] == 0.0
+    # 9 buts par 90 minutes, mais sur 20 minutes seulement
+    assert summaries[3]['per90']['goals_per90'] == 9.0
+    assert summaries[3]['percentiles']['goals_per90'] is None
+    assert not any(math.isnan(value) for value in summaries[1]['per90'].values())
+
+
+def test_tied_players_share_the_same_percentile():
+    rows = [row(player_id, match, 90, position='defender') for player_id in (1, 2, 3, 4) for match in (1, 2, 3)] + \
+           [row(5, match, 90, goals=1, position='defender') for match in (1, 2, 3)]
+    summaries = SeasonAnalytics(rows).player_summaries()
+
+    tied = {summaries[player_id]['percentiles']['goals_per90'] for player_id in (1, 2, 3, 4)}
+    assert tied == {37.5}
+    assert summaries[5]['percentiles']['goals_per90'] == 100.0
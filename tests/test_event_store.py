@@ -0,0 +1,39 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+import queries
+from event_store import merge_legacy_updates
+from extensions import db
+from models import Tournament, Team, Match, MatchEvent
+
+
+def test_merged_legacy_updates_keep_their_place_in_live_reads(app):
+    tournament = Tournament(name='Cup', start_date=date.today(), status='active')
+    db.session.add(tournament)
+    db.session.flush()
+    home, away = Team(name='A', tournament_id=tournament.id), Team(name='B', tournament_id=tournament.id)
+    db.session.add_all([home, away])
+    db.session.flush()
+    match = Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id,
+                  match_date=datetime.now(), status='in_progress')
+    db.session.add(match)
+    db.session.flush()
+    now = datetime.utcnow()
+    db.session.add(MatchEvent(match_id=match.id, minute=80, event_type='goal', description='new', timestamp=now))
+    db.session.execute(text(
+        'CREATE TABLE match_update (id INTEGER PRIMARY KEY, match_id INTEGER, minute INTEGER, update_type VARCHAR(50),'
+        ' team_id INTEGER, player_id INTEGER, description TEXT, timestamp DATETIME)'))
+    for minute, description in ((20, 'legacy-2'), (10, 'legacy-1')):
+        db.session.execute(text(
+            'INSERT INTO match_update (match_id, minute, update_type, description, timestamp)'
+            ' VALUES (:match_id, :minute, :type, :description, :timestamp)'),
+            {'match_id': match.id, 'minute': minute, 'type': 'card', 'description': description,
+             'timestamp': now - timedelta(minutes=80 - minute)})
+    db.session.commit()
+
+    assert merge_legacy_updates() == 2
+    events = queries.live_events(match.id)
+    assert [event['description'] for event in events] == ['new', 'legacy-2', 'legacy-1']
+    # Copiées dans l'ordre chronologique
+    assert events[2]['id'] < events[1]['id']
@@ -0,0 +1,36 @@
+import json
+from datetime import date, datetime
+
+import feeds
+import readmodel
+from extensions import db
+from models import Tournament, Team, Match
+
+
+def test_a_stale_marker_rebuilds_the_feed_before_serving_it(app, tmp_path):
+    app.config.update(READMODEL_DIR=str(tmp_path / 'readmodel'), FEEDS_DIR=str(tmp_path / 'feeds'))
+    tournament = Tournament(name='Cup', start_date=date.today(), status='active')
+    db.session.add(tournament)
+    db.session.flush()
+    home, away = Team(name='A', tournament_id=tournament.id), Team(name='B', tournament_id=tournament.id)
+    db.session.add_all([home, away])
+    db.session.flush()
+    match = Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id,
+                  match_date=datetime(2026, 5, 1, 15), venue='Old ground')
+    db.session.add(match)
+    db.session.commit()
+
+    def venue():
+        with app.test_request_context():
+            response = feeds.serve('teams', home.id, 'json')
+            response.direct_passthrough = False
+            return json.loads(response.get_data())['matches'][0]['venue']
+
+    assert venue() == 'Old ground'
+    # Écriture d'un autre worker (ou du service du direct) : seul le marqueur est daté
+    db.session.execute(db.update(Match).where(Match.id == match.id).values(venue='New ground'))
+    db.session.commit()
+    readmodel.mark_stale([tournament.id])
+
+    assert venue() == 'New ground'
+    assert venue() == 'New ground'
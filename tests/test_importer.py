@@ -0,0 +1,52 @@
+import io
+import json
+from datetime import date
+
+import pytest
+
+import importer
+import tasks
+from extensions import db
+from jobs import JobContext
+from models import Tournament, Team
+
+
+def test_records_that_are_not_objects_are_row_errors(app):
+    tournament = Tournament(name='Cup', start_date=date.today(), max_teams=8)
+    db.session.add(tournament)
+    db.session.commit()
+    data = json.dumps([{'name': 'Lions'}, ['Tigers'], 'Bears', {'name': 'Eagles'}]).encode()
+
+    report = importer.import_teams(io.BytesIO(data), 'json', tournament.id)
+    assert (report.rows, report.created, report.error_count) == (4, 2, 2)
+    assert [error['row'] for error in report.errors] == [2, 3]
+    assert sorted(db.session.scalars(db.select(Team.name))) == ['Eagles', 'Lions']
+
+
+def test_malformed_json_fails_without_reading_the_whole_file(monkeypatch):
+    monkeypatch.setattr(importer, 'JSON_READ_SIZE', 16)
+    monkeypatch.setattr(importer, 'MAX_JSON_RECORD_SIZE', 64)
+    read = []
+
+    class Stream(io.BytesIO):
+        def read1(self, size=-1):
+            chunk = super().read1(size)
+            read.append(len(chunk))
+            return chunk
+
+    data = b'[{"name": "Lions"}, {"name": "Tigers" "city": "x"}, ' + b'{"name": "Bears"}, ' * 10_000 + b']'
+    with pytest.raises(ValueError, match='Malformed JSON record'):
+        list(importer.iter_records(Stream(data), 'json'))
+    assert sum(read) < len(data) // 10
+
+
+def test_bulk_import_deletes_the_upload_even_when_it_fails(app, tmp_path):
+    tournament = Tournament(name='Cup', start_date=date.today(), max_teams=8)
+    db.session.add(tournament)
+    db.session.commit()
+    upload = tmp_path / 'teams.json'
+    upload.write_bytes(b'[{"name": "Lions"} {"name": "Tigers"}]')
+
+    with pytest.raises(ValueError):
+        tasks.bulk_import(JobContext(0), 'teams', str(upload), 'json', tournament.id)
+    assert not upload.exists()
@@ -0,0 +1,86 @@
+from datetime import date, datetime
+
+import pytest
+
+import live_state
+from extensions import db
+from models import Tournament, Team, Player, Match, MatchEvent, PlayerMatchPerformance, LiveCheckpoint
+
+
+@pytest.fixture
+def match_id(app):
+    tournament = Tournament(name='Cup', start_date=date.today(), status='active')
+    db.session.add(tournament)
+    db.session.flush()
+    home, away = Team(name='A', tournament_id=tournament.id), Team(name='B', tournament_id=tournament.id)
+    db.session.add_all([home, away])
+    db.session.flush()
+    players = [Player(name=f'P{i}', team_id=team.id, position='Forward', jersey_number=i)
+               for i, team in enumerate((home, away, home, away), start=1)]
+    db.session.add_all(players)
+    match = Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id, match_date=datetime.now())
+    db.session.add(match)
+    db.session.flush()
+    db.session.add_all([PlayerMatchPerformance(match_id=match.id, player_id=player.id, is_selected=True,
+                                               is_starter=True) for player in players])
+    db.session.commit()
+    yield match.id
+    live_state.registry.discard(match.id)
+
+
+def events(match_id):
+    return db.session.scalars(db.select(MatchEvent.event_type).where(MatchEvent.match_id == match_id)
+                              .order_by(MatchEvent.id)).all()
+
+
+@pytest.mark.parametrize('minute', ['abc', 500, -1, 12.5, True])
+def test_invalid_minutes_are_rejected_before_anything_is_written(match_id, minute):
+    live_state.record_event(match_id, 'kickoff', minute=0)
+    with pytest.raises(live_state.InvalidEvent):
+        live_state.record_event(match_id, 'goal', team='home', minute=minute)
+
+    assert events(match_id) == ['kickoff']
+    state = live_state.current(match_id)
+    assert state.score == [0, 0]
+    live_state.record_event(match_id, 'goal', team='home', minute=live_state.MAX_MINUTE)
+    assert live_state.current(match_id).score == [1, 0]
+
+
+def test_events_before_the_first_checkpoint_are_replayed_on_reload(match_id):
+    live_state.record_event(match_id, 'kickoff', minute=0)
+    live_state.record_event(match_id, 'goal', team='home', minute=10)
+    live_state.record_event(match_id, 'yellow_card', team='away', minute=20)
+    # Le worker disparaît avant son premier checkpoint périodique
+    live_state.registry.discard(match_id)
+    db.session.expire_all()
+    assert db.session.get(Match, match_id).home_score in (None, 0)
+    assert db.session.get(LiveCheckpoint, match_id) is not None
+
+    state = live_state.registry.get(match_id)
+    assert (state.status, state.score, state.minute) == ('in_progress', [1, 0], 20)
+    assert state.stats[live_state.YELLOWS + 1] == 1
+    assert sum(line.on_since is not None for line in state.players.values()) == 4
+
+
+def test_stale_worker_rejects_events_after_the_final_whistle(match_id):
+    live_state.record_event(match_id, 'kickoff', minute=0)
+    # Un autre worker siffle la fin du match
+    db.session.add(MatchEvent(match_id=match_id, minute=90, event_type='final_whistle'))
+    db.session.commit()
+
+    with pytest.raises(live_state.InvalidEvent, match='over'):
+        live_state.record_event(match_id, 'goal', team='home', minute=91)
+    assert events(match_id) == ['kickoff', 'final_whistle']
+    assert live_state.registry.peek(match_id).status == 'completed'
+
+
+def test_checkpoint_writes_the_rows_and_reloads_the_same_state(match_id):
+    live_state.record_event(match_id, 'kickoff', minute=0)
+    state = live_state.record_event(match_id, 'goal', team='away', minute=30)
+    assert state.checkpoint() is True
+    live_state.record_event(match_id, 'goal', team='home', minute=40)
+    live_state.registry.discard(match_id)
+    db.session.expire_all()
+    assert (db.session.get(Match, match_id).home_score, db.session.get(Match, match_id).away_score) == (0, 1)
+
+    assert live_state.registry.get(match_id).score == [1, 1]
@@ -0,0 +1,62 @@
+from datetime import date, datetime, timedelta
+
+import matchups
+import tasks
+from extensions import db
+from jobs import JobContext
+from models import Tournament, Team, Match, TeamRecord, HeadToHead
+
+
+def tournament_with_teams(names=('A', 'B')):
+    tournament = Tournament(name='Cup', start_date=date.today(), status='active')
+    db.session.add(tournament)
+    db.session.flush()
+    teams = [Team(name=name, tournament_id=tournament.id) for name in names]
+    db.session.add_all(teams)
+    db.session.flush()
+    return tournament, teams
+
+
+def complete(match, home_score, away_score):
+    match.home_score, match.away_score, match.status = home_score, away_score, 'completed'
+    matchups.record_result(match)
+    db.session.commit()
+
+
+def forms():
+    return {record.team_id: record.form for record in db.session.scalars(db.select(TeamRecord))}
+
+
+def test_form_follows_the_fixture_dates_not_the_completion_order(app):
+    tournament, (home, away) = tournament_with_teams()
+    kickoff = datetime(2026, 5, 1)
+    early, late = (Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id,
+                         match_date=kickoff + timedelta(days=days)) for days in (0, 7))
+    db.session.add_all([early, late])
+    db.session.commit()
+
+    # Le match reporté se termine après le suivant au calendrier
+    complete(late, 2, 0)
+    complete(early, 0, 1)
+    incremental = forms()
+    assert incremental == {home.id: 'LW', away.id: 'WL'}
+
+    matchups.rebuild_tournament(tournament.id)
+    db.session.commit()
+    assert forms() == incremental
+
+
+def test_generate_fixtures_resets_the_matchup_index(app):
+    tournament, (home, away) = tournament_with_teams()
+    match = Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id, match_date=datetime.now())
+    db.session.add(match)
+    db.session.commit()
+    complete(match, 3, 1)
+    tournament_id, team_ids = tournament.id, (home.id, away.id)
+    db.session.expunge_all()  # la tâche tourne dans un worker, avec sa propre session
+
+    tasks.generate_fixtures(JobContext(0), tournament_id)
+    assert db.session.scalars(db.select(HeadToHead)).all() == []
+    records = db.session.scalars(db.select(TeamRecord)).all()
+    assert {(record.team_id, record.home_played, record.away_played, record.form) for record in records} == \
+        {(team_id, 0, 0, '') for team_id in team_ids}
@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import outbox
+from extensions import db
+from models import OutboxMessage, WebhookSubscriber, WebhookCursor
+
+SECRET = 's3cr3t'
+
+
+@pytest.fixture
+def stub(app):
+    server = outbox.stub_server(0, secret=SECRET)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def subscribe(stub, name='club', secret=SECRET, topics=None):
+    subscriber = WebhookSubscriber(name=name, url=f'http://127.0.0.1:{stub.server_port}/', secret=secret,
+                                   topics=topics, created_at=datetime.utcnow() - timedelta(days=1))
+    db.session.add(subscriber)
+    db.session.commit()
+    return subscriber.id
+
+
+def publish(topic='match.goal', coalesce_key=None, **fields):
+    message = outbox.publish(topic, 1, 10, {'minute': 12}, coalesce_key=coalesce_key)
+    for field, value in fields.items():
+        setattr(message, field, value)
+    db.session.commit()
+    return message.id
+
+
+def dispatch():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        delivered = outbox.dispatch_once(executor)
+    db.session.expire_all()
+    return delivered
+
+
+def delivered_ids(stub):
+    return [[message['id'] for message in batch['messages']] for batch in stub.received]
+
+
+def test_messages_are_batched_per_subscriber(stub):
+    subscribe(stub, 'club')
+    subscribe(stub, 'goals', topics='match.goal')
+    ids = [publish(), publish('match.card'), publish()]
+
+    assert dispatch() == 2
+    assert sorted(delivered_ids(stub)) == sorted([[ids[0], ids[2]], ids])
+    assert {cursor.last_message_id for cursor in db.session.scalars(db.select(WebhookCursor))} == {ids[-1]}
+    assert dispatch() == 0
+
+
+def test_batches_are_cut_at_batch_size(stub, monkeypatch):
+    monkeypatch.setattr(outbox, 'BATCH_SIZE', 2)
+    subscribe(stub)
+    ids = [publish() for _ in range(3)]
+
+    assert dispatch() == 1
+    assert dispatch() == 1
+    assert delivered_ids(stub) == [ids[:2], ids[2:]]
+
+
+def test_coalesced_messages_keep_only_the_latest(stub):
+    subscribe(stub)
+    first_stats = publish('match.stats', coalesce_key='match:10:stats')
+    goal = publish()
+    publish('match.stats', coalesce_key='match:10:stats')
+    last_stats = publish('match.stats', coalesce_key='match:10:stats')
+
+    assert dispatch() == 1
+    assert delivered_ids(stub) == [[goal, last_stats]]
+    assert first_stats not in delivered_ids(stub)[0]
+
+
+def test_bad_signature_is_rejected_and_retried(stub):
+    subscriber_id = subscribe(stub, secret='wrong')
+    publish()
+
+    assert dispatch() == 0
+    cursor = db.session.get(WebhookCursor, subscriber_id)
+    assert stub.received == []
+    assert (cursor.last_message_id, cursor.attempts, cursor.last_error) == (0, 1, 'HTTP 401')
+
+
+def test_unavailable_subscriber_backs_off(stub):
+    subscriber_id = subscribe(stub)
+    message_id = publish()
+    stub.fail_rate = 1.0
+
+    assert dispatch() == 0
+    cursor = db.session.get(WebhookCursor, subscriber_id)
+    assert (cursor.last_message_id, cursor.attempts, cursor.last_error) == (0, 1, 'HTTP 503')
+    assert cursor.next_attempt_at > datetime.utcnow()
+
+    # Pas de nouvel essai avant la fin du délai
+    stub.fail_rate = 0.0
+    assert dispatch() == 0
+    assert db.session.get(WebhookCursor, subscriber_id).attempts == 1
+
+    db.session.get(WebhookCursor, subscriber_id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert dispatch() == 1
+    cursor = db.session.get(WebhookCursor, subscriber_id)
+    assert (cursor.last_message_id, cursor.attempts, cursor.next_attempt_at) == (message_id, 0, None)
+
+
+def test_cursor_stops_before_a_recent_gap(stub):
+    subscriber_id = subscribe(stub)
+    publish(id=1)
+    publish(id=3)  # l'id 2 appartient à une transaction pas encore commitée
+
+    assert dispatch() == 1
+    assert delivered_ids(stub) == [[1]]
+    assert db.session.get(WebhookCursor, subscriber_id).last_message_id == 1
+
+    publish(id=2)
+    assert dispatch() == 1
+    assert delivered_ids(stub)[1] == [2, 3]
+
+
+def test_old_gap_is_skipped(stub):
+    subscribe(stub)
+    publish(id=1)
+    publish(id=3, created_at=datetime.utcnow() - outbox.GAP_TIMEOUT - timedelta(seconds=1))
+
+    assert dispatch() == 1
+    assert delivered_ids(stub) == [[1, 3]]
+    assert db.session.get(OutboxMessage, 2) is None
@@ -0,0 +1,68 @@
+from datetime import date, datetime
+
+import pytest
+
+from extensions import db
+from models import Tournament, Team, Match, TeamStats
+from tiebreakers import TieBreaker, PRESETS, parse_rules
+
+
+def rank(results, teams=None, cards=None, rules=PRESETS['default']):
+    teams = teams or sorted({team for home, away, _, _ in results for team in (home, away)})
+    return TieBreaker(teams, results, cards=cards, rules=rules).rank()
+
+
+def test_two_way_tie_goes_to_the_head_to_head_winner():
+    # 1 et 2 : 3 points, différence 0, 1 but marqué ; 2 a battu 1
+    results = [(1, 2, 0, 1), (1, 3, 1, 0), (2, 3, 0, 1), (3, 4, 0, 2)]
+    assert rank(results) == [4, 2, 1, 3]
+
+
+def test_three_way_tie_reapplies_head_to_head_to_the_remaining_pair():
+    # Trois équipes à 3 points ; les buts en confrontation directe écartent 2, puis 3 a battu 1
+    results = [(1, 2, 1, 0), (2, 3, 1, 0), (3, 1, 2, 1)]
+    assert rank(results, rules=PRESETS['uefa']) == [3, 1, 2]
+
+
+def test_three_way_tie_level_on_every_count_goes_to_fair_play():
+    results = [(1, 2, 1, 0), (2, 3, 1, 0), (3, 1, 1, 0)]
+    assert rank(results) == [1, 2, 3]
+    assert rank(results, cards={1: (2, 0), 3: (0, 1)}) == [2, 1, 3]
+
+
+def test_uefa_separates_on_away_goals():
+    # Aller 2-1, retour 1-0 : même bilan, 2 a marqué à l'extérieur
+    results = [(1, 2, 2, 1), (2, 1, 1, 0)]
+    assert rank(results) == [1, 2]
+    assert rank(results, rules=PRESETS['uefa']) == [2, 1]
+
+
+def test_fifa_puts_head_to_head_before_goal_difference():
+    results = [(1, 2, 1, 0), (2, 3, 5, 0), (1, 3, 0, 0), (2, 4, 0, 0)]
+    assert rank(results)[:2] == [2, 1]
+    assert rank(results, rules=parse_rules('fifa'))[:2] == [1, 2]
+
+
+def test_unknown_rule_is_rejected():
+    with pytest.raises(ValueError):
+        parse_rules('points,coin_toss')
+
+
+def test_standings_figures_come_from_the_matches(app):
+    tournament = Tournament(name='Cup', start_date=date.today(), status='active')
+    db.session.add(tournament)
+    db.session.flush()
+    home, away = Team(name='A', tournament_id=tournament.id), Team(name='B', tournament_id=tournament.id)
+    db.session.add_all([home, away])
+    db.session.flush()
+    # TeamStats pas encore recalculé par recompute_tournament_stats
+    db.session.add_all([TeamStats(team_id=home.id), TeamStats(team_id=away.id, carton_jaunes=2)])
+    db.session.add(Match(tournament_id=tournament.id, home_team_id=home.id, away_team_id=away.id,
+                         match_date=datetime.now(), home_score=1, away_score=3, status='completed'))
+    db.session.commit()
+
+    first, second = tournament.get_standings()
+    assert (first.team.name, first.points, first.victoires, first.goals_marques, first.difference_des_buts) == \
+        ('B', 3, 1, 3, 2)
+    assert first.carton_jaunes == 2
+    assert (second.team.name, second.points, second.defaites, second.matches_played) == ('A', 0, 1, 1)
@@ -0,0 +1,214 @@
+"""Moteur de départage des équipes à égalité au classement.
+
+Les matchs terminés d'un tournoi sont chargés une seule fois en tuples
+compacts ; le classement général puis chaque groupe d'équipes à égalité sont
+calculés en mémoire. Les critères de confrontation directe (h2h_*) sont
+calculés sur le mini-championnat des seules équipes à égalité et, comme dans
+les règlements UEFA, réappliqués depuis le premier critère h2h au sous-groupe
+restant quand ils ne séparent qu'une partie des équipes.
+
+Les chiffres affichés au classement (points, victoires, buts...) sont ceux
+du même calcul que l'ordre, voir standings_for ; seuls les cartons du
+critère fair-play viennent de TeamStats.
+
+    flask add-tiebreak-column    # bases créées avant tournament.tiebreak_rules
+"""
+from collections import defaultdict
+
+from sqlalchemy import select, inspect, text
+
+from extensions import db
+from models import Team, Match, TeamStats, TournamentSnapshot
+from tenancy import use_tenant
+
+POINTS_WIN, POINTS_DRAW = 3, 1
+YELLOW_CARD_POINTS, RED_CARD_POINTS = 1, 3
+
+RULES = (
+    'points', 'goal_difference', 'goals_for', 'away_goals', 'wins',
+    'h2h_points', 'h2h_goal_difference', 'h2h_goals_for', 'h2h_away_goals',
+    'fair_play',
+)
+
+PRESETS = {
+    # Phases de groupes FIFA jusqu'en 2022 : différence de buts générale avant les confrontations directes
+    'default': ('points', 'goal_difference', 'goals_for', 'h2h_points', 'h2h_goal_difference',
+                'h2h_goals_for', 'fair_play'),
+    # Coupe du monde 2026 : confrontations directes d'abord, puis différence et buts de tous les matchs
+    'fifa': ('points', 'h2h_points', 'h2h_goal_difference', 'h2h_goals_for', 'goal_difference',
+             'goals_for', 'fair_play'),
+    'uefa': ('points', 'h2h_points', 'h2h_goal_difference', 'h2h_goals_for', 'h2h_away_goals',
+             'goal_difference', 'goals_for', 'away_goals', 'wins', 'fair_play'),
+}
+
+
+def parse_rules(value):
+    """Rule tuple from a preset name or a comma-separated list of rule names"""
+    if not value:
+        return PRESETS['default']
+    if value in PRESETS:
+        return PRESETS[value]
+    rules = tuple(name.strip() for name in value.split(',') if name.strip())
+    unknown = [name for name in rules if name not in RULES]
+    if unknown:
+        raise ValueError(f'Unknown tiebreak rule(s): {", ".join(unknown)}')
+    return rules
+
+
+class TieBreaker:
+    """Rank teams from (home_id, away_id, home_score, away_score) result tuples"""
+
+    def __init__(self, team_ids, results, cards=None, rules=PRESETS['default']):
+        self.team_ids = list(team_ids)
+        self.results = list(results)
+        self.rules = tuple(rules)
+        self.cards = cards or {}
+        self.by_team = defaultdict(list)
+        for index, (home, away, _, _) in enumerate(self.results):
+            self.by_team[home].append(index)
+            self.by_team[away].append(index)
+        self.table = self._mini_table(self.team_ids, range(len(self.results)))
+
+    def _mini_table(self, teams, match_indices):
+        table = {team: {'played': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'goals_for': 0,
+                        'goals_against': 0, 'away_goals': 0, 'points': 0} for team in teams}
+        for index in match_indices:
+            home, away, home_score, away_score = self.results[index]
+            if home not in table or away not in table:
+                continue
+            for team, scored, conceded in ((home, home_score, away_score), (away, away_score, home_score)):
+                row = table[team]
+                row['played'] += 1
+                row['goals_for'] += scored
+                row['goals_against'] += conceded
+                if scored > conceded:
+                    row['wins'] += 1
+                    row['points'] += POINTS_WIN
+                elif scored == conceded:
+                    row['draws'] += 1
+                    row['points'] += POINTS_DRAW
+                else:
+                    row['losses'] += 1
+            table[away]['away_goals'] += away_score
+        for row in table.values():
+            row['goal_difference'] = row['goals_for'] - row['goals_against']
+        return table
+
+    def _group_matches(self, group):
+        members = set(group)
+        indices = set()
+        for team in group:
+            for index in self.by_team[team]:
+                home, away, _, _ = self.results[index]
+                if home in members and away in members:
+                    indices.add(index)
+        return indices
+
+    def _values(self, rule, group):
+        if rule == 'fair_play':
+            # Moins de points disciplinaires = mieux classé
+            return {team: -(YELLOW_CARD_POINTS * self.cards.get(team, (0, 0))[0]
+                            + RED_CARD_POINTS * self.cards.get(team, (0, 0))[1]) for team in group}
+        if rule.startswith('h2h_'):
+            mini = self._mini_table(group, self._group_matches(group))
+            key = rule[len('h2h_'):]
+            return {team: mini[team][key] for team in group}
+        return {team: self.table[team][rule] for team in group}
+
+    def _h2h_block_start(self, index):
+        while index > 0 and self.rules[index - 1].startswith('h2h_'):
+            index -= 1
+        return index
+
+    def _resolve(self, group, index):
+        if len(group) == 1:
+            return group
+        if index >= len(self.rules):
+            # Tirage au sort remplacé par un ordre stable sur l'identifiant
+            return sorted(group)
+
+        rule = self.rules[index]
+        values = self._values(rule, group)
+        buckets = defaultdict(list)
+        for team in group:
+            buckets[values[team]].append(team)
+        if len(buckets) == 1:
+            return self._resolve(group, index + 1)
+
+        # Un sous-groupe encore à égalité après un critère h2h rejoue tout le bloc h2h entre lui seul
+        next_index = self._h2h_block_start(index) if rule.startswith('h2h_') else index + 1
+        ordered = []
+        for value in sorted(buckets, reverse=True):
+            ordered.extend(self._resolve(buckets[value], next_index))
+        return ordered
+
+    def rank(self):
+        """Team ids from first to last"""
+        return self._resolve(sorted(self.team_ids), 0)
+
+    def standings(self):
+        return [
+            dict(self.table[team], team_id=team, position=position)
+            for position, team in enumerate(self.rank(), start=1)
+        ]
+
+
+def for_tournament(tournament):
+    """Load a tournament's completed matches and cards once and build its TieBreaker"""
+    team_ids = list(db.session.scalars(select(Team.id).where(Team.tournament_id == tournament.id)))
+    with use_tenant(tournament.id):
+        results = db.session.execute(
+            select(Match.home_team_id, Match.away_team_id, Match.home_score, Match.away_score)
+            .where(Match.tournament_id == tournament.id, Match.status == 'completed')
+        ).all()
+    cards = {
+        team_id: (yellow or 0, red or 0)
+        for team_id, yellow, red in db.session.execute(
+            select(TeamStats.team_id, TeamStats.carton_jaunes, TeamStats.cartons_rouges)
+            .where(TeamStats.team_id.in_(team_ids))
+        )
+    }
+    return TieBreaker(
+        team_ids,
+        [(home, away, home_score or 0, away_score or 0) for home, away, home_score, away_score in results],
+        cards=cards,
+        rules=parse_rules(tournament.tiebreak_rules)
+    )
+
+
+def standings_for(tournament):
+    """Ordered standings rows (see TieBreaker.standings): the frozen snapshot of an archived tournament,
+    else computed from its completed matches"""
+    if tournament.status == 'archived':
+        snapshot = db.session.get(TournamentSnapshot, tournament.id)
+        if snapshot is not None:
+            return snapshot.standings
+    return for_tournament(tournament).standings()
+
+
+# Colonnes de TeamStats et chiffres correspondants d'une ligne du classement
+TEAM_STATS_FIELDS = (('matches_played', 'played'), ('victoires', 'wins'), ('nuls', 'draws'),
+                     ('defaites', 'losses'), ('goals_marques', 'goals_for'), ('buts_encaisses', 'goals_against'),
+                     ('difference_des_buts', 'goal_difference'), ('points', 'points'))
+
+
+def team_stats_figures(row):
+    """TeamStats column values of a standings row (zeros for a team without one), cards excepted"""
+    return {field: row[key] if row else 0 for field, key in TEAM_STATS_FIELDS}
+
+
+def ensure_schema():
+    """ALTER TABLE ... ADD COLUMN tiebreak_rules on databases created before it existed"""
+    with db.engine.begin() as connection:
+        if 'tiebreak_rules' in {column['name'] for column in inspect(connection).get_columns('tournament')}:
+            return False
+        connection.execute(text('ALTER TABLE tournament ADD COLUMN tiebreak_rules VARCHAR(255)'))
+    return True
+
+
+def register_cli(app):
+    @app.cli.command('add-tiebreak-column')
+    def add_tiebreak_column_command():
+        """Add tournament.tiebreak_rules (NULL means the default preset)."""
+        added = ensure_schema()
+        print(f'tiebreak_rules {"added to tournament" if added else "already present"}')
@@ -0,0 +1,495 @@
+"""Traces des requêtes : spans autour des phases d'une requête Flask.
+
+Chaque requête échantillonnée produit une trace dont la racine couvre la
+requête HTTP, avec comme enfants :
+
+- le chargement de l'utilisateur (``load_user``) et les contrôles des
+  décorateurs ``*_required`` (``traced``) ;
+- chaque requête SQL (événements curseur de SQLAlchemy, tous les moteurs,
+  tenants compris), avec l'instruction sans ses paramètres ;
+- le rendu de chaque template (signaux Flask), les chargements paresseux
+  déclenchés pendant le rendu apparaissant sous le template ;
+- chaque commit de session, flush compris.
+
+Le code applicatif peut ajouter ses propres spans : ``with tracing.span('x'):``.
+
+Échantillonnage : TRACE_SAMPLE_RATE (0 à 1, 0 par défaut) tire les requêtes
+au sort ; un en-tête W3C ``traceparent`` marqué échantillonné force la trace
+et en reprend l'identifiant. Avec TRACE_SLOW_MS, toutes les requêtes sont
+enregistrées en mémoire et celles qui dépassent le seuil sont exportées même
+si le tirage les avait écartées. Les réponses tracées portent ``X-Trace-Id``.
+
+Export (thread de fond, file bornée : les traces sont perdues plutôt que de
+ralentir les requêtes), au format JSON OTLP ; sans TRACE_EXPORTER, rien
+n'est installé :
+
+    TRACE_EXPORTER=file  TRACE_FILE=traces.jsonl          une requête OTLP par ligne
+    TRACE_EXPORTER=otlp  TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+
+    python tracing.py collect --port 4318 --out traces.jsonl   # collecteur de remplacement
+    python tracing.py top traces.jsonl                         # traces les plus lentes, par phase
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import secrets
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '0'))
+SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'football-tournament')
+MAX_SPANS = 1000            # au-delà (boucle N+1...), les spans sont comptés mais pas gardés
+MAX_STATEMENT = 2000
+EXPORT_BATCH = 50
+EXPORT_INTERVAL = 1.0
+
+# Types de span OTLP
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_trace = ContextVar('trace', default=None)
+_span = ContextVar('span', default=None)
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start', 'end', 'attributes', 'error', 'token')
+
+    def __init__(self, trace, name, kind, parent, attributes):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else trace.parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+        self.token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, error=None):
+        if self.end is None:
+            self.end = time.time_ns()
+            if error is not None:
+                self.error = f'{type(error).__name__}: {error}'
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or time.time_ns()),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 0},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Trace:
+    __slots__ = ('trace_id', 'parent_id', 'sampled', 'spans', 'dropped')
+
+    def __init__(self, trace_id=None, parent_id=None, sampled=False):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+
+    def start(self, name, kind=INTERNAL, attributes=None, parent=None):
+        span = Span(self, name, kind, parent, attributes or {})
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        return span
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def otlp_request(traces):
+    """ExportTraceServiceRequest (OTLP/JSON) for finished traces"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', SERVICE_NAME)]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': [span.to_otlp() for trace in traces for span in trace.spans],
+        }],
+    }]}
+
+
+# API des spans
+
+def current_trace():
+    return _trace.get()
+
+
+def start_span(name, kind=INTERNAL, push=False, **attributes):
+    """Open a span under the current one; None outside a recorded trace. Pair with end_span()."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    span = trace.start(name, kind, attributes, parent=_span.get())
+    if push:
+        span.token = _span.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    if span is None:
+        return
+    span.finish(error)
+    if span.token is not None:
+        try:
+            _span.reset(span.token)
+        except ValueError:
+            # Fermé dans un autre contexte que celui qui l'a ouvert
+            pass
+        span.token = None
+
+
+@contextmanager
+def span(name, **attributes):
+    opened = start_span(name, push=True, **attributes)
+    try:
+        yield opened
+    except BaseException as error:
+        end_span(opened, error)
+        raise
+    end_span(opened)
+
+
+def traced(name=None):
+    """Decorator wrapping each call in a span"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Export
+
+class Exporter:
+    """Background thread writing finished traces to a JSON-lines file or an OTLP/HTTP collector"""
+
+    def __init__(self, kind, target):
+        self.kind = kind
+        self.target = target
+        self.queue = queue.Queue(maxsize=1000)
+        self.dropped = 0
+        self.exported = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning(f'Trace export to {self.target} failed: {e}')
+
+    def export(self, traces):
+        body = json.dumps(otlp_request(traces), separators=(',', ':'))
+        if self.kind == 'file':
+            with open(self.target, 'a', encoding='utf-8') as handle:
+                handle.write(body + '\n')
+        else:
+            request = urllib.request.Request(self.target, data=body.encode('utf-8'), method='POST',
+                                             headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+
+exporter = None
+
+
+def _parse_traceparent(header):
+    # version-traceid-parentid-flags
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[1] == '0' * 32:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+# Intégration Flask / SQLAlchemy
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    opened = start_span('db.query', kind=CLIENT, **{
+        'db.system': conn.dialect.name,
+        'db.statement': statement[:MAX_STATEMENT],
+        'db.executemany': executemany,
+    })
+    if opened is not None and context is not None:
+        context._trace_span = opened
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    opened = getattr(context, '_trace_span', None)
+    if opened is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            opened.set('db.rowcount', cursor.rowcount)
+        opened.finish()
+
+
+def _handle_error(exception_context):
+    opened = getattr(exception_context.execution_context, '_trace_span', None)
+    if opened is not None:
+        opened.finish(exception_context.original_exception)
+
+
+def _before_render(sender, template, context, **extra):
+    from flask import g
+    opened = start_span(f'render {template.name}', push=True, template=template.name)
+    if opened is not None:
+        g.setdefault('_trace_templates', []).append(opened)
+
+
+def _rendered(sender, template, context, **extra):
+    from flask import g
+    spans = g.get('_trace_templates')
+    if spans:
+        end_span(spans.pop())
+
+
+def _before_commit(session):
+    session.info['trace_commit'] = start_span('db.commit', push=True)
+
+
+def _after_commit(session):
+    end_span(session.info.pop('trace_commit', None))
+
+
+def _after_rollback(session):
+    opened = session.info.pop('trace_commit', None)
+    if opened is not None:
+        opened.error = 'rolled back'
+        end_span(opened)
+
+
+def init_app(app):
+    """Install the request hooks, SQLAlchemy listeners, template signals and the exporter"""
+    global exporter
+    from flask import g, request, template_rendered, before_render_template
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from tenancy import TenantSession
+
+    kind = os.environ.get('TRACE_EXPORTER', 'none').lower()
+    if kind not in ('file', 'otlp', 'none'):
+        raise ValueError('TRACE_EXPORTER must be one of file, otlp, none')
+    if kind == 'none':
+        return
+    if kind == 'file':
+        exporter = Exporter('file', os.environ.get('TRACE_FILE') or os.path.join(app.instance_path, 'traces.jsonl'))
+    else:
+        exporter = Exporter('otlp', os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'))
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    event.listen(TenantSession, 'before_commit', _before_commit)
+    event.listen(TenantSession, 'after_commit', _after_commit)
+    event.listen(TenantSession, 'after_rollback', _after_rollback)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def _start_trace():
+        parent = _parse_traceparent(request.headers.get('traceparent'))
+        sampled = parent[2] if parent else random.random() < SAMPLE_RATE
+        if not sampled and SLOW_MS <= 0:
+            return
+        trace = Trace(*(parent[:2] if parent else ()), sampled=sampled)
+        route = request.url_rule.rule if request.url_rule else request.path
+        root = trace.start(f'{request.method} {route}', SERVER, {
+            'http.method': request.method,
+            'http.route': route,
+            'http.target': request.full_path.rstrip('?'),
+            'http.client_ip': request.remote_addr,
+        })
+        g._trace_tokens = (_trace.set(trace), _span.set(root))
+        g._trace_root = root
+
+    @app.after_request
+    def _tag_response(response):
+        root = g.get('_trace_root')
+        if root is not None:
+            root.set('http.status_code', response.status_code)
+            root.set('flask.endpoint', request.endpoint)
+            response.headers['X-Trace-Id'] = root.trace.trace_id
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc=None):
+        root = g.pop('_trace_root', None)
+        tokens = g.pop('_trace_tokens', None)
+        if root is None:
+            return
+        root.finish(exc)
+        trace = root.trace
+        if trace.dropped:
+            root.set('trace.dropped_spans', trace.dropped)
+        _span.reset(tokens[1])
+        _trace.reset(tokens[0])
+        if trace.sampled or (SLOW_MS > 0 and root.duration_ms >= SLOW_MS):
+            exporter.submit(trace)
+
+
+# Outils en ligne de commande
+
+def collect(port, out):
+    """Minimal OTLP/HTTP JSON collector appending each export request to a file"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/v1/traces' or 'json' not in self.headers.get('Content-Type', ''):
+                self.send_error(415 if self.path == '/v1/traces' else 404)
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            try:
+                line = json.dumps(json.loads(body), separators=(',', ':'))
+            except ValueError:
+                self.send_error(400)
+                return
+            with lock, open(out, 'a', encoding='utf-8') as handle:
+                handle.write(line + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f'Collecting OTLP/JSON traces on :{port}/v1/traces into {out}')
+    ThreadingHTTPServer(('', port), Handler).serve_forever()
+
+
+def _phase(span):
+    name = span['name']
+    if name.startswith('render '):
+        return 'template'
+    if name in ('db.query', 'db.commit'):
+        return name
+    if name.startswith('auth.'):
+        return 'auth'
+    return 'other'
+
+
+def top(path, limit=10):
+    """Slowest traces of an export file, with time spent per phase (self time, children excluded)"""
+    traces = {}
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            for resource in json.loads(line).get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    for span in scope.get('spans', []):
+                        traces.setdefault(span['traceId'], []).append(span)
+
+    summaries = []
+    for trace_id, spans in traces.items():
+        ids = {span['spanId'] for span in spans}
+        roots = [span for span in spans if span.get('parentSpanId') not in ids]
+        if not roots:
+            continue
+        root = max(roots, key=lambda span: int(span['endTimeUnixNano']) - int(span['startTimeUnixNano']))
+        duration = {span['spanId']: (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+                    for span in spans}
+        own = dict(duration)
+        for span in spans:
+            if span.get('parentSpanId') in own:
+                own[span['parentSpanId']] -= duration[span['spanId']]
+        phases = {}
+        for span in spans:
+            phase = 'request' if span is root else _phase(span)
+            phases[phase] = phases.get(phase, 0.0) + max(own[span['spanId']], 0.0)
+        queries = sum(1 for span in spans if span['name'] == 'db.query')
+        summaries.append((duration[root['spanId']], trace_id, root['name'], queries, phases))
+
+    summaries.sort(reverse=True)
+    for total, trace_id, name, queries, phases in summaries[:limit]:
+        breakdown = ', '.join(f'{phase} {ms:.1f}' for phase, ms in sorted(phases.items(), key=lambda item: -item[1]))
+        print(f'{total:9.1f} ms  {name:<45} {queries:4} queries  {trace_id}\n{"":14}{breakdown}')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    collect_parser = subparsers.add_parser('collect', help='Run a stand-in OTLP/HTTP collector')
+    collect_parser.add_argument('--port', type=int, default=4318)
+    collect_parser.add_argument('--out', default='traces.jsonl')
+    top_parser = subparsers.add_parser('top', help='Show the slowest exported traces')
+    top_parser.add_argument('path')
+    top_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    if args.command == 'collect':
+        collect(args.port, args.out)
+    else:
+        top(args.path, args.limit)
+
+
+if __name__ == '__main__':
+    main()